@@ -0,0 +1,200 @@
+"""
+Offline benchmark for the image manipulation operations.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Run from the repository root:
+    python -m benchmarks.render --output before.json
+    python -m benchmarks.render --output after.json
+    python -m benchmarks.render --compare before.json after.json
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import resource
+import sys
+import time
+import typing
+from io import BytesIO
+from PIL import Image as PILImage
+
+from cogs.imagemanipulation import Manipulation
+from utils.imaging import render_encoded
+
+
+SIZES = {
+    "256": (256, 256),
+    "512": (512, 512),
+    "1024": (1024, 1024),
+    "cap": (1095, 1095),  # Just under the 1.2MP limit.
+}
+
+OPERATIONS: typing.Dict[str, typing.Tuple[typing.Callable, typing.Callable]] = {
+    "swirl": (Manipulation.swirl, lambda image: (image, 90)),
+    "magik": (Manipulation.magik, lambda image: (image,)),
+    "floor": (Manipulation.floor, lambda image: (image,)),
+    "chroma": (Manipulation.chroma, lambda image: (image,)),
+    "rainbowify": (Manipulation.rainbowify, lambda image: (image,)),
+    "solarize": (Manipulation.solarize_image, lambda image: (image,)),
+    "brighten": (Manipulation.brighten_image, lambda image: (image, 50)),
+    "facetime": (Manipulation.facetime, lambda image: (image, image)),
+    "alwayshasbeen": (Manipulation.alwayshasbeen, lambda image: ("it's always been benchmarks",)),
+}
+
+METRICS = ("p50_ms", "p95_ms", "peak_rss_mb", "output_bytes")
+
+
+def synthetic_image(size: typing.Tuple[int, int]) -> bytes:
+    """A gradient with noise over it, so it compresses roughly like a photo would."""
+
+    gradient = PILImage.linear_gradient("L").resize(size)
+    noise = PILImage.effect_noise(size, 48)
+    image = PILImage.merge("RGB", (gradient, noise, gradient.rotate(90)))
+
+    buffer = BytesIO()
+    image.save(buffer, "png")
+    return buffer.getvalue()
+
+
+def percentile(values: typing.List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = max(math.ceil(percent / 100 * len(ordered)) - 1, 0)
+    return ordered[index]
+
+
+def _run_case(conn, name: str, size: str, iterations: int, target_bytes: typing.Optional[int]):
+    # Runs in its own process so peak RSS belongs to this case alone.
+    method, make_args = OPERATIONS[name]
+    args = make_args(synthetic_image(SIZES[size]))
+
+    if target_bytes is not None:
+        method, args = render_encoded, (method, target_bytes, *args)
+
+    random.seed(0)
+    method(*args)  # Warm up, this also loads any templates.
+
+    timings = []
+    output_sizes = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        output = method(*args)
+        timings.append(time.perf_counter() - start)
+        output_sizes.append(len(output))
+
+    conn.send({
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "output_bytes": int(percentile(output_sizes, 50)),
+    })
+    conn.close()
+
+
+def run(operations: typing.List[str], sizes: typing.List[str], iterations: int,
+        target_bytes: typing.Optional[int]) -> typing.Dict[str, dict]:
+    context = multiprocessing.get_context("fork")
+    results = {}
+
+    for name in operations:
+        for size in sizes:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_run_case, args=(sender, name, size, iterations, target_bytes))
+            process.start()
+            sender.close()
+
+            try:
+                result = receiver.recv()
+            except EOFError:
+                result = {"error": f"exited with code {process.exitcode}"}
+
+            process.join()
+            results[f"{name}/{size}"] = result
+            print(format_row(f"{name}/{size}", result))
+
+    return results
+
+
+def format_row(case: str, result: dict) -> str:
+    if "error" in result:
+        return f"{case:<22} {result['error']}"
+
+    return (f"{case:<22} p50 {result['p50_ms']:>9,.1f} ms   p95 {result['p95_ms']:>9,.1f} ms   "
+            f"rss {result['peak_rss_mb']:>7,.1f} MB   out {result['output_bytes'] / 1024:>8,.1f} KB")
+
+
+def compare(before: typing.Dict[str, dict], after: typing.Dict[str, dict], threshold: float) -> int:
+    """Prints the change in every metric between two runs and returns how many regressed past threshold."""
+
+    regressions = 0
+
+    for case in sorted(before.keys() & after.keys()):
+        old, new = before[case], after[case]
+        if "error" in old or "error" in new:
+            continue
+
+        changes = []
+        for metric in METRICS:
+            change = (new[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+            flag = ""
+            if change > threshold:
+                flag = " REGRESSION"
+                regressions += 1
+            changes.append(f"{metric} {change:+.1%}{flag}")
+
+        print(f"{case:<22} " + "   ".join(changes))
+
+    for case in sorted(before.keys() ^ after.keys()):
+        print(f"{case:<22} only in {'before' if case in before else 'after'}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the image manipulation operations.")
+    parser.add_argument("--operations", nargs="+", choices=OPERATIONS.keys(), default=list(OPERATIONS))
+    parser.add_argument("--sizes", nargs="+", choices=SIZES.keys(), default=list(SIZES))
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--target-kb", type=int, default=None,
+                        help="Also run the output encoder with this byte target, like the render engine does.")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two result files instead of running.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative increase that counts as a regression when comparing.")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+
+        regressions = compare(before, after, args.threshold)
+        print(f"\n{regressions} regression(s) over {args.threshold:.0%}.")
+        sys.exit(1 if regressions else 0)
+
+    target_bytes = args.target_kb * 1024 if args.target_kb else None
+    results = run(args.operations, args.sizes, args.iterations, target_bytes)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
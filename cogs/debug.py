@@ -1,7 +1,10 @@
+import io
 import os
+import discord
 import psutil
 import utils
 import platform
+import textwrap
 from discord.ext import commands
 
 
@@ -32,14 +35,191 @@ class DebugCog(commands.Cog):
 
         can_see_fmt = (
             "The bot can currently see: "
-            f"{sum(g.member_count for g in self.bot.guilds):,} Members in {len(self.bot.guilds)} Guilds."
+            f"{self.bot.member_total:,} Members in {self.bot.guild_total:,} Guilds."
         )
         description.append(can_see_fmt)
 
+        messages_fmt = (
+            f"Messages seen: {self.bot.messages_seen:,} | "
+            f"Contexts created: {self.bot.contexts_created:,} | "
+            f"Commands ran: {self.bot.cmd_usage:,}"
+        )
+        description.append(messages_fmt)
+
+        config = self.bot.config
+        config_fmt = (
+            f"Guild configs: {len(config):,} | Changes: {config.writes:,} | "
+            f"Flushes: {config.flushes:,} ({config.rows_written:,} rows, {config.failed_flushes:,} failed) | "
+            f"Pending: {config.pending:,}"
+        )
+        description.append(config_fmt)
+
+        with ctx.embed() as embed:
+            embed.description = "\n".join(description)
+            await ctx.send(embed=embed)
+
+    @debug.command(name="render")
+    async def debug_render(self, ctx: utils.CustomContext):
+        """Gives some stats on the render engine, its cache and the asset fetcher."""
+
+        render = self.bot.render
+        cache = render.cache
+        lookups = cache.memory_hits + cache.disk_hits + cache.misses
+        hit_rate = (cache.memory_hits + cache.disk_hits) / lookups if lookups else 0
+
+        description = [
+            f"Jobs pending: {render.pending}/{render.workers + render.max_queue}",
+            f"Jobs completed: {render.completed:,} | Rejected: {render.rejected:,} | Timed out: {render.timeouts:,}",
+            f"Pool recycles: {render.recycles:,}\n",
+            f"Cache hits: {cache.memory_hits:,} memory, {cache.disk_hits:,} disk | Misses: {cache.misses:,}",
+            f"Cache hit rate: {hit_rate:.1%}",
+            f"Cache memory tier: {len(cache):,} entries, {cache.memory_used / 1024 ** 2:,.2f}/{cache.memory_size / 1024 ** 2:,.2f} MB",
+        ]
+
+        if cache.directory is not None:
+            description.append(
+                f"Cache disk tier: {cache.disk_used / 1024 ** 2:,.2f}/{cache.disk_size / 1024 ** 2:,.2f} MB")
+
+        fetcher = self.bot.fetcher
+        description.append(
+            f"\nFetches: {fetcher.hits:,} cached, {fetcher.coalesced:,} coalesced, "
+            f"{fetcher.misses:,} downloaded, {fetcher.aborted:,} aborted for size")
+        description.append(
+            f"Fetch cache: {len(fetcher):,} entries, {fetcher.cache_used / 1024 ** 2:,.2f}/{fetcher.cache_size / 1024 ** 2:,.2f} MB")
+
+        dagpi = self.bot.dagpi
+        description.append(
+            f"\nDagpi cache: {dagpi.hits:,} hits, {dagpi.misses:,} misses, "
+            f"{len(dagpi):,} entries, {dagpi.cache_used / 1024 ** 2:,.2f}/{dagpi.cache_size / 1024 ** 2:,.2f} MB")
+
+        with ctx.embed() as embed:
+            embed.description = "\n".join(description)
+            await ctx.send(embed=embed)
+
+    @debug.command(name="effects")
+    async def debug_effects(self, ctx: utils.CustomContext):
+        """Shows which backend each image effect is using and how fast they are."""
+
+        router = self.bot.effects
+        description = []
+
+        for effect in router.effects:
+            backends = []
+            for backend in router.BACKENDS:
+                latency = router.latency(effect, backend)
+                latency = f"{latency * 1000:,.0f}ms" if latency is not None else "n/a"
+                backends.append(
+                    f"{backend} {latency} ({router.served[(effect, backend)]:,} served, "
+                    f"{router.failures[(effect, backend)]:,} failed)")
+
+            description.append(f"**{effect}** [{router.mode(effect)}] " + " | ".join(backends))
+
+        with ctx.embed() as embed:
+            embed.description = "\n".join(description) or "No effects have been used yet."
+            await ctx.send(embed=embed)
+
+    @debug.command(name="timers")
+    async def debug_timers(self, ctx: utils.CustomContext):
+        """Shows how many mutes, giveaways and temp bans the timer scheduler has loaded and ran."""
+
+        timers = self.bot.timers
+        description = [f"Loaded: {len(timers):,} timer(s) due within {timers.horizon / 60:,.0f} minutes"]
+
+        for kind in timers.kinds:
+            description.append(
+                f"**{kind}** loaded {timers.loaded[kind]:,} | fired {timers.fired[kind]:,} | "
+                f"failed {timers.failed[kind]:,}")
+
         with ctx.embed() as embed:
             embed.description = "\n".join(description)
             await ctx.send(embed=embed)
 
+    @debug.command(name="queries")
+    async def debug_queries(self, ctx: utils.CustomContext):
+        """Shows the registered queries that have taken the most time in total."""
+
+        used = sorted((query for query in self.bot.queries if query.calls),
+                      key=lambda query: query.total_time, reverse=True)
+        description = [f"Registered: {len(self.bot.queries):,} | Used: {len(used):,}"]
+
+        for query in used[:15]:
+            description.append(
+                f"**{query.name}** {query.calls:,} call(s) | avg {query.mean_time * 1000:,.2f}ms | "
+                f"max {query.max_time * 1000:,.2f}ms | {query.errors:,} error(s)")
+
+        with ctx.embed() as embed:
+            embed.description = "\n".join(description)
+            await ctx.send(embed=embed)
+
+    @debug.command(name="db")
+    async def debug_db(self, ctx: utils.CustomContext):
+        """Shows where database time is going, how busy the pool is and the latest slow queries."""
+
+        pool = self.bot.pool
+        names = {query.sql: query.name for query in self.bot.queries}
+        wait = pool.acquire_wait
+
+        description = [
+            f"Connections: {pool.in_use}/{pool.max_size} in use ({pool.saturation:.0%}) | "
+            f"peak {pool.peak_in_use} | {pool.waiting} waiting | pool exhausted {pool.exhausted:,} time(s)",
+            f"Acquire wait: p50 {wait.quantile(0.5) * 1000:,.2f}ms | p95 {wait.quantile(0.95) * 1000:,.2f}ms | "
+            f"max {wait.max * 1000:,.2f}ms",
+            "",
+        ]
+
+        for query, stats in pool.top(10):
+            latency = stats.latency
+            name = names.get(query) or textwrap.shorten(query, width=60, placeholder="...")
+            description.append(
+                f"`{name}` {latency.count:,} call(s) | p50 {latency.quantile(0.5) * 1000:,.2f}ms | "
+                f"p99 {latency.quantile(0.99) * 1000:,.2f}ms | {stats.rows:,} row(s) | {stats.errors:,} error(s)")
+
+        if pool.slow_queries:
+            description.append("\n**Slow queries**")
+            for slow in list(pool.slow_queries)[-5:]:
+                name = names.get(slow.query) or textwrap.shorten(slow.query, width=60, placeholder="...")
+                description.append(f"`{name}` {slow.duration * 1000:,.0f}ms from {slow.command or 'no command'}")
+
+        with ctx.embed() as embed:
+            embed.description = "\n".join(description)
+            await ctx.send(embed=embed)
+
+    @debug.command(name="commands", aliases=["cmds"])
+    async def debug_commands(self, ctx: utils.CustomContext):
+        """Shows the commands that have taken the most time, and which part of them took it."""
+
+        stats = self.bot.command_stats
+        description = [f"Commands used since restart: {len(stats):,}"]
+
+        for name, command in stats.top(10):
+            latency = command.latency
+            phases = " / ".join(f"{phase.mean * 1000:,.1f}" for phase in command.phases.values())
+            description.append(
+                f"**{name}** {command.invocations:,} ran, {command.error_rate:.0%} errored | "
+                f"p50 {latency.quantile(0.5) * 1000:,.0f}ms | p95 {latency.quantile(0.95) * 1000:,.0f}ms\n"
+                f"avg checks / converters / body / send: {phases} ms")
+
+        with ctx.embed() as embed:
+            embed.description = "\n".join(description)
+            await ctx.send(embed=embed)
+
+    @debug.command(name="profile")
+    async def debug_profile(self, ctx: utils.CustomContext, seconds: float = 10.0):
+        """Samples what the bot is doing for the given amount of seconds and uploads the stacks.
+        The file can be given to flamegraph.pl or opened in speedscope."""
+
+        profiler = self.bot.profiler
+        if profiler.running:
+            return await ctx.send("The profiler is already running.")
+
+        seconds = min(seconds, profiler.max_seconds)
+        await ctx.send(f"Profiling for {seconds:,.0f} seconds...")
+
+        stacks = await profiler.profile(seconds)
+        dump = io.BytesIO(profiler.collapse(stacks).encode())
+        await ctx.send(f"Took {sum(stacks.values()):,} samples of {len(stacks):,} different stacks.",
+                       file=discord.File(dump, filename="profile.folded.txt"), new_message=True)
+
     @debug.command(name="timeit")
     async def debug_timeit(self, ctx: utils.CustomContext, *command: str):
         """Times how long it takes to run a command."""
@@ -91,11 +91,19 @@ class Developer(Cog, command_attrs=dict(hidden=True)):
         @bot.ipc.route()
         async def get_stats(data):
             return [
-                f"{len(bot.guilds):,}",
-                f"{sum(g.member_count for g in bot.guilds):,}",
-                f"{sum(1 for c in bot.walk_commands()):,}"
+                f"{bot.guild_total:,}",
+                f"{bot.member_total:,}",
+                f"{bot.command_total:,}"
             ]
 
+        @bot.ipc.route()
+        async def get_metrics(data):
+            return bot.metrics.render()
+
+        @bot.ipc.route()
+        async def get_db_stats(data):
+            return bot.pool.snapshot()
+
         @bot.ipc.route()
         async def get_bot_id(data):
             user = await bot.fetch_user(data.bot_id)
@@ -138,7 +146,14 @@ class Developer(Cog, command_attrs=dict(hidden=True)):
     async def dev_chunked(self, ctx: utils.CustomContext):
         """Gives a list of all currently chunked guilds."""
 
-        await ctx.send(**{"embed": self.bot.embed(ctx, description=f"There are currently {sum(g.chunked for g in self.bot.guilds)} guilds chunked.")})
+        chunker = self.bot.chunker
+        description = [
+            f"There are currently {chunker.chunked_guilds} guilds chunked with {chunker.resident_members:,} members cached.",
+            f"Queued: {chunker.queued} | Chunked: {chunker.chunked} | Failed: {chunker.failed}",
+            f"Evicted: {chunker.evicted} guilds ({chunker.evicted_members:,} members)",
+        ]
+
+        await ctx.send(**{"embed": self.bot.embed(ctx, description="\n".join(description))})
 
     @dev.command(name="blacklist")
     async def dev_blacklist(self, ctx: utils.CustomContext, user: discord.Member, *, reason: str = "None"):
@@ -147,8 +162,7 @@ class Developer(Cog, command_attrs=dict(hidden=True)):
         if user.id in self.bot.blacklist.keys():
             return await ctx.send("That user is already blacklisted.")
 
-        await self.bot.pool.execute("INSERT INTO blacklist VALUES($1, $2)",
-                                    user.id, reason)
+        await self.bot.queries.execute("blacklist_add", user.id, reason)
         self.bot.blacklist[user.id] = reason
 
         await ctx.send(
@@ -219,9 +233,9 @@ class Developer(Cog, command_attrs=dict(hidden=True)):
             f"Coroutines: {cr}\n"
             f"Comments: {cm}\n"
         )
-        server_count = sum(1 for g in self.bot.guilds)
-        user_count = sum(g.member_count for g in self.bot.guilds)
-        command_count = sum(1 for cmd in self.bot.walk_commands())
+        server_count = self.bot.guild_total
+        user_count = self.bot.member_total
+        command_count = self.bot.command_total
         ping = round(self.bot.latency * 1000)
         uptime = utils.format_time(self.bot.start_time)
 
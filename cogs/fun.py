@@ -16,6 +16,8 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import bisect
+import collections
 import contextlib
 import datetime
 import logging
@@ -27,7 +29,7 @@ import discord
 import typing
 import random
 import vacefron
-from discord.ext import commands, menus
+from discord.ext import commands, menus, tasks
 
 standard_cooldown = 3.0
 
@@ -119,6 +121,60 @@ class RockPaperScissors(menus.Menu):
         return await self._handle_winner(winner)
 
 
+class CookieLeaderboard:
+    """Every cookie clickers score, kept in rank order. Scores only change
+    through `add`, so the ranking is updated in place instead of re-sorted and
+    the top of it or anyone's rank is a slice or a bisect away."""
+
+    def __init__(self):
+        self._scores: typing.Dict[int, int] = {}
+        self._ranking: typing.List[typing.Tuple[int, int]] = []  # (-cookies, user_id)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def load(self, records: typing.Iterable):
+        """Fills the board from cookies rows. They're sorted here rather than trusted
+        to come in order, since everything else relies on the ranking being sorted."""
+
+        self._scores = {record["user_id"]: record["cookies"] or 0 for record in records}
+        self._ranking = sorted((-cookies, user_id) for user_id, cookies in self._scores.items())
+
+    def add(self, user_id: int, amount: int = 1):
+        old = self._scores.get(user_id)
+        if old is not None:
+            del self._ranking[bisect.bisect_left(self._ranking, (-old, user_id))]
+
+        new = self._scores[user_id] = (old or 0) + amount
+        bisect.insort(self._ranking, (-new, user_id))
+
+    def top(self, amount: int) -> typing.List[typing.Tuple[int, int]]:
+        return [(user_id, -cookies) for cookies, user_id in self._ranking[:amount]]
+
+    def rank(self, user_id: int) -> typing.Optional[typing.Tuple[int, int]]:
+        """The users place on the board and their cookies, None if they have none."""
+
+        cookies = self._scores.get(user_id)
+        if cookies is None:
+            return None
+
+        return bisect.bisect_left(self._ranking, (-cookies, user_id)) + 1, cookies
+
+
+class CookieLeaderboardSource(utils.GeneralPageSource):
+    def __init__(self, data: list, rank: typing.Optional[typing.Tuple[int, int]], *, per_page: int):
+        super().__init__(data, per_page=per_page)
+        self.rank = rank
+
+    async def format_page(self, menu: menus.Menu, page: list):
+        embed = await super().format_page(menu, page)
+
+        if self.rank is not None:
+            embed.set_footer(text=f"You're #{self.rank[0]:,} with {self.rank[1]:,} cookies")
+
+        return embed
+
+
 class Fun(commands.Cog, name="fun"):
     """Fun Commands"""
 
@@ -167,17 +223,61 @@ class Fun(commands.Cog, name="fun"):
             "red",
         ]
 
+        self.leaderboard = CookieLeaderboard()
+        self.leaderboard_loaded = False
+        self.pending_cookies: typing.Counter[int] = collections.Counter()
+        self._cookies_lock = asyncio.Lock()
+        self.flush_cookies.start()
+
+    def cog_unload(self):
+        # Stopped rather than cancelled so a flush that's already running isn't cut short,
+        # whatever came in since is written by the last flush below. On shutdown close
+        # has already flushed, so there's nothing left for it.
+        self.flush_cookies.stop()
+        self.bot.loop.create_task(self.flush_cookies.coro(self))
+
+    async def close(self):
+        """Writes the cookies that haven't been flushed yet, called by the bot before the pool closes."""
+
+        self.flush_cookies.stop()
+        await self.flush_cookies.coro(self)
+
+    @tasks.loop(seconds=30)
+    async def flush_cookies(self):
+        """Writes the cookies won since the last flush in one batch."""
+
+        # Taken even with nothing pending, so close waits for a flush that's already writing.
+        async with self._cookies_lock:
+            if not self.pending_cookies:
+                return
+
+            pending, self.pending_cookies = self.pending_cookies, collections.Counter()
+            try:
+                await self.bot.queries.executemany("cookie_add", pending.items())
+            except Exception as e:
+                self.pending_cookies.update(pending)
+                self.logger.error(f"Failed to flush cookies: {type(e).__name__} - {e}")
+
+    async def get_leaderboard(self) -> CookieLeaderboard:
+        """The leaderboard, read from the database the first time it's needed."""
+
+        if not self.leaderboard_loaded:
+            async with self._cookies_lock:
+                if not self.leaderboard_loaded:
+                    records = await self.bot.queries.fetch("cookie_scores")
+                    self.leaderboard.load(records)
+                    for user_id, amount in self.pending_cookies.items():
+                        self.leaderboard.add(user_id, amount)
+                    self.leaderboard_loaded = True
+
+        return self.leaderboard
+
     async def handle_cookies(self, user: discord.Member):
         """Handles added cookies to user"""
 
-        sql = (
-            "INSERT INTO cookies VALUES($1, $2) "
-            "ON CONFLICT (user_id) "
-            "DO UPDATE SET cookies = cookies.cookies + 1 "
-            "WHERE cookies.user_id = $1;"
-        )
-        values = (user.id, 1)
-        await self.bot.pool.execute(sql, *values)
+        self.pending_cookies[user.id] += 1
+        if self.leaderboard_loaded:
+            self.leaderboard.add(user.id)
 
     @commands.group(name="bottom", invoke_without_command=True)
     async def bottom_group(self, ctx: utils.CustomContext):
@@ -382,15 +482,15 @@ class Fun(commands.Cog, name="fun"):
     async def cookieclick_leaderboard(self, ctx: utils.CustomContext):
         """Gives the leaderboard of all cookie clickers."""
 
-        fields = await self.bot.pool.fetch("SELECT * FROM cookies order by cookies DESC LIMIT 100")
+        leaderboard = await self.get_leaderboard()
 
         desc = []
 
-        for field in fields:
-            user = self.bot.get_user(field["user_id"])
-            desc.append(f"{user} - {field['cookies']} cookies")
+        for user_id, cookies in leaderboard.top(100):
+            user = self.bot.get_user(user_id)
+            desc.append(f"{user} - {cookies} cookies")
 
-        source = utils.GeneralPageSource(desc, per_page=10)
+        source = CookieLeaderboardSource(desc, leaderboard.rank(ctx.author.id), per_page=10)
         pages = menus.MenuPages(source=source, clear_reactions_after=True)
         await pages.start(ctx)
 
@@ -17,7 +17,6 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 
-import functools
 import logging
 import random
 import re
@@ -25,24 +24,22 @@ import textwrap
 import typing
 import asyncdagpi
 import discord
+import numpy as np
 import twemoji_parser
 import utils
 from io import BytesIO
 from asyncdagpi import ImageFeatures
 from discord.ext import commands
 from polaroid.polaroid import Image
-from PIL import Image as PILImage, ImageDraw, ImageFont
+from PIL import Image as PILImage, ImageDraw, ImageEnhance, ImageOps
 from wand.color import Color
 from wand.image import Image as WandImage
 
 
-async def do_dagpi_stuff(ctx: utils.CustomContext, user: discord.Member, feature: asyncdagpi.ImageFeatures) -> discord.File:
-    dagpi = asyncdagpi.Client(ctx.bot.settings["keys"]["dagpi"])
+async def do_dagpi_stuff(ctx: utils.CustomContext, user: discord.Member, feature: asyncdagpi.ImageFeatures) -> bytes:
     url = str(user.avatar_url_as(static_format="png"))
-    img = await dagpi.image_process(feature, url)
-    img_file = discord.File(fp=img.image, filename=f"image.{img.format}")
-    await dagpi.close()
-    return img_file
+    image, _ = await ctx.bot.dagpi.image_process(ctx.command.qualified_name, feature, url)
+    return image
 
 
 class ImageOrMember(commands.Converter):
@@ -52,9 +49,8 @@ class ImageOrMember(commands.Converter):
             member = await member_converter.convert(ctx, argument)
 
             asset = member.avatar_url_as(static_format="png",
-                                         format="png",
                                          size=512)
-            image = await asset.read()
+            image = await ctx.bot.fetcher.fetch(asset)
 
             return image
 
@@ -66,21 +62,19 @@ class ImageOrMember(commands.Converter):
 
                 url = await twemoji_parser.emoji_to_url(argument, include_check=True)
                 if re.match(url_regex, url):
-                    async with ctx.bot.session.get(url) as response:
-                        image_bytes = await response.read()
-                        return image_bytes
+                    image_bytes = await ctx.bot.fetcher.fetch(url)
+                    return image_bytes
 
                 if re.match(url_regex, argument):
-                    async with ctx.bot.session.get(argument) as response:
-                        image = await response.read()
-                        return image
+                    image = await ctx.bot.fetcher.fetch(argument)
+                    return image
 
                 elif re.match(emoji_regex, argument):
                     emoji_converter = commands.PartialEmojiConverter()
                     emoji = await emoji_converter.convert(ctx, argument)
 
                     asset = emoji.url
-                    image = await asset.read()
+                    image = await ctx.bot.fetcher.fetch(asset)
 
                     return image
             except TypeError:
@@ -97,13 +91,12 @@ async def get_image(ctx: utils.CustomContext, argument: str):
     if image is None:
         if ctx.message.attachments:
             asset = ctx.message.attachments[0]
-            image = await asset.read()
+            image = await ctx.bot.fetcher.fetch(asset.url)
             return image
         else:
             asset = ctx.author.avatar_url_as(static_format="png",
-                                             format="png",
                                              size=512)
-            image = await asset.read()
+            image = await ctx.bot.fetcher.fetch(asset)
             return image
     else:
         return image
@@ -123,77 +116,84 @@ class ObjectURL(commands.Converter):
         return str(ret.url) if isinstance(ret, discord.PartialEmoji) else str(ret.avatar_url)
 
 
+FACETIME_BUTTONS = ("./data/facetimebuttons.png", (1024, 1024))
+ALWAYS_HAS_BEEN = ("./data/ahb.png", None)
+ALWAYS_HAS_BEEN_FONT = ("./data/JetBrainsMono-Regular.ttf", 48)
+POSTER_FONT = ("./data/JetBrainsMono-Regular.ttf", 96)
+SMALL_FONT = ("./data/JetBrainsMono-Regular.ttf", 24)
+
+# Braille dot values for each (row, column) of a 4x2 cell.
+BRAILLE_DOTS = np.array([[0x01, 0x08],
+                         [0x02, 0x10],
+                         [0x04, 0x20],
+                         [0x40, 0x80]])
+
+
+def _open_rgb(b: bytes) -> PILImage.Image:
+    with PILImage.open(BytesIO(b)) as img:
+        utils.check_dimensions(img.width, img.height)
+        return img.convert("RGB")
+
+
+def _save_png(image: PILImage.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, "png")
+    return buffer.getvalue()
+
+
 class Manipulation:
+    """Every method here runs inside a render worker process through bot.render,
+    so they take and return plain bytes to keep pickling cheap.
+    Inputs have already been through utils.check_image_size, so each method
+    decodes its image once and only re-checks the size of what it decoded."""
 
     @staticmethod
-    def solarize_image(b: bytes):
-        with WandImage(file=BytesIO(b)) as img:
-            if (img.width * img.height) >= (1200 * 1000):
-                raise commands.BadArgument(
-                    "That image is a little too large and may crashy washy my botty wotty 🥺")
-
+    def solarize_image(b: bytes) -> bytes:
         image = Image(b)
-        if (image.width * image.height) >= (1200 * 1000):
-            raise commands.BadArgument(
-                "That image is a little too large and may crashy washy my botty wotty 🥺")
+        utils.check_dimensions(image.width, image.height)
 
         image.solarize()
-        save_bytes = image.save_bytes()
-        io_bytes = BytesIO(save_bytes)
-
-        return io_bytes
+        return image.save_bytes()
 
     @staticmethod
-    def brighten_image(b: bytes, amount: int):
-        with WandImage(file=BytesIO(b)) as img:
-            if (img.width * img.height) >= (1200 * 1000):
-                raise commands.BadArgument(
-                    "That image is a little too large and may crashy washy my botty wotty 🥺")
-
+    def brighten_image(b: bytes, amount: int) -> bytes:
         image = Image(b)
-        if (image.width * image.height) >= (1200 * 1000):
-            raise commands.BadArgument(
-                "That image is a little too large and may crashy washy my botty wotty 🥺")
+        utils.check_dimensions(image.width, image.height)
 
         image.brighten(amount)
-        save_bytes = image.save_bytes()
-        io_bytes = BytesIO(save_bytes)
-
-        return io_bytes
+        return image.save_bytes()
 
     @staticmethod
     def facetime(image_one_bytes: bytes,
-                 image_two_bytes: bytes):
-
-        with WandImage(file=BytesIO(image_one_bytes)) as img:
-            if (img.width * img.height) >= (1200 * 1000):
-                raise commands.BadArgument(
-                    "That image is a little too large and may crashy washy my botty wotty 🥺")
+                 image_two_bytes: bytes) -> bytes:
 
-        image_one = Image(image_one_bytes)
+        with PILImage.open(BytesIO(image_one_bytes)) as img:
+            utils.check_dimensions(img.width, img.height)
+            image_one = img.convert("RGBA")
 
         if image_one.size != (1024, 1024):
-            image_one.resize(1024, 1024, 5)
+            image_one = image_one.resize((1024, 1024), PILImage.LANCZOS)
+
+        with PILImage.open(BytesIO(image_two_bytes)) as img:
+            image_two = img.convert("RGBA")
 
-        image_two = Image(image_two_bytes)
         if image_two.size != (256, 256):
-            image_two.resize(256, 256, 5)
+            image_two = image_two.resize((256, 256), PILImage.LANCZOS)
+
+        facetime_buttons = utils.assets.image(*FACETIME_BUTTONS)
 
-        facetime_buttons = Image("./data/facetimebuttons.png")
-        facetime_buttons.resize(1024, 1024, 5)
+        image_one.paste(image_two, (15, 15), image_two)
+        image_one.paste(facetime_buttons, (0, 390), facetime_buttons)
 
-        image_one.watermark(image_two, 15, 15)
-        image_one.watermark(facetime_buttons, 0, 390)
-        io_bytes = BytesIO(image_one.save_bytes())
+        buffer = BytesIO()
+        image_one.save(buffer, "png")
 
-        return io_bytes
+        return buffer.getvalue()
 
     @staticmethod
-    def magik(image: BytesIO):
-        with WandImage(file=image) as img:
-            if (img.width * img.height) >= (1200 * 1000):
-                raise commands.BadArgument(
-                    "That image is a little too large and may crashy washy my botty wotty 🥺")
+    def magik(b: bytes) -> bytes:
+        with WandImage(blob=b) as img:
+            utils.check_dimensions(img.width, img.height)
 
             img.liquid_rescale(width=int(img.width * 0.5),
                                height=int(img.height * 0.5),
@@ -205,18 +205,12 @@ class Manipulation:
                                delta_x=random.randrange(1, 3),
                                rigidity=0)
 
-            buffer = BytesIO()
-            img.save(file=buffer)
-
-        buffer.seek(0)
-        return buffer
+            return img.make_blob("png")
 
     @staticmethod
-    def floor(image: BytesIO):  # https://github.com/linKhehe/Zane fank u link
-        with WandImage(file=image) as img:
-            if (img.width * img.height) >= (1200 * 1000):
-                raise commands.BadArgument(
-                    "That image is a little too large and may crashy washy my botty wotty 🥺")
+    def floor(b: bytes) -> bytes:  # https://github.com/linKhehe/Zane fank u link
+        with WandImage(blob=b) as img:
+            utils.check_dimensions(img.width, img.height)
 
             img.resize(256, 256)
             img.matte_color = Color("BLACK")
@@ -227,33 +221,21 @@ class Manipulation:
                     img.height, img.width, 204, 255)
             img.distort("perspective", args)
 
-            buffer = BytesIO()
-            img.save(file=buffer)
-
-        buffer.seek(0)
-        return buffer
+            return img.make_blob("png")
 
     @staticmethod
-    def chroma(image: BytesIO):
-        with WandImage(file=image) as img:
-            if (img.width * img.height) >= (1200 * 1000):
-                raise commands.BadArgument(
-                    "That image is a little too large and may crashy washy my botty wotty 🥺")
+    def chroma(b: bytes) -> bytes:
+        with WandImage(blob=b) as img:
+            utils.check_dimensions(img.width, img.height)
 
             img.function("sinusoid", [1.5, -45, 0.2, 0.60])
 
-            buffer = BytesIO()
-            img.save(file=buffer)
-
-        buffer.seek(0)
-        return buffer
+            return img.make_blob("png")
 
     @staticmethod
-    def swirl(image: BytesIO, degrees: int = 90):
-        with WandImage(file=image) as img:
-            if (img.width * img.height) >= (1200 * 1000):
-                raise commands.BadArgument(
-                    "That image is a little too large and may crashy washy my botty wotty 🥺")
+    def swirl(b: bytes, degrees: int = 90) -> bytes:
+        with WandImage(blob=b) as img:
+            utils.check_dimensions(img.width, img.height)
 
             if degrees > 360:
                 degrees = 360
@@ -264,60 +246,164 @@ class Manipulation:
 
             img.swirl(degree=degrees)
 
-            buffer = BytesIO()
-            img.save(file=buffer)
-
-        buffer.seek(0)
-        return buffer
+            return img.make_blob("png")
 
     @staticmethod
-    def alwayshasbeen(txt: str):
+    def alwayshasbeen(txt: str) -> bytes:
         PILImage.MAX_IMAGE_PIXELS = (1200 * 1000)
 
-        with PILImage.open("./data/ahb.png") as img:
-            wrapped = textwrap.wrap(txt, 20)
+        img = utils.assets.image(*ALWAYS_HAS_BEEN)
+        wrapped = textwrap.wrap(txt, 20)
 
-            set_back = sum(12 for char in txt) if len(
-                wrapped) == 1 else sum(6 for char in txt)
-            up_amount = sum(35 for newline in wrapped)
-            coords = (700 - set_back, 300 - up_amount)
+        set_back = sum(12 for char in txt) if len(
+            wrapped) == 1 else sum(6 for char in txt)
+        up_amount = sum(35 for newline in wrapped)
+        coords = (700 - set_back, 300 - up_amount)
 
-            font = ImageFont.truetype("./data/JetBrainsMono-Regular.ttf", 48)
-            draw = ImageDraw.Draw(img)
+        font = utils.assets.font(*ALWAYS_HAS_BEEN_FONT)
+        draw = ImageDraw.Draw(img)
 
-            draw.text(coords, "\n".join(wrapped), (255, 255, 255), font=font)
+        draw.text(coords, "\n".join(wrapped), (255, 255, 255), font=font)
 
-            buffer = BytesIO()
-            img.save(buffer, "png")
+        buffer = BytesIO()
+        img.save(buffer, "png")
 
-        buffer.seek(0)
-        return buffer
+        return buffer.getvalue()
 
     @staticmethod
-    def rainbowify(b: bytes):
-        with WandImage(file=BytesIO(b)) as img:
-            if (img.width * img.height) >= (1200 * 1000):
-                raise commands.BadArgument(
-                    "That image is a little too large and may crashy washy my botty wotty 🥺")
-
+    def rainbowify(b: bytes) -> bytes:
         img = Image(b)
+        utils.check_dimensions(img.width, img.height)
         img.apply_gradient()
 
-        save_bytes = img.save_bytes()
-        io_bytes = BytesIO(save_bytes)
+        return img.save_bytes()
 
-        return io_bytes
+    # Local versions of the effects that were only available through Zane and Dagpi.
 
+    @staticmethod
+    def deepfry(b: bytes) -> bytes:
+        image = _open_rgb(b)
+
+        image = ImageEnhance.Color(image).enhance(3.0)
+        image = ImageEnhance.Contrast(image).enhance(2.0)
+        image = ImageEnhance.Sharpness(image).enhance(8.0)
+
+        for _ in range(2):
+            buffer = BytesIO()
+            image.save(buffer, "jpeg", quality=10)
+            buffer.seek(0)
+            image = PILImage.open(buffer).convert("RGB")
+
+        buffer = BytesIO()
+        image.save(buffer, "jpeg", quality=25)
+        return buffer.getvalue()
+
+    @staticmethod
+    def pixelate(b: bytes) -> bytes:
+        pixels = np.asarray(_open_rgb(b), dtype=np.float32)
+        height, width = pixels.shape[:2]
+        block = max(4, min(width, height) // 32)
+
+        # Pad to a whole number of blocks, average each block, then blow them back up.
+        padded = np.pad(pixels, ((0, -height % block), (0, -width % block), (0, 0)), mode="edge")
+        rows, cols = padded.shape[0] // block, padded.shape[1] // block
+        blocks = padded.reshape(rows, block, cols, block, 3).mean(axis=(1, 3))
+
+        out = blocks.repeat(block, axis=0).repeat(block, axis=1)[:height, :width]
+        return _save_png(PILImage.fromarray(out.round().astype(np.uint8)))
+
+    @staticmethod
+    def colours(b: bytes, amount: int = 5) -> bytes:
+        image = _open_rgb(b)
+        image.thumbnail((128, 128))
+
+        # Bucket into 5 bits per channel so near identical shades count as one colour.
+        pixels = np.asarray(image, dtype=np.int32).reshape(-1, 3) >> 3
+        packed = (pixels[:, 0] << 10) | (pixels[:, 1] << 5) | pixels[:, 2]
+        values, counts = np.unique(packed, return_counts=True)
+        top = values[np.argsort(counts)[::-1][:amount]]
+
+        font = utils.assets.font(*SMALL_FONT)
+        palette = PILImage.new("RGB", (200 * len(top), 260), (255, 255, 255))
+        draw = ImageDraw.Draw(palette)
+
+        for i, value in enumerate(top):
+            colour = tuple(int((value >> shift) & 0x1F) << 3 | 4 for shift in (10, 5, 0))
+            draw.rectangle((i * 200, 0, i * 200 + 199, 199), fill=colour)
+            draw.text((i * 200 + 40, 215), utils.rgb_to_hex(colour), (0, 0, 0), font=font)
+
+        return _save_png(palette)
+
+    @staticmethod
+    def wanted(b: bytes) -> bytes:
+        avatar = _open_rgb(b).resize((440, 440), PILImage.LANCZOS)
+        avatar = ImageOps.colorize(avatar.convert("L"), black="#2b1d0e", white="#f4e3c1")
+
+        poster = PILImage.new("RGB", (600, 800), (222, 196, 146))
+        draw = ImageDraw.Draw(poster)
+        draw.rectangle((10, 10, 589, 789), outline=(92, 64, 34), width=6)
+        draw.text((300, 90), "WANTED", (60, 40, 20), font=utils.assets.font(*POSTER_FONT), anchor="mm")
+        poster.paste(avatar, (80, 170))
+        draw.rectangle((80, 170, 519, 609), outline=(60, 40, 20), width=4)
+        draw.text((300, 680), "DEAD OR ALIVE", (60, 40, 20), font=utils.assets.font(*ALWAYS_HAS_BEEN_FONT), anchor="mm")
+
+        return _save_png(poster)
+
+    @staticmethod
+    def polaroid(b: bytes) -> bytes:
+        photo = _open_rgb(b).resize((512, 512), PILImage.LANCZOS)
+
+        frame = PILImage.new("RGB", (512 + 64, 512 + 160), (250, 250, 245))
+        frame.paste(photo, (32, 32))
+        ImageDraw.Draw(frame).rectangle((0, 0, frame.width - 1, frame.height - 1), outline=(200, 200, 200), width=2)
+
+        return _save_png(frame)
+
+    @staticmethod
+    def braille(b: bytes, columns: int = 40, max_rows: int = 45) -> str:
+        image = _open_rgb(b).convert("L")
+
+        # Each character covers 2x4 pixels, and is roughly twice as tall as it is wide.
+        rows = max(1, min(max_rows, round(image.height / image.width * columns / 2)))
+        pixels = np.asarray(image.resize((columns * 2, rows * 4), PILImage.LANCZOS))
+
+        cells = (pixels > pixels.mean()).reshape(rows, 4, columns, 2)
+        codes = (cells * BRAILLE_DOTS[None, :, None, :]).sum(axis=(1, 3)) + 0x2800
+
+        return "\n".join("".join(map(chr, row)) for row in codes)
+
+
+# These work on a single frame at a time, so animated gifs are streamed through them frame by frame.
+ANIMATED_OPERATIONS = (
+    Manipulation.swirl,
+    Manipulation.chroma,
+    Manipulation.floor,
+    Manipulation.brighten_image,
+    Manipulation.solarize_image,
+)
+
+
+async def do_render(ctx: utils.CustomContext, name: str, method: callable, *args):
+    """Renders the given Manipulation method on the bots render engine and sends the result."""
+
+    for arg in args:
+        if isinstance(arg, bytes):
+            utils.check_image_size(arg)
+
+    animated = (method in ANIMATED_OPERATIONS and utils.is_animated_gif(args[0]))
 
-async def do_polaroid_image(ctx: utils.CustomContext, method: callable, image: bytes, name: str, *args):
     async with ctx.timeit:
         async with ctx.typing():
-            func = functools.partial(method, image)
-            buffer = await ctx.bot.loop.run_in_executor(None, func, *args)
+            if animated:
+                image_bytes = await ctx.bot.render.cached_gif(method, *args)
+            else:
+                image_bytes = await ctx.bot.render.cached(method, *args)
+
+            ext = utils.sniff_format(image_bytes) or "png"
 
             embed = ctx.bot.embed(ctx)
-            file = discord.File(fp=buffer, filename=f"{name}.png")
-            embed.set_image(url=f"attachment://{name}.png")
+            file = discord.File(fp=BytesIO(image_bytes), filename=f"{name}.{ext}")
+            embed.set_image(url=f"attachment://{name}.{ext}")
 
             await ctx.send(
                 file=file,
@@ -325,6 +411,34 @@ async def do_polaroid_image(ctx: utils.CustomContext, method: callable, image: b
             )
 
 
+async def render_url(ctx: utils.CustomContext, method: callable, url: str, *args) -> bytes:
+    """Fetches the image at url and renders the given Manipulation method on it."""
+
+    image = await ctx.bot.fetcher.fetch(url)
+    utils.check_image_size(image)
+
+    return await ctx.bot.render.cached(method, image, *args)
+
+
+async def do_effect(ctx: utils.CustomContext, name: str, url: str, method: callable,
+                    remote: typing.Callable[[], typing.Awaitable[bytes]], content: str = None):
+    """Runs an effect that can be rendered either locally with the given Manipulation method
+    or by a remote API, letting bot.effects pick which one serves it, and sends the result."""
+
+    async with ctx.timeit:
+        async with ctx.typing():
+            image_bytes = await ctx.bot.effects.run(
+                name,
+                lambda: render_url(ctx, method, url),
+                remote,
+            )
+
+            ext = utils.sniff_format(image_bytes) or "png"
+            file = discord.File(fp=BytesIO(image_bytes), filename=f"{name}.{ext}")
+
+            await ctx.send(content, file=file)
+
+
 class ImageManipulation(commands.Cog, name="imagemanipulation"):
     """Image Manipulation"""
 
@@ -334,12 +448,21 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         self.logger = utils.create_logger(
             self.__class__.__name__, logging.INFO)
 
-    async def do_zane(self, ctx: utils.CustomContext, what: str, method: callable, gif_or_png: str):
-        async with ctx.typing():
-            get_image = await method(what)
-            discord_file = discord.File(get_image, f"hellomagicman.{gif_or_png}")
+        utils.assets.register_image(*FACETIME_BUTTONS)
+        utils.assets.register_image(*ALWAYS_HAS_BEEN)
+        utils.assets.register_font(*ALWAYS_HAS_BEEN_FONT)
+        utils.assets.register_font(*POSTER_FONT)
+        utils.assets.register_font(*SMALL_FONT)
+
+    async def do_zane(self, method: callable, what: str) -> bytes:
+        image = await method(what)
+        return image.read()
+
+    async def local_braille(self, what: str) -> str:
+        image = await self.bot.fetcher.fetch(what)
+        utils.check_image_size(image)
 
-            await ctx.send(file=discord_file)
+        return await self.bot.render.submit(Manipulation.braille, image)
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -347,7 +470,8 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Gives a deepfry effect onto a given image."""
 
         what = what or str(ctx.author.avatar_url)
-        await self.do_zane(ctx, what, self.bot.zane.deepfry, "png")
+        await do_effect(ctx, "deepfry", what, Manipulation.deepfry,
+                        lambda: self.do_zane(self.bot.zane.deepfry, what))
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -355,7 +479,13 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Turns a given image into braille."""
 
         what = what or str(ctx.author.avatar_url)
-        braille = await self.bot.zane.braille(what)
+        async with ctx.typing():
+            braille = await self.bot.effects.run(
+                "braille",
+                lambda: self.local_braille(what),
+                lambda: self.bot.zane.braille(what),
+            )
+
         await ctx.send(braille)
 
     @commands.command()
@@ -364,7 +494,8 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Turns a given image into some magic stuff."""
 
         what = what or str(ctx.author.avatar_url)
-        await self.do_zane(ctx, what, self.bot.zane.magic, "gif")
+        await do_effect(ctx, "magik", what, Manipulation.magik,
+                        lambda: self.do_zane(self.bot.zane.magic, what))
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -372,7 +503,8 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Gives a floor effect to a given image."""
 
         what = what or str(ctx.author.avatar_url)
-        await self.do_zane(ctx, what, self.bot.zane.floor, "gif")
+        await do_effect(ctx, "floor", what, Manipulation.floor,
+                        lambda: self.do_zane(self.bot.zane.floor, what))
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -380,7 +512,7 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Applies a rainbow effect to a given image."""
 
         image = await get_image(ctx, what)
-        await do_polaroid_image(ctx, Manipulation.rainbowify, image, "rainbowify")
+        await do_render(ctx, "rainbowify", Manipulation.rainbowify, image)
 
     @commands.command(aliases=["ahb"])
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -389,67 +521,27 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
 
         text = text or "I'm dumb and didn't put any text"
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                if len(text) > 50:
-                    fmt = "<:smh:789142899290931241> it can't be any longer than 50 characters!"
-                    return await ctx.send(fmt)
+        if len(text) > 50:
+            fmt = "<:smh:789142899290931241> it can't be any longer than 50 characters!"
+            return await ctx.send(fmt)
 
-                func = functools.partial(Manipulation.alwayshasbeen, text)
-                buffer = await self.bot.loop.run_in_executor(None, func)
-
-                embed = self.bot.embed(ctx)
-
-                file = discord.File(fp=buffer, filename="ahb.png")
-                embed.set_image(url="attachment://ahb.png")
-
-                await ctx.send(
-                    file=file,
-                    embed=embed
-                )
+        await do_render(ctx, "ahb", Manipulation.alwayshasbeen, text)
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
     async def swirl(self, ctx: utils.CustomContext, degrees: typing.Optional[int] = 90, what: str = None):
         """Adds a swirl affect to a given image."""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                image = await get_image(ctx, what)
-                buffer = BytesIO(image)
-
-                func = functools.partial(Manipulation.swirl, buffer, degrees)
-                buffer = await self.bot.loop.run_in_executor(None, func)
-
-                embed = self.bot.embed(ctx)
-                file = discord.File(fp=buffer, filename="swirl.png")
-                embed.set_image(url="attachment://swirl.png")
-
-                await ctx.send(
-                    file=file,
-                    embed=embed
-                )
+        image = await get_image(ctx, what)
+        await do_render(ctx, "swirl", Manipulation.swirl, image, degrees)
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
     async def chroma(self, ctx: utils.CustomContext, what=None):
         """Adds a chroma gamma affect to a given image."""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                image = await get_image(ctx, what)
-                buffer = BytesIO(image)
-                func = functools.partial(Manipulation.chroma, buffer)
-                buffer = await self.bot.loop.run_in_executor(None, func)
-
-                embed = self.bot.embed(ctx)
-                file = discord.File(fp=buffer, filename="chroma.png")
-                embed.set_image(url="attachment://chroma.png")
-
-                await ctx.send(
-                    file=file,
-                    embed=embed
-                )
+        image = await get_image(ctx, what)
+        await do_render(ctx, "chroma", Manipulation.chroma, image)
 
     @commands.command(aliases=["ft"])
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -457,66 +549,26 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
     async def facetime(self, ctx: utils.CustomContext, what: str):
         """Facetime with another user or even an image if you're really that lonely, I guess."""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                author_image = await ctx.author.avatar_url_as(static_format="png", size=1024).read()
-                what = await get_image(ctx, what)
-
-                func = functools.partial(
-                    Manipulation.facetime, what, author_image)
-                image_bytes = await self.bot.loop.run_in_executor(None, func)
-
-                embed = self.bot.embed(ctx)
-                file = discord.File(image_bytes, filename="facetime.png")
-                embed.set_image(url="attachment://facetime.png")
+        author_image = await self.bot.fetcher.fetch(ctx.author.avatar_url_as(static_format="png", size=1024))
+        what = await get_image(ctx, what)
 
-                await ctx.send(
-                    file=file,
-                    embed=embed
-                )
+        await do_render(ctx, "facetime", Manipulation.facetime, what, author_image)
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
     async def brighten(self, ctx: utils.CustomContext, what: typing.Optional[str], amount: int = 50):
         """Brightens a given picture or your own or even someone else's profile picture by a given amount"""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                what = await get_image(ctx, what)
-
-                func = functools.partial(
-                    Manipulation.brighten_image, what, amount)
-                image_bytes = await self.bot.loop.run_in_executor(None, func)
-
-                embed = self.bot.embed(ctx)
-                file = discord.File(image_bytes, filename="brightened.png")
-                embed.set_image(url="attachment://brightened.png")
-
-                await ctx.send(
-                    file=file,
-                    embed=embed
-                )
+        what = await get_image(ctx, what)
+        await do_render(ctx, "brightened", Manipulation.brighten_image, what, amount)
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
     async def solarize(self, ctx: utils.CustomContext, what: typing.Optional[str]):
         """Solarizes your own or someone else's profile picture or even a given picture."""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                what = await get_image(ctx, what)
-
-                func = functools.partial(Manipulation.solarize_image, what)
-                image_bytes = await self.bot.loop.run_in_executor(None, func)
-
-                embed = self.bot.embed(ctx)
-                file = discord.File(image_bytes, filename="solarize.png")
-                embed.set_image(url="attachment://solarize.png")
-
-                await ctx.send(
-                    file=file,
-                    embed=embed
-                )
+        what = await get_image(ctx, what)
+        await do_render(ctx, "solarize", Manipulation.solarize_image, what)
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -524,11 +576,11 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Puts a members user avatar on a wanted poster.
         Powered by Dagpi."""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                user = user or ctx.author
-                img_file = await do_dagpi_stuff(ctx, user, ImageFeatures.wanted())
-                await ctx.send(content=f"Hands up **{user.name}!**", file=img_file)
+        user = user or ctx.author
+        url = str(user.avatar_url_as(static_format="png"))
+        await do_effect(ctx, "wanted", url, Manipulation.wanted,
+                        lambda: do_dagpi_stuff(ctx, user, ImageFeatures.wanted()),
+                        content=f"Hands up **{user.name}!**")
 
     @commands.command(aliases=["colors"])
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -536,14 +588,11 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Gives you the top 5 colours of your own or another persons profile picture.
         Powered by Dagpi."""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                user = user or ctx.author
-                img_file = await do_dagpi_stuff(ctx, user, ImageFeatures.colors())
-                await ctx.send(
-                    f"Top 5 Colours for {user}",
-                    file=img_file
-                )
+        user = user or ctx.author
+        url = str(user.avatar_url_as(static_format="png"))
+        await do_effect(ctx, "colours", url, Manipulation.colours,
+                        lambda: do_dagpi_stuff(ctx, user, ImageFeatures.colors()),
+                        content=f"Top 5 Colours for {user}")
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -551,11 +600,10 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Pixelates someones profile picture.
         Powered by Dagpi."""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                user = user or ctx.author
-                img_file = await do_dagpi_stuff(ctx, user, ImageFeatures.pixel())
-                await ctx.send(file=img_file)
+        user = user or ctx.author
+        url = str(user.avatar_url_as(static_format="png"))
+        await do_effect(ctx, "pixelate", url, Manipulation.pixelate,
+                        lambda: do_dagpi_stuff(ctx, user, ImageFeatures.pixel()))
 
     @commands.command()
     @commands.cooldown(1, 3, commands.BucketType.member)
@@ -563,14 +611,11 @@ class ImageManipulation(commands.Cog, name="imagemanipulation"):
         """Puts someones profile picture in a polaroid.
         Powered by Dagpi."""
 
-        async with ctx.timeit:
-            async with ctx.typing():
-                user = user or ctx.author
-                img_file = await do_dagpi_stuff(ctx, user, ImageFeatures.polaroid())
-                await ctx.send(
-                    "*Look at this photograph*",
-                    file=img_file
-                )
+        user = user or ctx.author
+        url = str(user.avatar_url_as(static_format="png"))
+        await do_effect(ctx, "polaroid", url, Manipulation.polaroid,
+                        lambda: do_dagpi_stuff(ctx, user, ImageFeatures.polaroid()),
+                        content="*Look at this photograph*")
 
 
 def setup(bot):
@@ -19,7 +19,6 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 import contextlib
 import io
 import logging
-import random
 import dateparser
 import discord
 import utils
@@ -123,9 +122,7 @@ class Management(commands.Cog, name="management"):
         role = channel.guild.get_role(mute_role_id)
 
         if role is None:
-            await self.bot.pool.execute("UPDATE guild_settings SET mute_role_id = NULL WHERE guild_id = $1",
-                                        channel.guild.id)
-            self.bot.config[channel.guild.id]["mute_role_id"] = None
+            self.bot.config.set(channel.guild.id, "mute_role_id", None)
             return
 
         role_overwrites = channel.overwrites_for(role)
@@ -138,30 +135,6 @@ class Management(commands.Cog, name="management"):
                 reason="Disable mute role permissions to talk in this channel."
             )
 
-    @commands.Cog.listener()
-    async def on_giveaway_end(self, message: discord.PartialMessage):
-        message: discord.Message = await message.fetch()
-
-        reaction: discord.Reaction = message.reactions[0]
-        try:
-            users = [user async for user in reaction.users().filter(lambda u: not u.bot)]
-            random_user = random.choice(users)
-        except IndexError:
-            fmt = f"No one entered into [this]({message.jump_url}) giveaway :("
-            embed = self.bot.embed()
-            embed.description = fmt
-
-            return await message.channel.send(embed=embed)
-
-        fmt = f"The winner of [this]({message.jump_url}) giveaway is: {random_user.mention}"
-        embed = self.bot.embed()
-        embed.description = fmt
-
-        await message.channel.send(
-            f"Congratulations to {random_user.mention}",
-            embed=embed
-        )
-
     @commands.Cog.listener("on_raw_reaction_add")
     async def check_if_has_role(self, payload: discord.RawReactionActionEvent):
         if payload.member.bot:
@@ -198,8 +171,7 @@ class Management(commands.Cog, name="management"):
 
         if role is None:
             del self.bot.verification_config[payload.message_id]
-            await self.bot.pool.execute("DELETE FROM guild_verification WHERE message_id = $1",
-                                        payload.message_id)
+            await self.bot.queries.execute("verification_remove_message", payload.message_id)
 
         await payload.member.add_roles(role, reason="Reaction Verification")
 
@@ -279,20 +251,16 @@ class Management(commands.Cog, name="management"):
         message = await channel.send(embed=embed)
         await message.add_reaction("\N{PARTY POPPER}")
 
-        if role_needed == "None":
-            query = "INSERT INTO giveaways VALUES($1, $2, $3)"
-            values = message.id, ctx.channel.id, time_end.replace(tzinfo=None)
-        else:
-            query = "INSERT INTO giveaways VALUES($1, $2, $3, $4)"
-            values = message.id, ctx.channel.id, time_end.replace(
-                tzinfo=None), role_needed.id
+        role_id = None if role_needed == "None" else role_needed.id
+        ends_at = time_end.replace(tzinfo=None)
 
-        await self.bot.pool.execute(query, *values)
+        await self.bot.queries.execute("giveaway_add", message.id, channel.id, ends_at, role_id)
 
-        if role_needed != "None":
-            self.bot.giveaway_roles[message.id] = role_needed.id
+        if role_id is not None:
+            self.bot.giveaway_roles[message.id] = role_id
 
-        await utils.set_giveaway(self.bot, time_end, channel.id, message.id)
+        self.bot.timers.schedule("giveaway", {"message_id": message.id, "channel_id": channel.id,
+                                              "ends_at": ends_at, "role_id": role_id})
 
     # @commands.group(invoke_without_command=True)
     # @commands.guild_only()
@@ -361,11 +329,7 @@ class Management(commands.Cog, name="management"):
 
         await ctx.thumbsup()
 
-        sql = "UPDATE guild_settings SET log_channel = $1 WHERE guild_id = $2;"
-        values = (channel.id, ctx.guild.id)
-        
-        await self.bot.pool.execute(sql, *values)
-        self.bot.config[ctx.guild.id]["log_channel"] = channel.id
+        self.bot.config.set(ctx.guild.id, "log_channel", channel.id)
 
     @logging.command(name="unset")
     @commands.guild_only()
@@ -373,14 +337,13 @@ class Management(commands.Cog, name="management"):
     async def logging_unset(self, ctx: utils.CustomContext):
         """Sets up an interactive message to unset logging."""
 
-        log_channel = self.bot.config.get(ctx.guild.id).get("log_channel", None)
+        log_channel = self.bot.config[ctx.guild.id]["log_channel"]
 
-        if log_channel:
+        if log_channel is None:
             return await ctx.send("You do not have logging set up, therefore can't remove it.")
 
-        sql = "UPDATE guild_settings SET log_channel = NULL WHERE guild_id = $1;"
-        await self.bot.pool.execute(sql, ctx.guild.id)
-        self.bot.confg[ctx.guild.id]["log_channel"] = None
+        self.bot.config.set(ctx.guild.id, "log_channel", None)
+        await ctx.thumbsup()
 
     @commands.command()
     @commands.guild_only()
@@ -390,16 +353,14 @@ class Management(commands.Cog, name="management"):
         """Sets the mute role for the server."""
 
         if role is None:
-            try:
-                mute_role_id = self.bot.config[ctx.guild.id]["mute_role_id"]
-            except KeyError:
+            role = ctx.guild.get_role(self.bot.config[ctx.guild.id]["mute_role_id"])
+            if role is None:
                 fmt = (
                     "There is no mute role set for this server... set one using "
                     f"`{ctx.prefix}muterole [Role Name Here]`"
                 )
                 return await ctx.send(fmt)
 
-            role = ctx.guild.get_role(mute_role_id)
             fmt = f"Your current mute role is: {role} (ID: {role.id})"
             return await ctx.send(fmt)
 
@@ -421,9 +382,7 @@ class Management(commands.Cog, name="management"):
         else:
             content = message.content.lower()
             if content == "yes":
-                await self.bot.pool.execute("UPDATE guild_settings SET mute_role_id = $1 WHERE guild_id = $2",
-                                            role.id, ctx.guild.id)
-                self.bot.config[ctx.guild.id]["mute_role_id"] = role.id
+                self.bot.config.set(ctx.guild.id, "mute_role_id", role.id)
 
                 await ctx.send("Alright, this may take a while.", new_message=True)
 
@@ -451,9 +410,7 @@ class Management(commands.Cog, name="management"):
     async def owoify(self, ctx: utils.CustomContext, enabled: bool):
         """Enables owoified text for the server."""
 
-        self.bot.config[ctx.guild.id]["owoify"] = enabled
-        await self.bot.pool.execute("UPDATE guild_settings SET owoify = $1 WHERE guild_id = $2",
-                                    enabled, ctx.guild.id)
+        self.bot.config.set(ctx.guild.id, "owoify", enabled)
 
         await ctx.send("Successfully updated your owoify settings")
 
@@ -486,12 +443,7 @@ class Management(commands.Cog, name="management"):
         if prefix.startswith((f"<@!{_id}>", f"<@{_id}>")):
             return await ctx.send("That prefix is reserved/already in use.")
 
-        await self.bot.pool.execute(
-            "UPDATE guild_settings SET guild_prefix = $1 WHERE guild_id = $2",
-            prefix,
-            ctx.guild.id,
-        )
-        self.bot.config[ctx.guild.id]["guild_prefix"] = prefix
+        self.bot.config.set(ctx.guild.id, "guild_prefix", prefix)
         await ctx.thumbsup()
 
     @commands.group(aliases=["verify"], invoke_without_command=True)
@@ -512,9 +464,7 @@ class Management(commands.Cog, name="management"):
     async def verification_setup(self, ctx: utils.CustomContext, channel: discord.TextChannel, *, role: utils.RoleConverter):
         """Goes through the process to set up verification."""
 
-        check_guild = await self.bot.pool.fetchrow(
-            "SELECT * FROM guild_verification WHERE guild_id = $1", ctx.guild.id
-        )
+        check_guild = await self.bot.queries.fetchrow("verification_get", ctx.guild.id)
 
         if check_guild:
             return await ctx.send("❌ Verification is already set up.")
@@ -533,12 +483,7 @@ class Management(commands.Cog, name="management"):
             return await ctx.send("I can not send messages in that channel, please give me permissions to!")
 
         await msg.add_reaction("✅")
-        await self.bot.pool.execute(
-            "INSERT INTO guild_verification(guild_id, message_id, role_id) VALUES($1, $2, $3)",
-            ctx.guild.id,
-            msg.id,
-            role.id,
-        )
+        await self.bot.queries.execute("verification_add", ctx.guild.id, msg.id, role.id)
         self.bot.verification_config[msg.id] = role.id
 
         await ctx.thumbsup()
@@ -549,20 +494,13 @@ class Management(commands.Cog, name="management"):
     async def verification_reset(self, ctx: utils.CustomContext):
         """Resets verification in the server."""
 
-        check_guild = await self.bot.pool.fetchrow(
-            "SELECT * FROM guild_verification WHERE guild_id = $1", ctx.guild.id
-        )
+        check_guild = await self.bot.queries.fetchrow("verification_get", ctx.guild.id)
 
         if not check_guild:
             return await ctx.send("❌ You do not have verification set up.")
 
-        msg_id = await self.bot.pool.fetchval("SELECT message_id FROM guild_verification WHERE guild_id = $1",
-                                              ctx.guild.id)
-
-        await self.bot.pool.execute(
-            "DELETE FROM guild_verification WHERE guild_id = $1", ctx.guild.id
-        )
-        del self.bot.verification_config[msg_id]
+        await self.bot.queries.execute("verification_remove", ctx.guild.id)
+        self.bot.verification_config.pop(check_guild["message_id"], None)
 
         await ctx.thumbsup()
 
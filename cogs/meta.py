@@ -138,8 +138,7 @@ class Meta(commands.Cog, name="meta"):
     async def _get_task_by_enumeration(self, user: discord.Member, enumerated_id: int):
         """Helper method to get a task by its enumeration ID."""
 
-        sql = "SELECT * FROM todos WHERE user_id = $1"
-        all_tasks = await self.bot.pool.fetch(sql, user.id)
+        all_tasks = await self.bot.queries.fetch("todo_list", user.id)
 
         try:
             resultant_task = all_tasks[enumerated_id - 1]
@@ -338,9 +337,8 @@ class Meta(commands.Cog, name="meta"):
             raise commands.BadArgument(
                 "Your task can not be longer than 100 characters.")
 
-        sql = "INSERT INTO todos VALUES(DEFAULT, $1, $2)"
         values = (ctx.author.id, task)
-        await self.bot.pool.execute(sql, *values)
+        await self.bot.queries.execute("todo_add", *values)
 
         await ctx.send("Successfully added that to your to-do list.")
 
@@ -363,8 +361,7 @@ class Meta(commands.Cog, name="meta"):
 
             values.append((ctx.author.id, task))
 
-        sql = "INSERT INTO todos VALUES(DEFAULT, $1, $2)"
-        await self.bot.pool.executemany(sql, values)
+        await self.bot.queries.executemany("todo_add", values)
 
         await ctx.send("Successfully added those tasks to your to-do list.")
 
@@ -374,8 +371,7 @@ class Meta(commands.Cog, name="meta"):
         Do: `{prefix}to-do remove *` to remove all of your tasks."""
 
         if todo_ids[0] == "*":
-            sql = "DELETE FROM todos WHERE user_id = $1"
-            await self.bot.pool.execute(sql, ctx.author.id)
+            await self.bot.queries.execute("todo_clear", ctx.author.id)
             return await ctx.send("Successfully removed all of your current tasks.")
 
         values = []
@@ -384,8 +380,7 @@ class Meta(commands.Cog, name="meta"):
             _id = await self._get_task_by_enumeration(ctx.author, todo_id)
             values.append((ctx.author.id, _id))
 
-        sql = "DELETE FROM todos WHERE user_id = $1 AND id = $2"
-        await self.bot.pool.executemany(sql, values)
+        await self.bot.queries.executemany("todo_remove", values)
         await ctx.send(f"Successfully deleted {len(todo_ids)} of your tasks.")
 
     @todo.command(name="edit")
@@ -393,9 +388,8 @@ class Meta(commands.Cog, name="meta"):
         """Edits a given task id with a new task description."""
 
         _id = await self._get_task_by_enumeration(ctx.author, task_id)
-        sql = "UPDATE todos SET task = $1 WHERE id = $2"
         values = (task, _id)
-        await self.bot.pool.execute(sql, *values)
+        await self.bot.queries.execute("todo_edit", *values)
 
         await ctx.send("Alright, updated that task for you!")
 
@@ -407,7 +401,7 @@ class Meta(commands.Cog, name="meta"):
         `--size` - Sorts all tasks by size.
         Note: If you try to delete a task that is in one of these orders you may delete another task by accident!"""
 
-        sql = "SELECT * FROM todos WHERE user_id = $1"
+        query = "todo_list"
 
         if flag:
             parser = argparse.ArgumentParser()
@@ -421,11 +415,11 @@ class Meta(commands.Cog, name="meta"):
                     "The only available flags are `--alphabetical` and `--size`.")
 
             if args.alphabetical:
-                sql += " ORDER BY task ASC"
+                query = "todo_list_alphabetical"
             if args.size:
-                sql += " ORDER BY CHAR_LENGTH(task) ASC"
+                query = "todo_list_size"
 
-        results = await self.bot.pool.fetch(sql, ctx.author.id)
+        results = await self.bot.queries.fetch(query, ctx.author.id)
 
         if not results:
             raise utils.NoTodoItems("You have no to-do items I can show you.")
@@ -541,10 +535,8 @@ class Meta(commands.Cog, name="meta"):
 
         developer = [str(self.bot.get_user(x)) for x in self.bot.owner_ids][0]
 
-        guild_count = len(self.bot.guilds)
-
-        member_count = sum(
-            g.member_count for g in self.bot.guilds if not g.unavailable)
+        guild_count = self.bot.guild_total
+        member_count = self.bot.member_total
 
         process = psutil.Process(os.getpid())
         memory_used = process.memory_info().rss / 1024 ** 2
@@ -650,6 +642,7 @@ class Meta(commands.Cog, name="meta"):
             return await ctx.send("I could not convert that emoji.")
 
     @commands.command(aliases=["server"])
+    @utils.needs_members()
     async def serverinfo(self, ctx: utils.CustomContext):
         """Gives you information based on the current server"""
 
@@ -673,8 +666,7 @@ class Meta(commands.Cog, name="meta"):
             if feature in features:
                 guild_features.append(f"✅: {label}")
 
-        human_count = sum(not m.bot for m in ctx.guild.members)
-        bot_count = sum(m.bot for m in ctx.guild.members)
+        human_count, bot_count = self.bot.aggregates.humans_and_bots(ctx.guild)
 
         info = [
             ["Emoji Count", sum(e.available for e in ctx.guild.emojis), True],
@@ -148,9 +148,8 @@ class Misc(commands.Cog, name="misc"):
     @commands.Cog.listener()
     async def on_command(self, ctx: utils.CustomContext):
         self.bot.cmd_usage += 1
-        # if ctx.guild:
-        #     if not ctx.guild.chunked:
-        #         await ctx.guild.chunk()
+        if ctx.guild:
+            self.bot.chunker.touch(ctx.guild)
 
     @commands.command()
     async def status(self, ctx: utils.CustomContext):
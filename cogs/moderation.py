@@ -20,13 +20,13 @@ import humanize
 import asyncpg
 import utils
 import asyncio
+import contextlib
 import logging
 import discord
-import uuid
 import re
 import typing as tp
 from time import time as t
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
 from discord.ext import commands, menus
 
 
@@ -178,8 +178,7 @@ class Moderation(commands.Cog, name="moderation"):
             self.__class__.__name__, logging.INFO)
 
     async def get_warn_by_id(self, user_id: int, index: int):
-        sql = "SELECT * FROM warns WHERE offender_id = $1;"
-        records = await self.bot.pool.fetch(sql, user_id)
+        records = await self.bot.queries.fetch("warn_list", user_id)
 
         try:
             item = records[index - 1]
@@ -191,13 +190,12 @@ class Moderation(commands.Cog, name="moderation"):
 
     @commands.Cog.listener("on_member_join")
     async def persistent_mutes(self, member: discord.Member):
-        is_user_muted = await self.bot.pool.fetchrow("SELECT * FROM guild_mutes WHERE member_id = $1 AND guild_id = $2",
-                                                     member.id, member.guild.id)
+        is_user_muted = await self.bot.queries.fetchrow("mute_get", member.id, member.guild.id)
 
         if not is_user_muted:
             return
 
-        mute_role_id = self.bot.config[member.guild.id]["guild_prefix"]
+        mute_role_id = self.bot.config[member.guild.id]["mute_role_id"]
         mute_role = member.guild.get_role(role_id=mute_role_id)
         await member.add_roles(mute_role, reason="Mute Role Persist")
 
@@ -212,9 +210,8 @@ class Moderation(commands.Cog, name="moderation"):
             raise commands.BadArgument(
                 "The warn reason must not be greater than 255 characters.")
 
-        sql = "INSERT INTO warns VALUES(default, $1, $2, $3, $4, $5);"
         values = (ctx.guild.id, ctx.author.id, user.id, reason, dt.utcnow())
-        await self.bot.pool.execute(sql, *values)
+        await self.bot.queries.execute("warn_add", *values)
 
         await ctx.send(
             f"Successfully warned `{user}` for: {reason}. "
@@ -227,8 +224,7 @@ class Moderation(commands.Cog, name="moderation"):
     async def warns(self, ctx: utils.CustomContext, *, user: discord.Member):
         """Get the current warns of a given user."""
 
-        sql = "SELECT * FROM warns WHERE offender_id = $1;"
-        records = await self.bot.pool.fetch(sql, user.id)
+        records = await self.bot.queries.fetch("warn_list", user.id)
         ret = []
 
         for index, record in enumerate(records, start=1):
@@ -254,29 +250,41 @@ class Moderation(commands.Cog, name="moderation"):
 
         warn_id = await self.get_warn_by_id(user.id, warn_id)
 
-        sql = "DELETE FROM warns WHERE id = $1;"
-        await self.bot.pool.execute(sql, warn_id)
+        await self.bot.queries.execute("warn_remove", warn_id)
         await ctx.send(f"Successfully cleared that warn for `{user}`")
 
-    @commands.command(aliases=["tban"], disabled=True, hidden=True)
+    @commands.command(aliases=["tban"])
     @commands.guild_only()
     @commands.has_permissions(ban_members=True)
     @commands.bot_has_permissions(ban_members=True)
-    async def tempban(self, ctx: utils.CustomContext, user: NotStaffMember, how_long: utils.TimeConverter, *, reason: str):
-        """Tempbans a user for a certain amount of time.
+    async def tempban(self, ctx: utils.CustomContext, user: NotStaffMember, how_long: TimeConverter, *, reason: str):
+        """Tempbans a user for a certain amount of time (e.g. 5m/5h/5d).
         e.g. `{prefix}tempban @kal#1806 5d Doing bad things excessively.`"""
 
+        if len(reason) > 255:
+            raise commands.BadArgument(
+                "The ban reason must not be greater than 255 characters.")
+
+        if how_long < 60:
+            return await ctx.send("You must provide a time that is 1 minute or higher")
+
         format_time = humanize.naturaldelta(how_long)
-        await user.send(
-            f"You were temporarily banned by {ctx.author} for the reason: {reason}. This ban expires in {format_time}"
-        )
+        with contextlib.suppress(discord.Forbidden, discord.HTTPException):
+            await user.send(
+                f"You were temporarily banned by {ctx.author} for the reason: {reason}. This ban expires in {format_time}"
+            )
 
-        sql = "INSERT INTO temp_bans VALUES($1, $2, $3, $4, $5, $6);"
-        values = (str(uuid.uuid4()), ctx.guild.id,
-                  ctx.author.id, user.id, reason, how_long)
-        await self.bot.pool.execute(sql, *values)
+        # The row goes in first so a ban can never be left without anything to lift it.
+        end_time = dt.utcnow() + timedelta(seconds=how_long)
+        row = await self.bot.queries.fetchrow("tempban_add", ctx.guild.id, ctx.author.id, user.id, reason, end_time)
 
-        await user.ban(reason=reason)
+        try:
+            await user.ban(reason=f"{reason} | Responsible User: {ctx.author}")
+        except Exception:
+            await self.bot.queries.execute("tempban_expire", row["id"])
+            raise
+
+        self.bot.timers.schedule("tempban", row)
 
         fmt = f"{user} was banned by {ctx.author} for {format_time} for the reason: {reason}"
         await ctx.send(fmt)
@@ -293,39 +301,26 @@ class Moderation(commands.Cog, name="moderation"):
         if _time < 5:
             return await ctx.send("You must provide a time that is 5 seconds or higher")
 
-        try:
-            mute_role_id = self.bot.config[ctx.guild.id]["mute_role_id"]
-            mute_role = ctx.guild.get_role(mute_role_id)
-        except KeyError:
+        mute_role = ctx.guild.get_role(self.bot.config[ctx.guild.id]["mute_role_id"])
+
+        if mute_role is None:
             def predicate(r): return r.name.lower() == "muted"
 
             mute_role = discord.utils.find(
                 predicate=predicate, seq=ctx.guild.roles)
 
-            self.bot.config[ctx.guild.id]["mute_role_id"] = mute_role.id
-
-            await self.bot.pool.execute("UPDATE guild_settings SET mute_role_id = $1 WHERE guild_id = $2",
-                                        mute_role.id, ctx.guild.id)
-
         if mute_role is None:
             mute_role = await ctx.guild.create_role(name="Muted")
 
             await ctx.channel.set_permissions(mute_role, send_messages=False)
 
-            await self.bot.pool.execute("UPDATE guild_settings SET mute_role_id = $1 WHERE guild_id = $2",
-                                        mute_role.id, ctx.guild.id)
-
-            self.bot.config[ctx.guild.id]["mute_role_id"] = mute_role.id
+        self.bot.config.set(ctx.guild.id, "mute_role_id", mute_role.id)
 
         await user.add_roles(mute_role, reason=f"Muted by: {ctx.author}")
-        await utils.set_mute(bot=self.bot,
-                             guild_id=ctx.guild.id,
-                             user_id=user.id,
-                             _time=_time)
 
         end_time = int(t() + _time)
-        await self.bot.pool.execute("INSERT INTO guild_mutes VALUES($1, $2, $3)",
-                                    ctx.guild.id, user.id, end_time)
+        await self.bot.queries.execute("mute_add", ctx.guild.id, user.id, end_time)
+        self.bot.timers.schedule("mute", {"guild_id": ctx.guild.id, "member_id": user.id, "end_time": end_time})
 
         timestamp = t() + _time
         dt_obj = dt.fromtimestamp(timestamp)
@@ -346,23 +341,23 @@ class Moderation(commands.Cog, name="moderation"):
     async def unmute(self, ctx: utils.CustomContext, user: discord.Member):
         """Unmutes a given user if they have the guilds set muted role."""
 
-        try:
-            mute_role_id = self.bot.config[ctx.guild.id]["mute_role_id"]
-            mute_role = ctx.guild.get_role(mute_role_id)
-        except KeyError:
+        mute_role = ctx.guild.get_role(self.bot.config[ctx.guild.id]["mute_role_id"])
+
+        if mute_role is None:
             def predicate(r): return r.name.lower() == "muted"
             mute_role = discord.utils.find(
                 predicate=predicate, seq=ctx.guild.roles)
 
-            self.bot.config[ctx.guild.id]["mute_role_id"] = mute_role.id
-
-            await self.bot.pool.execute("UPDATE guild_settings SET mute_role_id = $1 WHERE guild_id = $2",
-                                        mute_role.id, ctx.guild.id)
+            if mute_role is not None:
+                self.bot.config.set(ctx.guild.id, "mute_role_id", mute_role.id)
 
         if mute_role not in user.roles:
             return await ctx.send("That user does not have the guilds set muted role.")
 
         await user.remove_roles(mute_role, reason=f"Unmuted by: {ctx.author}")
+
+        await self.bot.queries.execute("mute_remove", ctx.guild.id, user.id)
+        self.bot.timers.cancel("mute", (ctx.guild.id, user.id))
         embed = self.bot.embed(ctx)
         embed.description = f"{ctx.author.mention} ({ctx.author}) unmuted {user.mention} ({user})"
 
@@ -374,8 +369,7 @@ class Moderation(commands.Cog, name="moderation"):
     async def moderations(self, ctx: utils.CustomContext):
         """Gets all of the current active mutes."""
 
-        mutes = await self.bot.pool.fetch("SELECT * FROM guild_mutes WHERE guild_id = $1",
-                                          ctx.guild.id)
+        mutes = await self.bot.queries.fetch("mute_list", ctx.guild.id)
 
         fmt = []
 
@@ -440,6 +434,11 @@ class Moderation(commands.Cog, name="moderation"):
             user,
             reason=f"Responsible User: {ctx.author}",
         )
+
+        temp_bans = await self.bot.queries.fetch("tempban_remove", ctx.guild.id, user.id)
+        for temp_ban in temp_bans:
+            self.bot.timers.cancel("tempban", (temp_ban["id"],))
+
         await ctx.thumbsup()
 
     @commands.command()
@@ -476,6 +475,7 @@ class Moderation(commands.Cog, name="moderation"):
     @commands.guild_only()
     @commands.has_permissions(manage_messages=True)
     @commands.bot_has_permissions(send_messages=True)
+    @utils.needs_members()
     async def members(self, ctx: utils.CustomContext, *, role: Role):
         """Check the list of members in a certain role.
         Permissions needed: `Manage Messages`"""
@@ -622,6 +622,7 @@ class Moderation(commands.Cog, name="moderation"):
     @commands.guild_only()
     @commands.has_permissions(manage_roles=True)
     @commands.bot_has_permissions(send_messages=True)
+    @utils.needs_members()
     async def role_info(self, ctx: utils.CustomContext, *roles: Role):
         """Get information on a given role."""
 
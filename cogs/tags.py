@@ -16,12 +16,16 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import bisect
+import collections
+import heapq
 import uuid
 import logging
 import discord
 import utils
 import typing as t
-from discord.ext import commands, menus
+from discord.ext import commands, menus, tasks
 
 
 class TagsListPageSource(menus.ListPageSource):
@@ -38,9 +42,214 @@ class TagsListPageSource(menus.ListPageSource):
         return embed
 
 
+class TagCache:
+    """An LRU of the most recently used tags in the most recently active guilds,
+    keyed by the lowercase title. Only the tag itself is kept, not its uses."""
+
+    def __init__(self, *, max_guilds: int = 500, per_guild: int = 100):
+        self.max_guilds = max_guilds
+        self.per_guild = per_guild
+
+        self._guilds: t.OrderedDict[int, t.OrderedDict[str, dict]] = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(tags) for tags in self._guilds.values())
+
+    def get(self, guild_id: int, title: str) -> t.Optional[dict]:
+        try:
+            tags = self._guilds[guild_id]
+            tag = tags[title.lower()]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self._guilds.move_to_end(guild_id)
+        tags.move_to_end(title.lower())
+        self.hits += 1
+        return tag
+
+    def put(self, guild_id: int, tag: dict):
+        try:
+            tags = self._guilds[guild_id]
+        except KeyError:
+            tags = self._guilds[guild_id] = collections.OrderedDict()
+            if len(self._guilds) > self.max_guilds:
+                self._guilds.popitem(last=False)
+
+        tags[tag["title"].lower()] = tag
+        if len(tags) > self.per_guild:
+            tags.popitem(last=False)
+
+    def invalidate(self, guild_id: int, title: str):
+        tags = self._guilds.get(guild_id)
+        if tags is not None:
+            tags.pop(title.lower(), None)
+
+
+def trigrams(text: str) -> t.Set[str]:
+    """The trigrams of text padded like pg_trgm does, so short titles still have some."""
+
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TagIndex:
+    """Every tag title of one guild, indexed for prefix and fuzzy search."""
+
+    def __init__(self, titles: t.Iterable[str] = ()):
+        self._titles: t.Dict[str, str] = {}
+        self._sorted: t.List[str] = []
+        self._trigrams: t.DefaultDict[str, t.Set[str]] = collections.defaultdict(set)
+        self._gram_counts: t.Dict[str, int] = {}
+
+        for title in titles:
+            self.add(title)
+
+    def __len__(self):
+        return len(self._titles)
+
+    def add(self, title: str):
+        key = title.lower()
+        if key in self._titles:
+            return
+
+        self._titles[key] = title
+        bisect.insort(self._sorted, key)
+
+        grams = trigrams(key)
+        self._gram_counts[key] = len(grams)
+        for gram in grams:
+            self._trigrams[gram].add(key)
+
+    def remove(self, title: str):
+        key = title.lower()
+        if self._titles.pop(key, None) is None:
+            return
+
+        del self._sorted[bisect.bisect_left(self._sorted, key)]
+        del self._gram_counts[key]
+        for gram in trigrams(key):
+            keys = self._trigrams[gram]
+            keys.discard(key)
+            if not keys:
+                del self._trigrams[gram]
+
+    def search(self, query: str, *, limit: int = 10, threshold: float = 0.3) -> t.List[str]:
+        """Titles starting with the query come first, shortest first, then titles
+        whose trigrams are similar enough, most similar first."""
+
+        query = query.lower()
+        results = []
+
+        start = bisect.bisect_left(self._sorted, query)
+        for key in self._sorted[start:start + limit]:
+            if not key.startswith(query):
+                break
+            results.append(key)
+        results.sort(key=len)
+
+        if len(results) < limit:
+            wanted = trigrams(query)
+            shared = collections.Counter()
+            for gram in wanted:
+                shared.update(self._trigrams.get(gram, ()))
+
+            # The union is at least as big as the query, so anything sharing fewer
+            # trigrams than this can't reach the threshold and isn't scored at all.
+            minimum = threshold * len(wanted)
+            found = set(results)
+            counts = self._gram_counts
+
+            candidates = (
+                (common / (len(wanted) + counts[key] - common), key)
+                for key, common in shared.items() if common >= minimum and key not in found
+            )
+            results.extend(key for score, key in heapq.nlargest(limit - len(results), candidates)
+                           if score >= threshold)
+
+        return [self._titles[key] for key in results]
+
+
+class TagSearch:
+    """The tag indexes of the most recently searched guilds. An index is built
+    from the database the first time its guild is searched and kept up to date
+    as tags are created and removed."""
+
+    def __init__(self, queries: utils.QueryRegistry, *, max_guilds: int = 200):
+        self.queries = queries
+        self.max_guilds = max_guilds
+
+        self._indexes: t.OrderedDict[int, TagIndex] = collections.OrderedDict()
+        self._building: t.Dict[int, asyncio.Future] = {}
+        self._changes: t.Dict[int, t.List[t.Tuple[bool, str]]] = {}
+
+    async def _build(self, guild_id: int) -> TagIndex:
+        # Tags created or removed while the titles are being read may or may not be
+        # in the result, so they're noted and applied again once it's in.
+        self._changes[guild_id] = []
+        try:
+            records = await self.queries.fetch('tag_titles', guild_id)
+        finally:
+            changes = self._changes.pop(guild_id)
+
+        index = TagIndex(record['title'] for record in records)
+        for added, title in changes:
+            if added:
+                index.add(title)
+            else:
+                index.remove(title)
+
+        self._indexes[guild_id] = index
+        if len(self._indexes) > self.max_guilds:
+            self._indexes.popitem(last=False)
+
+        return index
+
+    async def index(self, guild_id: int) -> TagIndex:
+        try:
+            index = self._indexes[guild_id]
+        except KeyError:
+            pass
+        else:
+            self._indexes.move_to_end(guild_id)
+            return index
+
+        # Searches that come in while the index is building wait on the same build.
+        try:
+            future = self._building[guild_id]
+        except KeyError:
+            future = self._building[guild_id] = asyncio.ensure_future(self._build(guild_id))
+            future.add_done_callback(lambda _: self._building.pop(guild_id, None))
+
+        return await asyncio.shield(future)
+
+    async def search(self, guild_id: int, query: str, *, limit: int = 10) -> t.List[str]:
+        return (await self.index(guild_id)).search(query, limit=limit)
+
+    def added(self, guild_id: int, title: str):
+        index = self._indexes.get(guild_id)
+        if index is not None:
+            index.add(title)
+        elif guild_id in self._changes:
+            self._changes[guild_id].append((True, title))
+
+    def removed(self, guild_id: int, title: str):
+        index = self._indexes.get(guild_id)
+        if index is not None:
+            index.remove(title)
+        elif guild_id in self._changes:
+            self._changes[guild_id].append((False, title))
+
+    def invalidate(self, guild_id: int):
+        self._indexes.pop(guild_id, None)
+
+
 class TagTitle(commands.Converter):
     async def convert(self, ctx: utils.CustomContext, argument: str):
-        reserved_names: list = ['create', 'make', 'add', 'list', 'delete']
+        reserved_names: list = ['create', 'make', 'add', 'list', 'delete', 'search']
         if len(argument) > 32:
             raise commands.BadArgument(
                 'The title must not be longer than 32 characters.')
@@ -58,6 +267,54 @@ class Tags(commands.Cog, name="tags"):
         self.logger = utils.create_logger(
             self.__class__.__name__, logging.INFO)
 
+        self.cache = TagCache()
+        self.search_index = TagSearch(self.bot.queries)
+        self.pending_uses: t.Counter = collections.Counter()
+        self._uses_lock = asyncio.Lock()
+        self.flush_uses.start()
+
+    def cog_unload(self):
+        # Stopped rather than cancelled so a flush that's already running isn't cut short,
+        # whatever came in since is written by the last flush below. On shutdown close
+        # has already flushed, so there's nothing left for it.
+        self.flush_uses.stop()
+        self.bot.loop.create_task(self.flush_uses.coro(self))
+
+    async def close(self):
+        """Writes the uses that haven't been flushed yet, called by the bot before the pool closes."""
+
+        self.flush_uses.stop()
+        await self.flush_uses.coro(self)
+
+    @tasks.loop(seconds=30)
+    async def flush_uses(self):
+        """Writes the uses counted since the last flush in one batch."""
+
+        # Taken even with nothing pending, so close waits for a flush that's already writing.
+        async with self._uses_lock:
+            if not self.pending_uses:
+                return
+
+            pending, self.pending_uses = self.pending_uses, collections.Counter()
+            try:
+                await self.bot.queries.executemany('tag_add_uses', pending.items())
+            except Exception as e:
+                self.pending_uses.update(pending)
+                self.logger.error(f'Failed to flush tag uses: {type(e).__name__} - {e}')
+
+    async def get_tag(self, guild_id: int, title: str) -> t.Optional[dict]:
+        tag = self.cache.get(guild_id, title)
+        if tag is not None:
+            return tag
+
+        record = await self.bot.queries.fetchrow('tag_get', guild_id, title)
+        if record is None:
+            return None
+
+        tag = dict(record)
+        self.cache.put(guild_id, tag)
+        return tag
+
     async def cog_check(self, ctx: utils.CustomContext):
         return hasattr(ctx, 'guild')
 
@@ -72,12 +329,17 @@ class Tags(commands.Cog, name="tags"):
         if not tag:
             return await ctx.send_help(ctx.command)
 
-        tag = await self.bot.pool.fetchrow('SELECT * FROM tags WHERE title = $1', tag)
+        found = await self.get_tag(ctx.guild.id, tag)
 
-        if tag is None:
-            raise commands.BadArgument('I could not find that tag.')
+        if found is None:
+            fmt = 'I could not find that tag.'
+            suggestions = await self.search_index.search(ctx.guild.id, tag, limit=3)
+            if suggestions:
+                fmt += ' Did you mean: ' + ', '.join(f'`{title}`' for title in suggestions) + '?'
+            raise commands.BadArgument(fmt)
 
-        await ctx.send(tag['content'])
+        self.pending_uses[found['id']] += 1
+        await ctx.send(found['content'])
 
     @tag.command(name="list")
     async def tag_list(self, ctx: utils.CustomContext, *, user: t.Optional[discord.Member]):
@@ -85,8 +347,7 @@ class Tags(commands.Cog, name="tags"):
         Example: `{prefix}tag list @kal#1806`"""
 
         user: discord.Member = user or ctx.author
-        all_user_tags = await self.bot.pool.fetch('SELECT title FROM tags WHERE author = $1 AND guild = $2',
-                                                  user.id, ctx.guild.id)
+        all_user_tags = await self.bot.queries.fetch('tag_list', user.id, ctx.guild.id)
 
         if not all_user_tags:
             fmt: str = f'`{user.name}` has no tags to display.'
@@ -101,6 +362,22 @@ class Tags(commands.Cog, name="tags"):
 
         await menu.start(ctx)
 
+    @tag.command(name='search')
+    async def tag_search(self, ctx: utils.CustomContext, *, query: str):
+        """Searches this servers tags by name, closest matches first.
+        Example: `{prefix}tag search kal`"""
+
+        results = await self.search_index.search(ctx.guild.id, query)
+
+        if not results:
+            return await ctx.send('No tags matched that search.')
+
+        embed = self.bot.embed(ctx)
+        embed.title = f'Tags matching {query}'[:256]
+        embed.description = '\n'.join(f'`{i + 1}`. {title}' for i, title in enumerate(results))
+
+        await ctx.send(embed=embed)
+
     @tag.command(name='create', aliases=['make', 'add'])
     async def tag_create(self,
                          ctx: utils.CustomContext,
@@ -110,18 +387,15 @@ class Tags(commands.Cog, name="tags"):
         Example: `{prefix}tag create "kal is the best" this is a very true statement.`"""
 
         tag_id = uuid.uuid4()
-        check_sql = 'SELECT COUNT(*) FROM tags WHERE title = $1'
-        count = await self.bot.pool.fetchval(check_sql, tag_name)
+        values = (str(tag_id), ctx.guild.id,
+                  ctx.author.id, tag_name, tag_content, 0)
 
-        if count > 0:
+        if await self.bot.queries.fetchval('tag_add', *values) is None:
             raise commands.BadArgument(
                 'There is already a tag with that name.')
 
-        sql = 'INSERT INTO tags VALUES($1, $2, $3, $4, $5, $6)'
-        values = (str(tag_id), ctx.guild.id,
-                  ctx.author.id, tag_name, tag_content, 0)
-        await self.bot.pool.execute(sql, *values)
-
+        self.cache.invalidate(ctx.guild.id, tag_name)
+        self.search_index.added(ctx.guild.id, tag_name)
         await ctx.send('Successfully added that tag.')
 
     @tag.command(name='remove', aliases=['delete', 'del'])
@@ -129,18 +403,21 @@ class Tags(commands.Cog, name="tags"):
         """Removes a given tag by it's name.
         You can only remove it if you're server staff (Manage Messages) or you own the tag."""
 
-        tag = await self.bot.pool.fetchrow('SELECT * FROM tags WHERE title = $1', tag_name)
+        tag = await self.get_tag(ctx.guild.id, tag_name)
 
         if tag is None:
             raise commands.BadArgument(
                 'There is no tag found that has that name.')
 
-        if not tag['author'] == ctx.author.id or not self._is_privileged(ctx):
+        if not tag['author'] == ctx.author.id and not self._is_privileged(ctx):
             raise utils.NotTagOwner(
                 'You do not have sufficient permissions to remove this tag.')
 
-        sql = 'DELETE FROM tags WHERE id = $1'
-        await self.bot.pool.execute(sql, tag['id'])
+        await self.bot.queries.execute('tag_remove', tag['id'])
+
+        self.cache.invalidate(ctx.guild.id, tag['title'])
+        self.search_index.removed(ctx.guild.id, tag['title'])
+        self.pending_uses.pop(tag['id'], None)
 
         fmt = 'Successfully removed that tag.'
         await ctx.send(fmt)
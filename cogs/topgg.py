@@ -40,7 +40,7 @@ class TopGG(commands.Cog):
             return
 
         try:
-            server_count = len(self.bot.guilds)
+            server_count = self.bot.guild_total
             url = "https://top.gg/api/bots/706530005169209386/stats"
             headers = {
                 "Authorization": self.dbl_token
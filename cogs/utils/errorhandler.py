@@ -237,6 +237,16 @@ class ErrorHandler(Cog):
                 ),
             )
 
+        # The render engine is full, a render took too long or it broke the pool
+        elif isinstance(error, (utils.RenderBusy, utils.RenderTimeout, utils.RenderFailed)):
+            return await self.send_to_ctx_or_author(
+                ctx,
+                embed=setup_embed(
+                    description=f"{error}"
+                ),
+                delete_after=5.0,
+            )
+
         prettify_exceptions.DefaultFormatter().theme['_ansi_enabled'] = False
         tb = (
             ''.join(prettify_exceptions.DefaultFormatter().format_exception(
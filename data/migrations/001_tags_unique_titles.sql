@@ -0,0 +1,23 @@
+-- Makes tag titles unique per guild regardless of case, for databases whose
+-- tags table predates tags_guild_title_idx. Run once, by hand, before the
+-- tags section of schema.sql.
+--
+-- Nothing is deleted. Of every group of titles that only differ by case, the
+-- most used keeps its title and the rest get a numbered suffix. Every renamed
+-- tag is returned so it can be checked, and if a new title still collides the
+-- index fails and the whole thing is rolled back.
+
+BEGIN;
+
+UPDATE tags
+SET title = left(tags.title, 29) || '-' || ranked.position
+FROM (
+    SELECT id, row_number() OVER (PARTITION BY guild, lower(title) ORDER BY uses DESC NULLS LAST, id) AS position
+    FROM tags
+) AS ranked
+WHERE tags.id = ranked.id AND ranked.position > 1
+RETURNING tags.guild, tags.id, tags.author, tags.title;
+
+CREATE UNIQUE INDEX IF NOT EXISTS tags_guild_title_idx ON tags (guild, lower(title));
+
+COMMIT;
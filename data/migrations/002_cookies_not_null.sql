@@ -0,0 +1,13 @@
+-- Gives every cookies row a score, for databases made while the column was
+-- nullable. Run once, by hand. Rows without a score are returned first.
+
+BEGIN;
+
+UPDATE cookies SET cookies = 0 WHERE cookies IS NULL RETURNING user_id;
+
+ALTER TABLE cookies ALTER COLUMN cookies SET DEFAULT 0;
+ALTER TABLE cookies ALTER COLUMN cookies SET NOT NULL;
+
+DROP INDEX IF EXISTS cookies_cookies_idx;
+
+COMMIT;
@@ -21,7 +21,7 @@ CREATE TABLE giveaways (
 
 CREATE TABLE cookies (
     user_id BIGINT PRIMARY KEY,
-    cookies INT
+    cookies INT NOT NULL DEFAULT 0
 );
 
 CREATE TABLE blacklist (
@@ -57,4 +57,21 @@ CREATE TABLE warns (
     offender_id BIGINT,
     reason VARCHAR(255),
     time_warned TIMESTAMP
-);
\ No newline at end of file
+);
+
+CREATE INDEX IF NOT EXISTS guild_mutes_end_time_idx ON guild_mutes (end_time);
+CREATE INDEX IF NOT EXISTS giveaways_ends_at_idx ON giveaways (ends_at);
+CREATE INDEX IF NOT EXISTS temp_bans_end_time_idx ON temp_bans (end_time);
+
+CREATE TABLE IF NOT EXISTS tags (
+    id UUID PRIMARY KEY,
+    guild BIGINT NOT NULL,
+    author BIGINT NOT NULL,
+    title VARCHAR(32) NOT NULL,
+    content TEXT NOT NULL,
+    uses INT DEFAULT 0
+);
+
+-- Databases made before this index existed need data/migrations/001_tags_unique_titles.sql first.
+CREATE UNIQUE INDEX IF NOT EXISTS tags_guild_title_idx ON tags (guild, lower(title));
+CREATE INDEX IF NOT EXISTS tags_guild_author_idx ON tags (guild, author);
@@ -62,6 +62,7 @@ cogs = [
     "cogs.management",
     "cogs.moderation",
     "cogs.fun",
+    "cogs.tags",
     "cogs.imagemanipulation",
     "cogs.misc",
     "cogs.debug",
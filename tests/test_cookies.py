@@ -0,0 +1,44 @@
+from cogs.fun import CookieLeaderboard
+
+
+def _board(scores: dict) -> CookieLeaderboard:
+    board = CookieLeaderboard()
+    board.load({"user_id": user_id, "cookies": cookies} for user_id, cookies in scores.items())
+    return board
+
+
+def test_load_ranks_unsorted_rows():
+    board = _board({1: 5, 2: 20, 3: 10})
+
+    assert len(board) == 3
+    assert board.top(2) == [(2, 20), (3, 10)]
+    assert board.rank(1) == (3, 5)
+
+
+def test_load_treats_missing_scores_as_zero():
+    board = _board({1: None, 2: 3})
+
+    assert board.top(10) == [(2, 3), (1, 0)]
+    assert board.rank(1) == (2, 0)
+
+
+def test_add_moves_users_up_the_board():
+    board = _board({1: 5, 2: 20})
+
+    board.add(1, 16)
+    board.add(3)
+
+    assert board.top(10) == [(1, 21), (2, 20), (3, 1)]
+    assert board.rank(2) == (2, 20)
+    assert board.rank(3) == (3, 1)
+
+
+def test_ties_are_ranked_by_user_id():
+    board = _board({2: 5, 1: 5})
+
+    assert board.top(2) == [(1, 5), (2, 5)]
+    assert board.rank(2) == (2, 5)
+
+
+def test_rank_of_users_without_cookies():
+    assert _board({1: 5}).rank(2) is None
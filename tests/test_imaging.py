@@ -0,0 +1,129 @@
+from io import BytesIO
+import pytest
+from PIL import Image, ImageSequence
+from utils.imaging import (count_gif_frames, encode_output, is_animated_gif, probe_size, sniff_format, split_gif,
+                           stitch_gifs)
+
+
+def _encode(fmt: str, size=(123, 45), **kwargs) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("fmt", ["png", "gif", "jpeg", "webp"])
+def test_probe_size_reads_the_header(fmt):
+    assert probe_size(_encode(fmt)) == (123, 45)
+
+
+def test_probe_size_handles_progressive_jpeg():
+    assert probe_size(_encode("jpeg", progressive=True)) == (123, 45)
+
+
+def test_probe_size_handles_lossless_webp():
+    assert probe_size(_encode("webp", lossless=True)) == (123, 45)
+
+
+def test_probe_size_only_needs_the_header():
+    data = _encode("png")
+    assert probe_size(data[:24]) == (123, 45)
+
+
+@pytest.mark.parametrize("data", [b"", b"not an image", b"\x89PNG\r\n\x1a\n", b"\xff\xd8\xff"])
+def test_probe_size_gives_up_on_unknown_or_truncated_data(data):
+    assert probe_size(data) is None
+
+
+@pytest.mark.parametrize("fmt, expected", [("png", "png"), ("gif", "gif"), ("jpeg", "jpg"), ("webp", "webp")])
+def test_sniff_format(fmt, expected):
+    assert sniff_format(_encode(fmt)) == expected
+
+
+@pytest.mark.parametrize("data", [b"", b"not an image", b"RIFF\x00\x00\x00\x00WAVE"])
+def test_sniff_format_gives_up_on_unknown_data(data):
+    assert sniff_format(data) is None
+
+
+def test_encode_output_leaves_small_images_alone():
+    data = _encode("png")
+    assert encode_output(data, len(data)) is data
+
+
+def test_encode_output_picks_jpeg_for_opaque_photos():
+    image = Image.effect_noise((256, 256), 64).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, "png")
+    data = buffer.getvalue()
+
+    encoded = encode_output(data, len(data) // 2)
+
+    assert sniff_format(encoded) == "jpg"
+    assert len(encoded) < len(data)
+
+
+def _animated_gif(frames: int, **kwargs) -> bytes:
+    images = [Image.new("RGB", (32, 32), (index * 20 % 256, 0, 0)) for index in range(frames)]
+    buffer = BytesIO()
+    images[0].save(buffer, "gif", save_all=True, append_images=images[1:], duration=50, loop=0, **kwargs)
+    return buffer.getvalue()
+
+
+def _decoded(data: bytes) -> list:
+    with Image.open(BytesIO(data)) as image:
+        return [frame.convert("RGBA").tobytes() for frame in ImageSequence.Iterator(image)]
+
+
+def test_count_gif_frames():
+    data = _animated_gif(5)
+
+    assert count_gif_frames(data) == 5
+    assert count_gif_frames(data, stop_at=2) == 2
+    assert is_animated_gif(data)
+    assert not is_animated_gif(_encode("gif"))
+    assert count_gif_frames(_encode("png")) == 0
+
+
+def test_count_gif_frames_counts_what_it_can_of_a_truncated_gif():
+    data = _animated_gif(5)
+    assert 0 < count_gif_frames(data[:len(data) // 2]) < 5
+
+
+def test_split_gif_keeps_every_frame():
+    data = _animated_gif(10, disposal=2)
+    parts = split_gif(data, 3)
+
+    assert [count_gif_frames(part) for part in parts] == [3, 3, 3, 1]
+    assert sum((_decoded(part) for part in parts), []) == _decoded(data)
+
+
+def test_split_gif_only_cuts_on_frames_that_redraw_everything():
+    # Pillow marks the pixels a frame shares with the one before as transparent, so
+    # every frame after the first depends on the last and the GIF can't be cut.
+    data = _animated_gif(6)
+
+    parts = split_gif(data, 2)
+
+    assert len(parts) == 1
+    assert _decoded(parts[0]) == _decoded(data)
+
+
+def test_split_gif_cuts_after_the_chunk_size_once_it_can():
+    images = [Image.new("RGB", (32, 32), color) for color in ("red", "blue", "green")]
+    buffer = BytesIO()
+    images[0].save(buffer, "gif", save_all=True, append_images=images[1:], duration=50, transparency=None)
+    data = buffer.getvalue()
+
+    parts = split_gif(data, 1)
+
+    assert len(parts) > 1
+    assert sum((_decoded(part) for part in parts), []) == _decoded(data)
+
+
+def test_stitch_gifs_joins_split_gifs_back_together():
+    data = _animated_gif(7, disposal=2)
+    stitched = stitch_gifs(split_gif(data, 2), loop=3)
+
+    assert count_gif_frames(stitched) == 7
+    assert _decoded(stitched) == _decoded(data)
+    with Image.open(BytesIO(stitched)) as image:
+        assert image.info["loop"] == 3
@@ -0,0 +1,43 @@
+import pytest
+from utils.metrics import Histogram
+
+
+def test_empty_histogram():
+    histogram = Histogram()
+
+    assert histogram.mean == 0.0
+    assert histogram.quantile(0.5) == 0.0
+    assert histogram.summary() == {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+
+def test_observations_land_in_their_bucket():
+    histogram = Histogram(buckets=(1, 2, 3))
+
+    for value in (0.5, 1, 1.5, 3, 10):
+        histogram.observe(value)
+
+    # Bucket bounds are inclusive, anything past the last one goes in the overflow bucket.
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(16.0)
+    assert histogram.max == 10
+
+
+def test_quantiles_are_the_upper_bound_of_their_bucket():
+    histogram = Histogram(buckets=(1, 2, 3))
+
+    for value in [0.5] * 50 + [1.5] * 45 + [2.5] * 4 + [7]:
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.95) == 2
+    assert histogram.quantile(0.99) == 3
+    assert histogram.quantile(1.0) == 7
+
+
+def test_quantiles_never_exceed_the_largest_observation():
+    histogram = Histogram(buckets=(1, 10))
+    histogram.observe(2)
+
+    assert histogram.quantile(0.5) == 2
+    assert histogram.summary()["mean"] == 2
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+from utils.prefixes import PrefixMatcher
+
+
+BOT_ID = 1
+OWNER_ID = 2
+
+
+def _bot(config: dict) -> SimpleNamespace:
+    return SimpleNamespace(user=SimpleNamespace(id=BOT_ID), config=config, owner_ids={OWNER_ID})
+
+
+def _message(content: str, guild_id: int = None, author_id: int = 3) -> SimpleNamespace:
+    guild = SimpleNamespace(id=guild_id) if guild_id is not None else None
+    return SimpleNamespace(content=content, guild=guild, author=SimpleNamespace(id=author_id))
+
+
+def test_match_uses_the_guild_prefix():
+    matcher = PrefixMatcher(_bot({10: {"guild_prefix": "?"}}))
+
+    assert matcher.match(_message("?ping", 10)) == "?"
+    assert matcher.match(_message("tb!ping", 10)) is None
+    assert matcher.match(_message("tb!ping")) == "tb!"
+
+
+def test_match_accepts_mentions():
+    matcher = PrefixMatcher(_bot({10: {"guild_prefix": "?"}}))
+
+    assert matcher.match(_message(f"<@{BOT_ID}> ping", 10)) == f"<@{BOT_ID}> "
+    assert matcher.match(_message(f"<@!{BOT_ID}> ping", 10)) == f"<@!{BOT_ID}> "
+
+
+def test_match_prefers_the_longest_prefix():
+    matcher = PrefixMatcher(_bot({10: {"guild_prefix": "<@1> x"}}))
+    assert matcher.match(_message("<@1> xping", 10)) == "<@1> x"
+
+
+def test_owners_can_skip_the_prefix_for_dev_commands():
+    matcher = PrefixMatcher(_bot({}))
+
+    assert matcher.match(_message("jsk py 1", author_id=OWNER_ID)) == ""
+    assert matcher.match(_message("jsk py 1")) is None
+    assert "" in matcher.prefixes(_message("dev sync", author_id=OWNER_ID))
+    assert "" not in matcher.prefixes(_message("ping", author_id=OWNER_ID))
+
+
+def test_guilds_without_a_loaded_config_get_the_default_uncached():
+    config = {}
+    matcher = PrefixMatcher(_bot(config))
+
+    assert matcher.match(_message("tb!ping", 10)) == "tb!"
+    assert len(matcher) == 0
+
+    config[10] = {"guild_prefix": "?"}
+    assert matcher.match(_message("?ping", 10)) == "?"
+    assert len(matcher) == 1
+
+
+def test_invalidate_picks_up_prefix_changes():
+    config = {10: {"guild_prefix": "?"}, 20: {"guild_prefix": "!"}}
+    matcher = PrefixMatcher(_bot(config))
+    matcher.match(_message("?ping", 10))
+    matcher.match(_message("!ping", 20))
+
+    config[10] = {"guild_prefix": "$"}
+    assert matcher.match(_message("$ping", 10)) is None
+
+    matcher.invalidate(10)
+    assert matcher.match(_message("$ping", 10)) == "$"
+    assert len(matcher) == 2
+
+    matcher.invalidate()
+    assert len(matcher) == 0
@@ -0,0 +1,87 @@
+import asyncio
+import os
+from utils.render import RenderCache
+
+
+def _run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def _cache(**kwargs) -> RenderCache:
+    return RenderCache(loop=asyncio.get_event_loop(), **kwargs)
+
+
+def _render(data: bytes) -> bytes:
+    return data
+
+
+def test_key_is_content_addressed():
+    first = RenderCache.make_key(_render, b"avatar", 2)
+    again = RenderCache.make_key(_render, bytearray(b"avatar"), 2)
+
+    assert first == again
+    assert first != RenderCache.make_key(_render, b"other", 2)
+    assert first != RenderCache.make_key(_render, b"avatar", 3)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = _cache(memory_size=10)
+
+    _run(cache.put("a", b"aaaa"))
+    _run(cache.put("b", b"bbbb"))
+    assert _run(cache.get("a")) == b"aaaa"  # b is now the oldest.
+
+    _run(cache.put("c", b"cccc"))
+
+    assert _run(cache.get("b")) is None
+    assert _run(cache.get("a")) == b"aaaa"
+    assert cache.memory_used == 8
+    assert (cache.memory_hits, cache.misses) == (2, 1)
+
+
+def test_memory_tier_skips_values_larger_than_it():
+    cache = _cache(memory_size=4)
+    _run(cache.put("a", b"too large"))
+
+    assert len(cache) == 0
+    assert cache.memory_used == 0
+
+
+def test_disk_tier_serves_what_memory_dropped(tmp_path):
+    cache = _cache(directory=str(tmp_path))
+    _run(cache.put("a", b"aaaa"))
+    cache.clear()
+
+    assert _run(cache.get("a")) == b"aaaa"
+    assert cache.disk_hits == 1
+    assert cache.disk_used == 4
+
+
+def test_disk_tier_evicts_and_removes_files(tmp_path):
+    cache = _cache(directory=str(tmp_path), disk_size=10)
+    _run(cache.put("a", b"aaaa"))
+    _run(cache.put("b", b"bbbb"))
+    _run(cache.put("c", b"cccc"))
+
+    assert cache.disk_used == 8
+    assert sorted(os.listdir(tmp_path)) == ["b", "c"]
+
+
+def test_overlapping_puts_of_one_key_count_once(tmp_path):
+    cache = _cache(directory=str(tmp_path))
+
+    async def put_twice():
+        await asyncio.gather(cache.put("a", b"aaaa"), cache.put("a", b"aaaa"))
+
+    _run(put_twice())
+    assert cache.disk_used == 4
+
+
+def test_disk_index_is_loaded_on_start(tmp_path):
+    (tmp_path / "a").write_bytes(b"aaaa")
+    (tmp_path / "half-written.tmp").write_bytes(b"xx")
+
+    cache = _cache(directory=str(tmp_path))
+
+    assert cache.disk_used == 4
+    assert _run(cache.get("a")) == b"aaaa"
@@ -0,0 +1,98 @@
+import asyncio
+from cogs.tags import TagIndex, TagSearch, trigrams
+
+
+def _run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def test_trigrams_are_padded_like_pg_trgm():
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+    assert trigrams("") == {"   "}
+
+
+def test_prefix_matches_come_first_shortest_first():
+    index = TagIndex(["Python-Help", "python", "pythonic", "pyth0n"])
+    assert index.search("PYTHON")[:3] == ["python", "pythonic", "Python-Help"]
+
+
+def test_search_finds_close_titles():
+    index = TagIndex(["javascript", "java", "rust", "python"])
+
+    assert index.search("javscript") == ["javascript"]
+    assert index.search("nothing like it") == []
+
+
+def test_search_respects_the_limit():
+    index = TagIndex([f"tag{number}" for number in range(20)])
+    assert len(index.search("tag", limit=5)) == 5
+
+
+def test_add_and_remove_keep_the_index_in_step():
+    index = TagIndex(["rules"])
+    index.add("Rules")  # Same title in another case, not a new tag.
+    index.add("faq")
+    assert len(index) == 2
+
+    index.remove("RULES")
+    assert len(index) == 1
+    assert index.search("rules") == []
+    assert index.search("faq") == ["faq"]
+    assert index._trigrams.keys() == trigrams("faq")
+
+
+class _Queries:
+    def __init__(self, titles):
+        self.titles = titles
+        self.fetches = 0
+        self.release = asyncio.Event()
+
+    async def fetch(self, name, guild_id):
+        self.fetches += 1
+        await self.release.wait()
+        return [{"title": title} for title in self.titles]
+
+
+def test_concurrent_searches_share_one_build():
+    queries = _Queries(["rules", "faq"])
+    search = TagSearch(queries)
+
+    async def race():
+        searches = asyncio.gather(search.search(1, "rules"), search.search(1, "faq"))
+        await asyncio.sleep(0)
+        queries.release.set()
+        return await searches
+
+    assert _run(race()) == [["rules"], ["faq"]]
+    assert queries.fetches == 1
+
+
+def test_changes_during_a_build_are_applied_after_it():
+    queries = _Queries(["rules", "old"])
+    search = TagSearch(queries)
+
+    async def race():
+        building = asyncio.ensure_future(search.index(1))
+        while not queries.fetches:
+            await asyncio.sleep(0)
+        search.added(1, "new")
+        search.removed(1, "old")
+        queries.release.set()
+        return await building
+
+    index = _run(race())
+    assert index.search("new") == ["new"]
+    assert index.search("old") == []
+
+
+def test_least_recently_searched_guilds_are_dropped():
+    queries = _Queries(["rules"])
+    queries.release.set()
+    search = TagSearch(queries, max_guilds=2)
+
+    _run(search.index(1))
+    _run(search.index(2))
+    _run(search.index(1))
+    _run(search.index(3))
+
+    assert list(search._indexes) == [1, 3]
@@ -0,0 +1,149 @@
+import asyncio
+import time
+from types import SimpleNamespace
+from utils.timers import TimerScheduler, TimerSource
+
+
+def _run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+class _Queries:
+    """Serves the rows of one timer table the way the due and due_after queries do."""
+
+    def __init__(self, rows):
+        self.rows = sorted(rows, key=lambda row: (row["expires"], row["id"]))
+        self.calls = []
+
+    async def fetch(self, name, *args):
+        self.calls.append(name)
+        if name == "mute_due":
+            lower, upper, limit = args
+            rows = [row for row in self.rows if lower <= row["expires"] <= upper]
+        else:
+            upper, limit, last_due, last_id = args
+            rows = [row for row in self.rows
+                    if (last_due, last_id) < (row["expires"], row["id"]) and row["expires"] <= upper]
+        return rows[:limit]
+
+    async def executemany(self, name, args):
+        self.calls.append(name)
+        removed = set(args)
+        self.rows = [row for row in self.rows if (row["id"],) not in removed]
+
+
+def _scheduler(rows=(), handler=None, **kwargs) -> TimerScheduler:
+    bot = SimpleNamespace(queries=_Queries(rows))
+    scheduler = TimerScheduler(bot, **kwargs)
+    scheduler.register("mute", TimerSource("mute", ("id",), "expires", handler))
+    return scheduler
+
+
+def _row(id: int, due: float) -> dict:
+    return {"id": id, "expires": due}
+
+
+def _live(scheduler: TimerScheduler) -> list:
+    return sorted(key for (_, key), _ in scheduler._scheduled.items())
+
+
+def test_load_pages_through_every_due_row():
+    now = time.time()
+    rows = [_row(index, now + index) for index in range(7)]
+    scheduler = _scheduler(rows, page_size=3)
+
+    _run(scheduler._load("mute"))
+
+    assert len(scheduler) == 7
+    assert scheduler.bot.queries.calls == ["mute_due", "mute_due_after", "mute_due_after"]
+    assert [entry[0] for entry in sorted(scheduler._heap)] == [row["expires"] for row in rows]
+
+
+def test_load_stops_at_max_loaded_and_resumes_from_there():
+    now = time.time()
+    rows = [_row(index, now + index) for index in range(6)]
+    scheduler = _scheduler(rows, page_size=2, max_loaded=4)
+
+    _run(scheduler._load("mute"))
+    assert _live(scheduler) == [(0,), (1,), (2,), (3,)]
+    assert scheduler._loaded_until["mute"] == rows[3]["expires"]
+
+    scheduler.cancel("mute", (0,))
+    scheduler.cancel("mute", (1,))
+    _run(scheduler._load("mute"))
+
+    assert _live(scheduler) == [(2,), (3,), (4,), (5,)]
+
+
+def test_schedule_skips_rows_past_what_was_loaded():
+    scheduler = _scheduler()
+    _run(scheduler._load("mute"))
+    horizon = scheduler._loaded_until["mute"]
+
+    scheduler.schedule("mute", _row(1, horizon - 1))
+    scheduler.schedule("mute", _row(2, horizon + 1))
+
+    assert _live(scheduler) == [(1,)]
+
+
+def test_rescheduling_a_key_replaces_it():
+    scheduler = _scheduler()
+    scheduler._push("mute", (1,), 10.0, _row(1, 10.0))
+    scheduler._push("mute", (1,), 20.0, _row(1, 20.0))
+
+    assert len(scheduler) == 1
+    assert len(scheduler._heap) == 2
+
+
+def test_cancel_forgets_the_timer_and_compacts_the_heap():
+    scheduler = _scheduler(page_size=2)
+    for index in range(10):
+        scheduler._push("mute", (index,), float(index), _row(index, index))
+
+    for index in range(7):
+        scheduler.cancel("mute", (index,))
+
+    assert len(scheduler) == 3
+    # Compacted once there were more than 2 * live + page_size entries.
+    assert len(scheduler._heap) <= 2 * len(scheduler) + scheduler.page_size
+
+    scheduler._compact()
+    assert sorted(entry[3] for entry in scheduler._heap) == [(7,), (8,), (9,)]
+    assert scheduler._heap[0][3] == (7,)
+
+
+def test_fired_timers_are_deleted_and_forgotten():
+    fired = []
+
+    async def handler(bot, row):
+        fired.append(row["id"])
+
+    scheduler = _scheduler([_row(1, 0.0)], handler)
+    scheduler._push("mute", (1,), 0.0, _row(1, 0.0))
+    _run(scheduler._fire("mute", [((1,), _row(1, 0.0), 1, scheduler._scheduled[("mute", (1,))])]))
+
+    assert fired == [1]
+    assert len(scheduler) == 0
+    assert scheduler.bot.queries.rows == []
+    assert scheduler.fired["mute"] == 1
+
+
+def test_failed_timers_are_retried_then_given_up_on():
+    async def handler(bot, row):
+        raise RuntimeError("nope")
+
+    scheduler = _scheduler([_row(1, 0.0)], handler, max_attempts=2)
+    scheduler._push("mute", (1,), 0.0, _row(1, 0.0))
+
+    _run(scheduler._fire("mute", [((1,), _row(1, 0.0), 1, scheduler._scheduled[("mute", (1,))])]))
+    due, sequence, _, _, _, attempt = max(scheduler._heap)
+
+    assert attempt == 2
+    assert due > time.time()
+    assert scheduler.bot.queries.rows != []
+
+    _run(scheduler._fire("mute", [((1,), _row(1, 0.0), attempt, sequence)]))
+
+    assert len(scheduler) == 0
+    assert scheduler.bot.queries.rows == []
+    assert scheduler.failed["mute"] == 2
@@ -1,4 +1,22 @@
 from .subclasses import MyBot, CustomContext
+from .imaging import (MAX_PIXELS, probe_size, check_dimensions, check_image_size,
+                      count_gif_frames, is_animated_gif, sniff_format, encode_output,
+                      AssetRegistry, assets)
+from .aggregates import GuildAggregates, GuildCounts
+from .chunking import ChunkScheduler, needs_members
+from .commandstats import CommandMetrics, CommandStats, PhaseTimer
+from .dagpi import DagpiClient
+from .database import InstrumentedPool, StatementStats, current_command
+from .effects import EffectRouter
+from .exporter import Exposition, MetricsExporter
+from .fetch import AssetFetcher, FetchTooLarge
+from .guildconfig import GuildConfigStore, GuildSettings
+from .metrics import Histogram
+from .prefixes import PrefixMatcher
+from .profiler import SamplingProfiler, ProfilerBusy
+from .queries import Query, QueryRegistry, queries
+from .render import RenderEngine, RenderCache, RenderBusy, RenderTimeout, RenderFailed
+from .timers import TimerScheduler, TimerSource
 from .paginator import *
 from .utils import *
 from .logger import *
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Guild aggregates - Guild, member, human and bot totals kept up to date from the gateway.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import typing
+import discord
+
+
+class GuildCounts:
+    """The member count of one guild and, once it's been chunked, how many of them are bots."""
+
+    __slots__ = ("members", "bots")
+
+    def __init__(self, members: int, bots: int = None):
+        self.members = members
+        self.bots = bots
+
+    @property
+    def humans(self) -> typing.Optional[int]:
+        return None if self.bots is None else self.members - self.bots
+
+
+class GuildAggregates:
+    """Totals over every guild that are updated as events come in rather than
+    summed when asked for, so reading any of them is constant time.
+
+    Member joins and leaves are counted from the raw gateway payloads since
+    discord.py only dispatches a leave for members it has cached. Bots can
+    only be told apart from humans with the member list, so a guild's split
+    is counted once when it's chunked and kept up from there."""
+
+    def __init__(self):
+        self._guilds: typing.Dict[int, GuildCounts] = {}
+        self.members = 0
+
+    def __len__(self):
+        return len(self._guilds)
+
+    def get(self, guild_id: int) -> typing.Optional[GuildCounts]:
+        return self._guilds.get(guild_id)
+
+    def load(self, guilds: typing.Iterable[discord.Guild]):
+        """Starts over from the given guilds, done once the bot is ready."""
+
+        self._guilds = {}
+        self.members = 0
+        for guild in guilds:
+            self.add(guild)
+
+    def add(self, guild: discord.Guild):
+        self.remove(guild.id)
+
+        counts = self._guilds[guild.id] = GuildCounts(guild.member_count or 0)
+        self.members += counts.members
+
+        if guild.chunked:
+            self.chunked(guild)
+
+    def remove(self, guild_id: int):
+        counts = self._guilds.pop(guild_id, None)
+        if counts is not None:
+            self.members -= counts.members
+
+    def chunked(self, guild: discord.Guild):
+        """Counts the bots of a guild whose members have just been cached."""
+
+        counts = self._guilds.get(guild.id)
+        if counts is not None:
+            counts.bots = sum(member.bot for member in guild.members)
+
+    def member_added(self, guild_id: int, bot: bool):
+        counts = self._guilds.get(guild_id)
+        if counts is None:
+            return
+
+        counts.members += 1
+        self.members += 1
+        if bot and counts.bots is not None:
+            counts.bots += 1
+
+    def member_removed(self, guild_id: int, bot: bool):
+        counts = self._guilds.get(guild_id)
+        if counts is None:
+            return
+
+        counts.members -= 1
+        self.members -= 1
+        if bot and counts.bots is not None:
+            counts.bots -= 1
+
+    def handle_payload(self, payload: dict):
+        """Feeds a gateway payload in, anything but a member join or leave is ignored."""
+
+        event = payload.get("t")
+        if event == "GUILD_MEMBER_ADD":
+            data = payload["d"]
+            self.member_added(int(data["guild_id"]), data["user"].get("bot", False))
+        elif event == "GUILD_MEMBER_REMOVE":
+            data = payload["d"]
+            self.member_removed(int(data["guild_id"]), data["user"].get("bot", False))
+
+    def humans_and_bots(self, guild: discord.Guild) -> typing.Tuple[typing.Optional[int], typing.Optional[int]]:
+        """How many humans and bots the guild has, or (None, None) if that's not known yet."""
+
+        counts = self._guilds.get(guild.id)
+        if counts is None:
+            return None, None
+
+        if counts.bots is None and guild.chunked:
+            self.chunked(guild)
+
+        return counts.humans, counts.bots
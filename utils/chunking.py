@@ -0,0 +1,230 @@
+"""
+Chunk scheduler - Chunks guilds when they're needed instead of all at startup.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import itertools
+import logging
+import time
+import typing
+import discord
+from discord.ext import commands
+from .logger import create_logger
+
+
+logger = create_logger("chunk-scheduler", logging.INFO)
+
+
+class ChunkScheduler:
+    """Queues guild chunk requests and sends them one shard at a time.
+
+    Every shard has its own priority queue and worker. Requests from commands
+    that are waiting on the members go first, then everything else from the
+    largest guild down. A shard sends at most `per_minute` chunk requests a
+    minute, leaving the rest of the gateway limit for everything else.
+
+    Guilds nobody has used in `idle_after` seconds get their member cache
+    dropped by a sweep every `sweep_every` seconds, and are chunked again
+    the next time they're needed."""
+
+    def __init__(self, bot, *, per_minute: int = 60, idle_after: float = None,
+                 sweep_every: float = 600.0, warm_guilds: int = 0):
+        self.bot = bot
+        self.per_minute = per_minute
+        self.idle_after = idle_after
+        self.sweep_every = sweep_every
+        self.warm_guilds = warm_guilds
+
+        self._queues: typing.Dict[int, asyncio.PriorityQueue] = {}
+        self._workers: typing.Dict[int, asyncio.Task] = {}
+        self._sent: typing.Dict[int, typing.Deque[float]] = collections.defaultdict(collections.deque)
+        self._waiters: typing.Dict[int, asyncio.Future] = {}
+        self._last_used: typing.Dict[int, float] = {}
+        self._started = time.monotonic()
+        self._sequence = itertools.count()
+        self._sweeper: typing.Optional[asyncio.Task] = None
+
+        self.requested = 0
+        self.chunked = 0
+        self.failed = 0
+        self.evicted = 0
+        self.evicted_members = 0
+
+    @classmethod
+    def from_settings(cls, bot, settings):
+        config = settings.get("chunking", {})
+        return cls(
+            bot,
+            per_minute=config.get("per_minute", 60),
+            idle_after=config.get("idle_evict_after", 0) or None,
+            sweep_every=config.get("sweep_every", 600.0),
+            warm_guilds=config.get("warm_guilds", 0),
+        )
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def chunked_guilds(self) -> int:
+        return sum(guild.chunked for guild in self.bot.guilds)
+
+    @property
+    def resident_members(self) -> int:
+        return sum(len(guild._members) for guild in self.bot.guilds)
+
+    async def start(self):
+        """Starts the idle sweep and queues the largest guilds, once the bot is ready."""
+
+        await self.bot.wait_until_ready()
+        self._started = time.monotonic()
+
+        if self.idle_after is not None and self._sweeper is None:
+            self._sweeper = self.bot.loop.create_task(self._sweep())
+
+        largest = sorted(self.bot.guilds, key=lambda g: g.member_count or 0, reverse=True)
+        for guild in largest[:self.warm_guilds]:
+            self.request(guild)
+
+    def touch(self, guild: discord.Guild):
+        """Marks the guild as in use so its members aren't evicted."""
+
+        self._last_used[guild.id] = time.monotonic()
+
+    def request(self, guild: discord.Guild, *, urgent: bool = False) -> asyncio.Future:
+        """Queues the guild to be chunked, returns a future that's done once it is."""
+
+        try:
+            future = self._waiters[guild.id]
+        except KeyError:
+            future = self._waiters[guild.id] = self.bot.loop.create_future()
+            self.requested += 1
+        else:
+            if not urgent:
+                return future
+
+        # An urgent request for a guild that's already queued is pushed again
+        # ahead of the rest, whichever entry comes out first does the work.
+        priority = (0 if urgent else 1, -(guild.member_count or 0), next(self._sequence))
+        self._queue(guild.shard_id).put_nowait((priority, guild.id))
+        return future
+
+    async def ensure(self, guild: discord.Guild):
+        """Waits until the guilds members are cached, chunking it first if they aren't."""
+
+        self.touch(guild)
+
+        if guild.chunked:
+            return
+
+        await asyncio.shield(self.request(guild, urgent=True))
+
+    def _queue(self, shard_id: int) -> asyncio.PriorityQueue:
+        try:
+            return self._queues[shard_id]
+        except KeyError:
+            queue = self._queues[shard_id] = asyncio.PriorityQueue()
+            self._workers[shard_id] = self.bot.loop.create_task(self._work(shard_id, queue))
+            return queue
+
+    async def _wait_for_slot(self, shard_id: int):
+        sent = self._sent[shard_id]
+        now = time.monotonic()
+
+        while sent and now - sent[0] >= 60:
+            sent.popleft()
+
+        if len(sent) >= self.per_minute:
+            await asyncio.sleep(60 - (now - sent[0]))
+            sent.popleft()
+
+        sent.append(time.monotonic())
+
+    async def _work(self, shard_id: int, queue: asyncio.PriorityQueue):
+        while True:
+            _, guild_id = await queue.get()
+
+            future = self._waiters.get(guild_id)
+            if future is None:  # Already done through an earlier entry.
+                continue
+
+            guild = self.bot.get_guild(guild_id)
+            if guild is None or guild.unavailable or guild.chunked:
+                del self._waiters[guild_id]
+                future.set_result(None)
+                continue
+
+            await self._wait_for_slot(shard_id)
+
+            try:
+                await guild.chunk()
+            except Exception as e:
+                self.failed += 1
+                logger.warning(f"Failed to chunk {guild_id}: {type(e).__name__} - {e}")
+                del self._waiters[guild_id]
+                future.set_exception(e)
+                future.exception()  # Nobody may be waiting on it, don't warn about that.
+            else:
+                self.chunked += 1
+                self.touch(guild)
+                self.bot.aggregates.chunked(guild)
+                del self._waiters[guild_id]
+                future.set_result(None)
+
+    def evict(self, guild: discord.Guild) -> int:
+        """Drops every cached member of the guild except ourselves. Returns how many were dropped."""
+
+        me = guild.me
+        dropped = len(guild._members) - (me is not None)
+
+        # There's no public way to do this, the cache is rebuilt by the next chunk.
+        guild._members = {me.id: me} if me is not None else {}
+        self._last_used.pop(guild.id, None)
+
+        self.evicted += 1
+        self.evicted_members += dropped
+        return dropped
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_every)
+
+            cutoff = time.monotonic() - self.idle_after
+            for guild in self.bot.guilds:
+                if guild.id in self._waiters or len(guild._members) <= 1:
+                    continue
+
+                # Guilds that haven't been touched yet count as used when the scheduler started.
+                if self._last_used.get(guild.id, self._started) < cutoff:
+                    self.evict(guild)
+
+    def close(self):
+        for task in itertools.chain(self._workers.values(), (self._sweeper,)):
+            if task is not None:
+                task.cancel()
+
+
+def needs_members():
+    """A check that makes sure the guilds members are cached before the command runs."""
+
+    async def predicate(ctx):
+        if ctx.guild is not None:
+            await ctx.bot.chunker.ensure(ctx.guild)
+        return True
+
+    return commands.check(predicate)
@@ -0,0 +1,98 @@
+"""
+Command stats - Per command latency, split into where the time went.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import time
+import typing
+from .metrics import Histogram
+
+
+# checks includes cooldowns and max concurrency, body excludes the time spent in send.
+PHASES = ("checks", "converters", "body", "send")
+
+
+class PhaseTimer:
+    """Splits one invocation into phases. The context moves it along as
+    discord.py gets to each stage, time is added to whichever phase it's in."""
+
+    __slots__ = ("phase", "mark", "started", "times")
+
+    def __init__(self):
+        self.phase = "checks"
+        self.mark = self.started = time.perf_counter()
+        self.times = dict.fromkeys(PHASES, 0.0)
+
+    def advance(self, phase: str):
+        now = time.perf_counter()
+        self.times[self.phase] += now - self.mark
+        self.phase = phase
+        self.mark = now
+
+    def add(self, phase: str, seconds: float):
+        self.times[phase] += seconds
+
+    def finish(self) -> float:
+        """Closes the current phase and returns the total time taken."""
+
+        self.advance(self.phase)
+        self.times["body"] = max(self.times["body"] - self.times["send"], 0.0)
+        return self.mark - self.started
+
+
+class CommandStats:
+    __slots__ = ("invocations", "errors", "latency", "phases")
+
+    def __init__(self):
+        self.invocations = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.phases = {phase: Histogram() for phase in PHASES}
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.invocations if self.invocations else 0.0
+
+
+class CommandMetrics:
+    """Invocations, errors and phase latencies of every command that's been ran."""
+
+    def __init__(self):
+        self.commands: typing.Dict[str, CommandStats] = {}
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __getitem__(self, name: str) -> CommandStats:
+        return self.commands[name]
+
+    def record(self, name: str, timer: PhaseTimer, *, failed: bool = False):
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+
+        stats.invocations += 1
+        if failed:
+            stats.errors += 1
+
+        stats.latency.observe(timer.finish())
+        for phase, seconds in timer.times.items():
+            stats.phases[phase].observe(seconds)
+
+    def top(self, amount: int = 10) -> typing.List[typing.Tuple[str, CommandStats]]:
+        """The commands that have taken the most time in total."""
+
+        return sorted(self.commands.items(), key=lambda item: item[1].latency.sum, reverse=True)[:amount]
@@ -0,0 +1,99 @@
+"""
+Dagpi client - A long lived, cached wrapper around asyncdagpi.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import typing
+import asyncdagpi
+
+
+class DagpiClient:
+    """Keeps one asyncdagpi.Client (and so one connection pool) open for the
+    lifetime of the bot instead of creating one per command.
+
+    At most `concurrency` requests are in flight at once and results are kept
+    in an LRU cache capped at `cache_size` bytes, keyed by the feature name and
+    the avatar URL, which already contains the avatar hash."""
+
+    def __init__(self, token: str, *, concurrency: int = 4, cache_size: int = 16 * 1024 ** 2,
+                 loop: asyncio.AbstractEventLoop = None):
+        self.client = asyncdagpi.Client(token, loop=loop)
+        self.cache_size = cache_size
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache: typing.OrderedDict[typing.Tuple[str, str], typing.Tuple[bytes, str]] = collections.OrderedDict()
+        self._cache_used = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls, settings, *, loop: asyncio.AbstractEventLoop = None):
+        config = settings.get("dagpi", {})
+        return cls(
+            settings["keys"]["dagpi"],
+            concurrency=config.get("concurrency", 4),
+            cache_size=config.get("cache_mb", 16) * 1024 ** 2,
+            loop=loop,
+        )
+
+    @property
+    def cache_used(self) -> int:
+        return self._cache_used
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _put_cached(self, key: typing.Tuple[str, str], value: typing.Tuple[bytes, str]):
+        if len(value[0]) > self.cache_size:
+            return
+
+        self._cache[key] = value
+        self._cache_used += len(value[0])
+
+        while self._cache_used > self.cache_size:
+            _, (evicted, _) = self._cache.popitem(last=False)
+            self._cache_used -= len(evicted)
+
+    async def image_process(self, name: str, feature, url: str) -> typing.Tuple[bytes, str]:
+        """Runs the given asyncdagpi.ImageFeatures feature on url.
+        Returns the image bytes and their format."""
+
+        key = (name, str(url))
+
+        try:
+            value = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        async with self._semaphore:
+            img = await self.client.image_process(feature, str(url))
+
+        value = (img.image.getvalue(), img.format)
+        if key not in self._cache:
+            self._put_cached(key, value)
+
+        return value
+
+    async def close(self):
+        await self.client.close()
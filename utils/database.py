@@ -0,0 +1,216 @@
+"""
+Instrumented pool - Wraps the asyncpg pool to record where database time goes.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import collections
+import contextvars
+import logging
+import time
+import typing
+import asyncpg
+from .logger import create_logger
+from .metrics import Histogram
+
+
+logger = create_logger("database", logging.INFO)
+
+# The command being invoked, set by the bot so queries can be traced back to it.
+current_command: contextvars.ContextVar[typing.Optional[str]] = contextvars.ContextVar("current_command", default=None)
+
+SlowQuery = collections.namedtuple("SlowQuery", "when query duration command")
+
+
+class StatementStats:
+    """Latency and row counts of one statement."""
+
+    __slots__ = ("latency", "rows", "errors")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+
+class _AcquireContext:
+    def __init__(self, pool: "InstrumentedPool", timeout: typing.Optional[float]):
+        self.pool = pool
+        self.timeout = timeout
+        self.connection = None
+
+    async def __aenter__(self):
+        self.connection = await self.pool._acquire(self.timeout)
+        return self.connection
+
+    async def __aexit__(self, *args):
+        connection, self.connection = self.connection, None
+        await self.pool.release(connection)
+
+    def __await__(self):
+        return self.pool._acquire(self.timeout).__await__()
+
+
+class InstrumentedPool:
+    """Stands in for the asyncpg pool and records, per statement, a latency
+    histogram and how many rows it returned or touched, along with how long
+    callers waited for a connection and how many were in use.
+
+    Statements slower than `slow_query` seconds are logged along with the
+    command that ran them, the last `slow_log_size` of them are kept. Only
+    `max_statements` distinct statements are tracked, anything past that is
+    counted under OTHER so ad hoc SQL can't grow it forever."""
+
+    OTHER = "<other>"
+
+    def __init__(self, pool: asyncpg.pool.Pool, *, slow_query: float = 0.25,
+                 slow_log_size: int = 50, max_statements: int = 500):
+        self._pool = pool
+        self.slow_query = slow_query
+        self.max_statements = max_statements
+        # There's no public getter for this in asyncpg.
+        self.max_size = pool._maxsize
+
+        self.statements: typing.Dict[str, StatementStats] = {}
+        self.slow_queries: typing.Deque[SlowQuery] = collections.deque(maxlen=slow_log_size)
+        self.acquire_wait = Histogram()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waiting = 0
+        self.exhausted = 0
+
+    @classmethod
+    def from_settings(cls, pool: asyncpg.pool.Pool, settings):
+        config = settings.get("db_metrics", {})
+        return cls(
+            pool,
+            slow_query=config.get("slow_query", 0.25),
+            slow_log_size=config.get("slow_log_size", 50),
+            max_statements=config.get("max_statements", 500),
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @property
+    def saturation(self) -> float:
+        return self.in_use / self.max_size if self.max_size else 0.0
+
+    def acquire(self, *, timeout: float = None) -> _AcquireContext:
+        return _AcquireContext(self, timeout)
+
+    async def _acquire(self, timeout: typing.Optional[float]):
+        if self.in_use >= self.max_size:
+            self.exhausted += 1
+
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=timeout)
+        finally:
+            self.waiting -= 1
+            self.acquire_wait.observe(time.perf_counter() - start)
+
+        self.in_use += 1
+        if self.in_use > self.peak_in_use:
+            self.peak_in_use = self.in_use
+
+        return connection
+
+    async def release(self, connection, *, timeout: float = None):
+        try:
+            await self._pool.release(connection, timeout=timeout)
+        finally:
+            self.in_use -= 1
+
+    def _record(self, query: str, duration: float, rows: int, failed: bool = False):
+        stats = self.statements.get(query)
+        if stats is None:
+            if len(self.statements) >= self.max_statements:
+                query = self.OTHER
+            stats = self.statements.setdefault(query, StatementStats())
+
+        stats.latency.observe(duration)
+        stats.rows += rows
+        if failed:
+            stats.errors += 1
+
+        if duration >= self.slow_query:
+            command = current_command.get()
+            self.slow_queries.append(SlowQuery(time.time(), query, duration, command))
+            logger.warning(f"Slow query ({duration * 1000:,.0f}ms) from {command or 'no command'}: {query}")
+
+    async def _run(self, method: str, query: str, *args, **kwargs):
+        async with self.acquire() as connection:
+            start = time.perf_counter()
+            try:
+                result = await getattr(connection, method)(query, *args, **kwargs)
+            except Exception:
+                self._record(query, time.perf_counter() - start, 0, failed=True)
+                raise
+
+            self._record(query, time.perf_counter() - start, _count_rows(method, result))
+            return result
+
+    async def execute(self, query: str, *args, timeout: float = None) -> str:
+        return await self._run("execute", query, *args, timeout=timeout)
+
+    async def executemany(self, command: str, args, *, timeout: float = None):
+        return await self._run("executemany", command, args, timeout=timeout)
+
+    async def fetch(self, query: str, *args, timeout: float = None) -> list:
+        return await self._run("fetch", query, *args, timeout=timeout)
+
+    async def fetchval(self, query: str, *args, column: int = 0, timeout: float = None):
+        return await self._run("fetchval", query, *args, column=column, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args, timeout: float = None):
+        return await self._run("fetchrow", query, *args, timeout=timeout)
+
+    def top(self, amount: int = 10) -> typing.List[typing.Tuple[str, StatementStats]]:
+        """The statements that have taken the most time in total."""
+
+        return sorted(self.statements.items(), key=lambda item: item[1].latency.sum, reverse=True)[:amount]
+
+    def snapshot(self, amount: int = 10) -> dict:
+        """Everything above as plain data, for the IPC server."""
+
+        return {
+            "pool": {
+                "in_use": self.in_use,
+                "max_size": self.max_size,
+                "peak_in_use": self.peak_in_use,
+                "waiting": self.waiting,
+                "exhausted": self.exhausted,
+                "acquire_wait": self.acquire_wait.summary(),
+            },
+            "statements": [
+                {"query": query, "rows": stats.rows, "errors": stats.errors, **stats.latency.summary()}
+                for query, stats in self.top(amount)
+            ],
+            "slow_queries": [query._asdict() for query in self.slow_queries],
+        }
+
+
+def _count_rows(method: str, result) -> int:
+    if method == "fetch":
+        return len(result)
+    if method in ("fetchrow", "fetchval"):
+        return int(result is not None)
+    if method == "execute":
+        # The status tag, e.g. "UPDATE 3" or "INSERT 0 1", ends with the row count.
+        count = result.rpartition(" ")[2]
+        return int(count) if count.isdigit() else 0
+    return 0
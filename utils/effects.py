@@ -0,0 +1,133 @@
+"""
+Effect router - Picks between the local and remote backends of an image effect.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import collections
+import logging
+import time
+import typing
+from discord.ext import commands
+from .logger import create_logger
+
+
+logger = create_logger("effect-router", logging.INFO)
+
+
+class EffectRouter:
+    """Chooses between the local and remote backend of an effect.
+
+    Every effect is set to "local", "remote" or "auto". The fixed modes always try
+    that backend first. Auto tries whichever has the lower moving average latency,
+    and every `explore_every` calls tries the other one first so its average
+    doesn't go stale. If the first backend fails the other one is tried, and the
+    failure counts against the backend as `failure_penalty` seconds of latency."""
+
+    BACKENDS = ("local", "remote")
+
+    def __init__(self, modes: typing.Dict[str, str] = None, *, default: str = "auto",
+                 explore_every: int = 20, smoothing: float = 0.2, failure_penalty: float = 10.0):
+        self.modes = dict(modes or {})
+        self.default = default
+        self.explore_every = explore_every
+        self.smoothing = smoothing
+        self.failure_penalty = failure_penalty
+
+        self._latency: typing.Dict[typing.Tuple[str, str], float] = {}
+        self._calls = collections.Counter()
+
+        self.served = collections.Counter()
+        self.failures = collections.Counter()
+
+    @classmethod
+    def from_settings(cls, settings):
+        config = dict(settings.get("effects", {}))
+        return cls(
+            config,
+            default=config.pop("default", "auto"),
+            explore_every=config.pop("explore_every", 20),
+        )
+
+    @property
+    def effects(self) -> typing.List[str]:
+        return sorted({effect for effect, _ in self._latency} | set(self.modes))
+
+    def mode(self, effect: str) -> str:
+        return self.modes.get(effect, self.default)
+
+    def latency(self, effect: str, backend: str) -> typing.Optional[float]:
+        """The moving average latency of the backend in seconds, None if it's never been used."""
+
+        return self._latency.get((effect, backend))
+
+    def _record(self, effect: str, backend: str, seconds: float):
+        key = (effect, backend)
+        old = self._latency.get(key)
+        self._latency[key] = seconds if old is None else old + self.smoothing * (seconds - old)
+
+    def order(self, effect: str) -> typing.Tuple[str, str]:
+        """The order to try the backends of the given effect in."""
+
+        mode = self.mode(effect)
+        if mode == "local":
+            return ("local", "remote")
+        if mode == "remote":
+            return ("remote", "local")
+
+        local = self.latency(effect, "local")
+        remote = self.latency(effect, "remote")
+
+        # Sample both before comparing them, local first since it has no external dependency.
+        if local is None:
+            order = ("local", "remote")
+        elif remote is None:
+            order = ("remote", "local")
+        else:
+            order = ("local", "remote") if local <= remote else ("remote", "local")
+
+        self._calls[effect] += 1
+        if self._calls[effect] % self.explore_every == 0:
+            order = order[::-1]
+
+        return order
+
+    async def run(self, effect: str,
+                  local: typing.Callable[[], typing.Awaitable],
+                  remote: typing.Callable[[], typing.Awaitable]):
+        """Runs the effect on one backend, falling back to the other if it fails.
+        BadArgument is the users fault, not the backends, so it is raised straight away."""
+
+        backends = {"local": local, "remote": remote}
+        error = None
+
+        for backend in self.order(effect):
+            start = time.perf_counter()
+            try:
+                result = await backends[backend]()
+            except commands.BadArgument:
+                raise
+            except Exception as e:
+                self.failures[(effect, backend)] += 1
+                self._record(effect, backend, self.failure_penalty)
+                logger.warning(f"{effect} failed on the {backend} backend: {type(e).__name__} - {e}")
+                error = e
+                continue
+
+            self._record(effect, backend, time.perf_counter() - start)
+            self.served[(effect, backend)] += 1
+            return result
+
+        raise error
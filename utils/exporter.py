@@ -0,0 +1,196 @@
+"""
+Metrics exporter - Serves the bots counters in the Prometheus text format.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+import typing
+from aiohttp import web
+from .logger import create_logger
+from .metrics import Histogram
+
+
+logger = create_logger("metrics", logging.INFO)
+
+Labels = typing.Dict[str, str]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class Exposition:
+    """Builds one scrape worth of metrics, https://prometheus.io/docs/instrumenting/exposition_formats/"""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.lines: typing.List[str] = []
+
+    def _header(self, name: str, kind: str, documentation: str) -> str:
+        name = f"{self.namespace}_{name}"
+        self.lines.append(f"# HELP {name} {documentation}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        return name
+
+    def metric(self, name: str, kind: str, documentation: str,
+               samples: typing.Iterable[typing.Tuple[Labels, float]]):
+        name = self._header(name, kind, documentation)
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(labels)} {value}")
+
+    def gauge(self, name: str, documentation: str, value: float):
+        self.metric(name, "gauge", documentation, [({}, value)])
+
+    def counter(self, name: str, documentation: str, value: float):
+        self.metric(name, "counter", documentation, [({}, value)])
+
+    def histogram(self, name: str, documentation: str,
+                  histograms: typing.Iterable[typing.Tuple[Labels, Histogram]]):
+        name = self._header(name, "histogram", documentation)
+        for labels, histogram in histograms:
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                self.lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+
+            self.lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {histogram.count}")
+            self.lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            self.lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+class MetricsExporter:
+    """Reads the counters that the bot and its components already keep, it
+    doesn't count anything itself. Every value is kept up to date as things
+    happen, so a scrape never walks the guilds or members.
+
+    Served through the IPC server and, if `port` is set, over plain HTTP on
+    `host` for a local Prometheus to scrape."""
+
+    def __init__(self, bot, *, namespace: str = "travis", host: str = "127.0.0.1", port: int = None):
+        self.bot = bot
+        self.namespace = namespace
+        self.host = host
+        self.port = port
+        self._runner: typing.Optional[web.AppRunner] = None
+        self.scrapes = 0
+
+    @classmethod
+    def from_settings(cls, bot, settings):
+        config = settings.get("metrics", {})
+        return cls(
+            bot,
+            namespace=config.get("namespace", "travis"),
+            host=config.get("host", "127.0.0.1"),
+            port=config.get("port", 0) or None,
+        )
+
+    def render(self) -> str:
+        self.scrapes += 1
+        bot = self.bot
+        out = Exposition(self.namespace)
+
+        out.gauge("guilds", "Guilds the bot is in.", bot.guild_total)
+        out.gauge("members", "Members across every guild.", bot.member_total)
+        out.gauge("commands", "Registered commands, subcommands included.", bot.command_total)
+        out.gauge("gateway_latency_seconds", "Heartbeat latency averaged over the shards.", bot.latency)
+        out.counter("messages_seen_total", "Messages received while ready.", bot.messages_seen)
+        out.counter("commands_invoked_total", "Commands invoked.", bot.cmd_usage)
+        out.metric("gateway_events_total", "counter", "Gateway events received, by type.",
+                   (({"event": event}, count) for event, count in bot.gateway_events.items()))
+
+        commands = bot.command_stats.commands
+        out.histogram("command_duration_seconds", "Time taken by each command.",
+                      (({"command": name}, stats.latency) for name, stats in commands.items()))
+        out.metric("command_phase_seconds_total", "counter", "Time each command spent in each phase.",
+                   (({"command": name, "phase": phase}, histogram.sum)
+                    for name, stats in commands.items() for phase, histogram in stats.phases.items()))
+        out.metric("command_errors_total", "counter", "Invocations of each command that errored.",
+                   (({"command": name}, stats.errors) for name, stats in commands.items()))
+
+        pool = bot.pool
+        out.gauge("db_connections_in_use", "Pool connections currently acquired.", pool.in_use)
+        out.gauge("db_connections_max", "Size of the connection pool.", pool.max_size)
+        out.gauge("db_acquire_waiting", "Callers waiting on a pool connection.", pool.waiting)
+        out.counter("db_pool_exhausted_total", "Acquires that found every connection in use.", pool.exhausted)
+        out.histogram("db_acquire_wait_seconds", "Time spent waiting for a pool connection.",
+                      [({}, pool.acquire_wait)])
+        out.histogram("db_query_duration_seconds", "Time taken by each registered query.",
+                      (({"query": name}, histogram) for name, histogram in self._query_latencies().items()))
+
+        out.metric("cache_entries", "gauge", "Entries held by each in memory cache.", [
+            ({"cache": "guild_config"}, len(bot.config)),
+            ({"cache": "prefixes"}, len(bot.prefixes)),
+            ({"cache": "asset_fetch"}, len(bot.fetcher)),
+            ({"cache": "dagpi"}, len(bot.dagpi)),
+            ({"cache": "render"}, len(bot.render.cache)),
+            ({"cache": "timers"}, len(bot.timers)),
+        ])
+        out.metric("cache_bytes", "gauge", "Bytes held by each in memory cache.", [
+            ({"cache": "asset_fetch"}, bot.fetcher.cache_used),
+            ({"cache": "dagpi"}, bot.dagpi.cache_used),
+            ({"cache": "render"}, bot.render.cache.memory_used),
+        ])
+
+        return out.render()
+
+    def _query_latencies(self) -> typing.Dict[str, Histogram]:
+        names = {query.sql: query.name for query in self.bot.queries}
+        merged: typing.Dict[str, Histogram] = {}
+
+        # Anything that isn't a registered query is lumped together, raw SQL makes for a bad label.
+        for sql, stats in self.bot.pool.statements.items():
+            name = names.get(sql, "unregistered")
+            histogram = merged.get(name)
+            if histogram is None:
+                merged[name] = histogram = Histogram(stats.latency.buckets)
+
+            histogram.count += stats.latency.count
+            histogram.sum += stats.latency.sum
+            histogram.max = max(histogram.max, stats.latency.max)
+            histogram.counts = [a + b for a, b in zip(histogram.counts, stats.latency.counts)]
+
+        return merged
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        """Starts the HTTP listener, if a port is configured."""
+
+        if self.port is None or self._runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
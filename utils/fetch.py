@@ -0,0 +1,173 @@
+"""
+Asset fetcher - One place to download avatars, attachments and other images from.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import time
+import typing
+import aiohttp
+from discord.ext import commands
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Everyone waiting on a failed download may have been cancelled, don't warn about that.
+    if not task.cancelled():
+        task.exception()
+
+
+class FetchTooLarge(commands.BadArgument):
+    pass
+
+
+class AssetFetcher:
+    """Downloads images for the image commands.
+
+    Concurrent requests for the same URL share a single download, bodies are
+    streamed and abandoned as soon as they pass `max_bytes`, and finished
+    downloads are kept for `ttl` seconds in a cache capped at `cache_size` bytes."""
+
+    def __init__(self, session: aiohttp.ClientSession, *, max_bytes: int = 8 * 1024 ** 2,
+                 ttl: float = 60.0, cache_size: int = 32 * 1024 ** 2, timeout: float = 15.0,
+                 loop: asyncio.AbstractEventLoop = None):
+        self.session = session
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.timeout = timeout
+        self.loop = loop or asyncio.get_event_loop()
+
+        self._inflight: typing.Dict[str, asyncio.Task] = {}
+        self._cache: typing.OrderedDict[str, typing.Tuple[float, bytes]] = collections.OrderedDict()
+        self._cache_used = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.aborted = 0
+
+    @classmethod
+    def from_settings(cls, session: aiohttp.ClientSession, settings, *,
+                      loop: asyncio.AbstractEventLoop = None):
+        config = settings.get("fetch", {})
+        return cls(
+            session,
+            max_bytes=config.get("max_mb", 8) * 1024 ** 2,
+            ttl=config.get("ttl", 60.0),
+            cache_size=config.get("cache_mb", 32) * 1024 ** 2,
+            timeout=config.get("timeout", 15.0),
+            loop=loop,
+        )
+
+    @property
+    def cache_used(self) -> int:
+        return self._cache_used
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _get_cached(self, url: str) -> typing.Optional[bytes]:
+        try:
+            expires, data = self._cache[url]
+        except KeyError:
+            return None
+
+        if expires < time.monotonic():
+            del self._cache[url]
+            self._cache_used -= len(data)
+            return None
+
+        self._cache.move_to_end(url)
+        return data
+
+    def _put_cached(self, url: str, data: bytes):
+        if len(data) > self.cache_size:
+            return
+
+        old = self._cache.pop(url, None)
+        if old is not None:
+            self._cache_used -= len(old[1])
+
+        self._cache[url] = (time.monotonic() + self.ttl, data)
+        self._cache_used += len(data)
+
+        while self._cache_used > self.cache_size:
+            _, (_, evicted) = self._cache.popitem(last=False)
+            self._cache_used -= len(evicted)
+
+    async def _download(self, url: str) -> bytes:
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+
+        try:
+            async with self.session.get(url, timeout=timeout) as response:
+                if response.status != 200:
+                    raise commands.BadArgument(
+                        f"I couldn't download that image, it returned a {response.status} status.")
+
+                too_large = FetchTooLarge(
+                    f"That image is larger than {self.max_bytes / 1024 ** 2:,.0f} MB, try a smaller one.")
+
+                if response.content_length is not None and response.content_length > self.max_bytes:
+                    self.aborted += 1
+                    raise too_large
+
+                buffer = bytearray()
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    buffer += chunk
+                    if len(buffer) > self.max_bytes:
+                        self.aborted += 1
+                        raise too_large
+
+                return bytes(buffer)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            raise commands.BadArgument("I couldn't download that image.") from None
+
+    async def fetch(self, url) -> bytes:
+        """Fetches the given URL or discord.Asset, sharing the download with any
+        other callers already waiting on the same URL."""
+
+        url = str(url)
+
+        data = self._get_cached(url)
+        if data is not None:
+            self.hits += 1
+            return data
+
+        task = self._inflight.get(url)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            # The download gets its own task so a caller that's cancelled doesn't
+            # take it away from everyone else waiting on the same URL.
+            task = self._inflight[url] = self.loop.create_task(self._fetch(url))
+            task.add_done_callback(_retrieve_exception)
+
+        return await asyncio.shield(task)
+
+    async def _fetch(self, url: str) -> bytes:
+        try:
+            data = await self._download(url)
+        finally:
+            del self._inflight[url]
+
+        self._put_cached(url, data)
+        return data
+
+    def clear(self):
+        self._cache.clear()
+        self._cache_used = 0
@@ -0,0 +1,218 @@
+"""
+Guild config - Typed, write-through store for the per guild settings.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import contextlib
+import logging
+import typing
+from .logger import create_logger
+from .prefixes import DEFAULT_PREFIX
+from .queries import QueryRegistry
+
+
+logger = create_logger("guild-config", logging.INFO)
+
+# Column name -> (type, default), in the same order as the guild_settings table.
+FIELDS = {
+    "guild_prefix": (str, DEFAULT_PREFIX),
+    "mute_role_id": (int, None),
+    "log_channel": (int, None),
+    "owoify": (bool, False),
+}
+
+
+class GuildSettings:
+    """The settings of one guild. Readable like the dict it replaces but
+    slotted, so tens of thousands of them don't cost a dict each."""
+
+    __slots__ = tuple(FIELDS)
+
+    def __init__(self, guild_prefix: str = DEFAULT_PREFIX, mute_role_id: int = None,
+                 log_channel: int = None, owoify: bool = False):
+        self.guild_prefix = guild_prefix
+        self.mute_role_id = mute_role_id
+        self.log_channel = log_channel
+        self.owoify = owoify
+
+    @classmethod
+    def from_record(cls, record) -> "GuildSettings":
+        return cls(*(record[key] for key in FIELDS))
+
+    def __getitem__(self, key: str):
+        if key not in FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in FIELDS else default
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in FIELDS]
+
+    def values(self) -> tuple:
+        return tuple(getattr(self, key) for key in FIELDS)
+
+    def __repr__(self):
+        return f"<GuildSettings {' '.join(f'{key}={value!r}' for key, value in self.items())}>"
+
+
+class GuildConfigStore:
+    """Every guilds settings, kept in memory and written through to guild_settings.
+
+    Changes go through `set`, which updates the record straight away, tells any
+    subscribers of that key and marks the guild dirty. Dirty guilds are written
+    in one batch `flush_delay` seconds after the first change, so a burst of
+    changes costs a single round trip."""
+
+    def __init__(self, queries: QueryRegistry, *, flush_delay: float = 2.0,
+                 loop: asyncio.AbstractEventLoop = None):
+        self.queries = queries
+        self.flush_delay = flush_delay
+        self.loop = loop or asyncio.get_event_loop()
+
+        self._records: typing.Dict[int, GuildSettings] = {}
+        self._subscribers: typing.Dict[str, typing.List[typing.Callable]] = collections.defaultdict(list)
+        self._dirty: typing.Set[int] = set()
+        self._flush_handle: typing.Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+
+        self.writes = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failed_flushes = 0
+
+    @classmethod
+    def from_settings(cls, queries: QueryRegistry, settings, *, loop: asyncio.AbstractEventLoop = None):
+        config = settings.get("guild_config", {})
+        return cls(queries, flush_delay=config.get("flush_delay", 2.0), loop=loop)
+
+    def __getitem__(self, guild_id: int) -> GuildSettings:
+        return self._records[guild_id]
+
+    def __contains__(self, guild_id: int) -> bool:
+        return guild_id in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, guild_id: int, default=None) -> typing.Optional[GuildSettings]:
+        return self._records.get(guild_id, default)
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def load(self, records: typing.Iterable):
+        """Fills the store from guild_settings rows, replacing what's there."""
+
+        self._records = {record["guild_id"]: GuildSettings.from_record(record) for record in records}
+
+    async def add(self, guild_id: int) -> GuildSettings:
+        """Creates the row for a new guild, keeping the existing one if there is one."""
+
+        await self.queries.execute("guild_settings_add", guild_id)
+
+        if guild_id not in self._records:
+            record = await self.queries.fetchrow("guild_settings_get", guild_id)
+            self._records[guild_id] = GuildSettings.from_record(record)
+
+        return self._records[guild_id]
+
+    async def remove(self, guild_id: int):
+        self._records.pop(guild_id, None)
+        self._dirty.discard(guild_id)
+        await self.queries.execute("guild_settings_remove", guild_id)
+
+    def subscribe(self, key: str, callback: typing.Callable[[int, typing.Any, typing.Any], None]):
+        """Calls callback(guild_id, old, new) whenever the given key changes."""
+
+        if key not in FIELDS:
+            raise KeyError(key)
+        self._subscribers[key].append(callback)
+
+    def unsubscribe(self, key: str, callback: typing.Callable):
+        with contextlib.suppress(ValueError):
+            self._subscribers[key].remove(callback)
+
+    def set(self, guild_id: int, key: str, value):
+        """Changes one setting of a guild. The write to the database is batched."""
+
+        expected, _ = FIELDS[key]
+        if value is not None and not isinstance(value, expected):
+            raise TypeError(f"{key} must be {expected.__name__}, not {type(value).__name__}")
+
+        record = self._records[guild_id]
+        old = getattr(record, key)
+        if old == value:
+            return
+
+        setattr(record, key, value)
+        self.writes += 1
+        self._dirty.add(guild_id)
+        self._schedule_flush()
+
+        for callback in self._subscribers[key]:
+            try:
+                callback(guild_id, old, value)
+            except Exception as e:
+                logger.error(f"{key} subscriber failed for {guild_id}: {type(e).__name__} - {e}")
+
+    def _schedule_flush(self):
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(
+                self.flush_delay, lambda: self.loop.create_task(self.flush()))
+
+    async def flush(self):
+        """Writes every dirty guild now. Failed writes are kept dirty and retried."""
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, set()
+            rows = [(guild_id, *self._records[guild_id].values()) for guild_id in dirty if guild_id in self._records]
+            if not rows:
+                return
+
+            try:
+                await self.queries.executemany("guild_settings_update", rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                self._dirty |= dirty
+                self._schedule_flush()
+                logger.error(f"Failed to write {len(rows)} guild config(s): {type(e).__name__} - {e}")
+                return
+            except BaseException:
+                # Cancelled, most likely while shutting down. Keep them dirty for close to write.
+                self._dirty |= dirty
+                raise
+
+            self.flushes += 1
+            self.rows_written += len(rows)
+
+    async def close(self):
+        await self.flush()
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
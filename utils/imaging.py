@@ -0,0 +1,419 @@
+"""
+Imaging - Helpers shared by the image manipulation commands and their render workers.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import struct
+import typing
+from io import BytesIO
+from discord.ext import commands
+from PIL import Image as PILImage, ImageFont, ImageSequence
+
+
+MAX_PIXELS = 1200 * 1000
+
+# JPEG start of frame markers, C4, C8 and CC share the range but aren't frames.
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                     0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _probe_png(data: bytes):
+    if len(data) < 24 or data[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", data[16:24])
+
+
+def _probe_gif(data: bytes):
+    if len(data) < 10:
+        return None
+    return struct.unpack("<HH", data[6:10])
+
+
+def _probe_jpeg(data: bytes):
+    index = 2
+    length = len(data)
+
+    while index + 4 <= length:
+        if data[index] != 0xFF:
+            return None
+
+        marker = data[index + 1]
+        if marker == 0xFF:  # Fill byte.
+            index += 1
+            continue
+
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:  # Standalone markers.
+            index += 2
+            continue
+
+        segment_length, = struct.unpack(">H", data[index + 2:index + 4])
+
+        if marker in _JPEG_SOF_MARKERS:
+            if index + 9 > length:
+                return None
+            height, width = struct.unpack(">HH", data[index + 5:index + 9])
+            return width, height
+
+        index += 2 + segment_length
+
+    return None
+
+
+def _probe_webp(data: bytes):
+    chunk = data[12:16]
+
+    if chunk == b"VP8 " and len(data) >= 30:
+        width, height = struct.unpack("<HH", data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+
+    if chunk == b"VP8L" and len(data) >= 25:
+        bits, = struct.unpack("<I", data[21:25])
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+
+    if chunk == b"VP8X" and len(data) >= 30:
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return width, height
+
+    return None
+
+
+def probe_size(data: bytes) -> typing.Optional[typing.Tuple[int, int]]:
+    """Reads the width and height of a PNG, JPEG, GIF or WebP image from its header
+    without decoding it. Returns None if the format isn't recognised."""
+
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return _probe_png(data)
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return _probe_gif(data)
+    if data.startswith(b"\xff\xd8"):
+        return _probe_jpeg(data)
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return _probe_webp(data)
+    return None
+
+
+def check_dimensions(width: int, height: int):
+    if (width * height) >= MAX_PIXELS:
+        raise commands.BadArgument(
+            "That image is a little too large and may crashy washy my botty wotty 🥺")
+
+
+def check_image_size(data: bytes):
+    """Admission gate ran before an image is handed to a render worker.
+    Images we can't probe are let through and checked again once decoded."""
+
+    size = probe_size(data)
+    if size is not None:
+        check_dimensions(*size)
+
+
+def sniff_format(data: bytes) -> typing.Optional[str]:
+    """Returns the file extension matching the images magic bytes."""
+
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "gif"
+    if data.startswith(b"\xff\xd8"):
+        return "jpg"
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _save(image: PILImage.Image, fmt: str, **kwargs) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def encode_output(data: bytes, target_bytes: int, *, min_quality: int = 50, max_quality: int = 90) -> bytes:
+    """Picks the output encoding for a rendered PNG.
+
+    Anything already under target_bytes is left as it is. Flat images with few
+    colours are re-saved as an optimised PNG, otherwise photographic output goes
+    to JPEG, or WebP if it has transparency, at the highest quality that fits."""
+
+    if len(data) <= target_bytes or sniff_format(data) != "png":
+        return data
+
+    with PILImage.open(BytesIO(data)) as img:
+        img.load()
+
+        if img.getcolors(maxcolors=256) is not None:
+            optimised = _save(img, "png", optimize=True)
+            if len(optimised) <= target_bytes:
+                return optimised
+
+        has_alpha = img.mode in ("RGBA", "LA") and img.getchannel("A").getextrema()[0] < 255
+
+        if has_alpha:
+            image, fmt, kwargs = img.convert("RGBA"), "webp", {"method": 4}
+        else:
+            image, fmt, kwargs = img.convert("RGB"), "jpeg", {"optimize": True}
+
+    # Binary search for the best quality that still fits, or the smallest we tried if none do.
+    best = smallest = None
+    low, high = min_quality, max_quality
+    while low <= high:
+        quality = (low + high) // 2
+        encoded = _save(image, fmt, quality=quality, **kwargs)
+
+        if smallest is None or len(encoded) < len(smallest):
+            smallest = encoded
+
+        if len(encoded) <= target_bytes:
+            best = encoded
+            low = quality + 1
+        else:
+            high = quality - 1
+
+    result = best or smallest
+    return result if len(result) < len(data) else data
+
+
+def render_encoded(method: typing.Callable, target_bytes: int, *args) -> bytes:
+    """Runs inside a render worker, renders method(*args) then picks its output encoding."""
+
+    return encode_output(method(*args), target_bytes)
+
+
+class AssetRegistry:
+    """Template images and fonts used by the render workers, decoded once per process.
+
+    Cogs register what they use when they load and the render engine preloads
+    everything before it starts a worker pool, so forked workers inherit the
+    decoded assets copy-on-write instead of each loading their own.
+    Anything not registered is still loaded lazily on first use."""
+
+    def __init__(self):
+        self._wanted_images: typing.Set[typing.Tuple[str, typing.Optional[typing.Tuple[int, int]]]] = set()
+        self._wanted_fonts: typing.Set[typing.Tuple[str, int]] = set()
+        self._images: typing.Dict[tuple, PILImage.Image] = {}
+        self._fonts: typing.Dict[tuple, ImageFont.FreeTypeFont] = {}
+
+    def register_image(self, path: str, size: typing.Tuple[int, int] = None):
+        self._wanted_images.add((path, size))
+
+    def register_font(self, path: str, size: int):
+        self._wanted_fonts.add((path, size))
+
+    def _load_image(self, path: str, size: typing.Optional[typing.Tuple[int, int]]) -> PILImage.Image:
+        key = (path, size)
+
+        try:
+            return self._images[key]
+        except KeyError:
+            pass
+
+        with PILImage.open(path) as img:
+            image = img.convert("RGBA")
+
+        if size is not None and image.size != size:
+            image = image.resize(size, PILImage.LANCZOS)
+
+        self._images[key] = image
+        return image
+
+    def image(self, path: str, size: typing.Tuple[int, int] = None) -> PILImage.Image:
+        """Returns a copy of the template at path, scaled to size if given."""
+
+        return self._load_image(path, size).copy()
+
+    def font(self, path: str, size: int) -> ImageFont.FreeTypeFont:
+        """Returns the font at path in the given size. Fonts are shared, not copied."""
+
+        key = (path, size)
+
+        try:
+            return self._fonts[key]
+        except KeyError:
+            font = self._fonts[key] = ImageFont.truetype(path, size)
+            return font
+
+    def preload(self):
+        for path, size in self._wanted_images:
+            self._load_image(path, size)
+
+        for path, size in self._wanted_fonts:
+            self.font(path, size)
+
+
+assets = AssetRegistry()
+
+
+def _skip_sub_blocks(data: bytes, index: int) -> int:
+    while True:
+        size = data[index]
+        index += 1
+        if size == 0:
+            return index
+        index += size
+
+
+def _color_table_size(packed: int) -> int:
+    return 3 * (2 << (packed & 0x07)) if packed & 0x80 else 0
+
+
+def _iter_gif_frames(data: bytes):
+    """Walks the blocks of a GIF without decoding any pixel data.
+    Yields (gce, descriptor, lct, image) slice bounds for every frame."""
+
+    index = 13 + _color_table_size(data[10])
+    gce = None
+
+    while index < len(data):
+        block = data[index]
+
+        if block == 0x3B:  # Trailer.
+            return
+
+        if block == 0x21:  # Extension, only the graphic control one matters to us.
+            end = _skip_sub_blocks(data, index + 2)
+            if data[index + 1] == 0xF9:
+                gce = (index, end)
+            index = end
+
+        elif block == 0x2C:  # Image descriptor.
+            descriptor = (index, index + 10)
+            index += 10
+
+            lct = (index, index + _color_table_size(data[index - 1]))
+            index = lct[1]
+
+            # Skip the LZW minimum code size byte then the image data itself.
+            end = _skip_sub_blocks(data, index + 1)
+            yield gce, descriptor, lct, (index, end)
+
+            gce = None
+            index = end
+
+        else:
+            raise ValueError(f"Unknown GIF block 0x{block:02x} at {index}")
+
+
+def count_gif_frames(data: bytes, *, stop_at: int = None) -> int:
+    """Counts the frames in a GIF from its block structure. Returns 0 for anything that isn't a GIF."""
+
+    if not data.startswith((b"GIF87a", b"GIF89a")):
+        return 0
+
+    count = 0
+    try:
+        for _ in _iter_gif_frames(data):
+            count += 1
+            if count == stop_at:
+                break
+    except (IndexError, ValueError):
+        pass  # Truncated or malformed, count what we could read.
+
+    return count
+
+
+def is_animated_gif(data: bytes) -> bool:
+    return count_gif_frames(data, stop_at=2) > 1
+
+
+def _is_keyframe(data: bytes, gce: typing.Optional[typing.Tuple[int, int]],
+                 descriptor: typing.Tuple[int, int], width: int, height: int) -> bool:
+    # A frame that covers the whole canvas without transparency doesn't depend on anything before it.
+    if struct.unpack("<HHHH", data[descriptor[0] + 1:descriptor[0] + 9]) != (0, 0, width, height):
+        return False
+    return gce is None or not data[gce[0] + 3] & 0x01
+
+
+def split_gif(data: bytes, chunk_size: int) -> typing.List[bytes]:
+    """Splits a GIF into GIFs of about chunk_size frames without decoding it. Chunks
+    only start on frames that draw the whole canvas, so every chunk decodes the same
+    on its own, which means a GIF without such frames stays in one piece."""
+
+    header = data[:13 + _color_table_size(data[10])]
+    width, height = struct.unpack("<HH", data[6:10])
+
+    chunks = []
+    frames = []
+    for gce, descriptor, lct, image in _iter_gif_frames(data):
+        if len(frames) >= chunk_size and _is_keyframe(data, gce, descriptor, width, height):
+            chunks.append(frames)
+            frames = []
+
+        start = gce[0] if gce is not None else descriptor[0]
+        frames.append(data[start:image[1]])
+
+    if frames:
+        chunks.append(frames)
+
+    return [header + b"".join(frames) + b"\x3b" for frames in chunks]
+
+
+def render_gif_chunk(method: typing.Callable, data: bytes, *args) -> bytes:
+    """Runs inside a render worker. Decodes the frames of the GIF one at a time,
+    passes each through method as PNG bytes and encodes the results as a GIF."""
+
+    frames = []
+    durations = []
+
+    with PILImage.open(BytesIO(data)) as image:
+        for frame in ImageSequence.Iterator(image):
+            buffer = BytesIO()
+            frame.convert("RGBA").save(buffer, "png")
+
+            rendered = PILImage.open(BytesIO(method(buffer.getvalue(), *args)))
+            rendered.load()
+
+            frames.append(rendered)
+            durations.append(frame.info.get("duration", 100))
+
+    first, *rest = frames
+    buffer = BytesIO()
+    first.save(buffer, "gif", save_all=True, append_images=rest,
+               duration=durations, loop=0, disposal=2, optimize=True)
+
+    return buffer.getvalue()
+
+
+def stitch_gifs(chunks: typing.List[bytes], loop: int = 0) -> bytes:
+    """Joins GIFs into one by copying their encoded frames across, without decoding them.
+    Frames that relied on their chunks global colour table get it as a local one instead."""
+
+    width = max(struct.unpack("<H", chunk[6:8])[0] for chunk in chunks)
+    height = max(struct.unpack("<H", chunk[8:10])[0] for chunk in chunks)
+
+    out = bytearray(b"GIF89a")
+    out += struct.pack("<HHBBB", width, height, 0, 0, 0)
+    out += b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00"
+
+    for chunk in chunks:
+        packed = chunk[10]
+        gct = chunk[13:13 + _color_table_size(packed)]
+
+        for gce, descriptor, lct, image in _iter_gif_frames(chunk):
+            if gce is not None:
+                out += chunk[gce[0]:gce[1]]
+
+            if lct[0] != lct[1]:
+                out += chunk[descriptor[0]:lct[1]]
+            else:
+                descriptor = bytearray(chunk[descriptor[0]:descriptor[1]])
+                if gct:
+                    descriptor[9] = (descriptor[9] & 0x78) | 0x80 | (packed & 0x07)
+                out += descriptor + gct
+
+            out += chunk[image[0]:image[1]]
+
+    out += b"\x3b"
+    return bytes(out)
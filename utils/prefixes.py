@@ -0,0 +1,103 @@
+"""
+Prefix matcher - Compiled, per guild prefix matching for incoming messages.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+import typing
+import discord
+
+
+DEFAULT_PREFIX = "tb!"
+OWNER_NO_PREFIX = ("jsk", "dev")
+
+
+class PrefixMatcher:
+    """Keeps the prefixes of every guild along with one compiled regex that matches
+    any of them, so working out whether a message is a command is a single match.
+
+    Entries are built the first time a guild is seen and have to be invalidated
+    whenever its prefix changes. Guilds whose config isn't loaded yet get the
+    default prefix but aren't cached, so they pick up their real one once it is."""
+
+    def __init__(self, bot, *, default: str = DEFAULT_PREFIX):
+        self.bot = bot
+        self.default = default
+        self._compiled: typing.Dict[typing.Optional[int], typing.Tuple[typing.List[str], typing.Pattern]] = {}
+
+    def __len__(self):
+        return len(self._compiled)
+
+    def _build(self, guild_id: typing.Optional[int]) -> typing.Tuple[typing.List[str], typing.Pattern]:
+        user_id = self.bot.user.id
+        prefixes = [f"<@{user_id}> ", f"<@!{user_id}> "]
+
+        cacheable = True
+        if guild_id is None:
+            prefixes.append(self.default)
+        else:
+            try:
+                prefixes.append(self.bot.config[guild_id]["guild_prefix"])
+            except KeyError:
+                prefixes.append(self.default)
+                cacheable = False
+
+        # Longest first so a prefix that starts with a shorter one still wins.
+        pattern = re.compile("|".join(map(re.escape, sorted(prefixes, key=len, reverse=True))))
+        entry = (prefixes, pattern)
+
+        if cacheable:
+            self._compiled[guild_id] = entry
+
+        return entry
+
+    def _get(self, guild_id: typing.Optional[int]) -> typing.Tuple[typing.List[str], typing.Pattern]:
+        try:
+            return self._compiled[guild_id]
+        except KeyError:
+            return self._build(guild_id)
+
+    def prefixes(self, message: discord.Message) -> typing.List[str]:
+        """Every prefix that's valid for the given message, for get_prefix."""
+
+        prefixes = list(self._get(message.guild.id if message.guild else None)[0])
+
+        if message.author.id in self.bot.owner_ids and message.content.startswith(OWNER_NO_PREFIX):
+            prefixes.append("")
+
+        return prefixes
+
+    def match(self, message: discord.Message) -> typing.Optional[str]:
+        """Returns the prefix the message starts with, or None if it can't be a command."""
+
+        _, pattern = self._get(message.guild.id if message.guild else None)
+        found = pattern.match(message.content)
+
+        if found is not None:
+            return found.group()
+
+        if message.author.id in self.bot.owner_ids and message.content.startswith(OWNER_NO_PREFIX):
+            return ""
+
+        return None
+
+    def invalidate(self, guild_id: int = None):
+        """Drops the compiled prefixes of the given guild, or of every guild if none is given."""
+
+        if guild_id is None:
+            self._compiled.clear()
+        else:
+            self._compiled.pop(guild_id, None)
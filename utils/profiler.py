@@ -0,0 +1,97 @@
+"""
+Sampling profiler - Samples what the event loop is doing, for flame graphs.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import sys
+import threading
+import typing
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+class SamplingProfiler:
+    """Off unless asked for. While running, a thread looks at the event loop
+    threads stack every `interval` seconds and counts how often each stack
+    was seen. Nothing is added to the loop's code, but every sample takes the
+    GIL to walk `sys._current_frames()`, so the loop is paused for however
+    long that walk takes, every `interval`. Keep runs short on a busy bot.
+
+    The result is in the collapsed format flamegraph.pl and speedscope read,
+    one `outer;inner;innermost count` line per stack."""
+
+    def __init__(self, *, interval: float = 0.005, max_seconds: float = 120.0):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._thread: typing.Optional[threading.Thread] = None
+        self.runs = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        config = settings.get("profiler", {})
+        return cls(
+            interval=config.get("interval", 0.005),
+            max_seconds=config.get("max_seconds", 120.0),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    async def profile(self, seconds: float) -> typing.Counter[str]:
+        """Samples the calling loops thread for the given amount of seconds."""
+
+        if self.running:
+            raise ProfilerBusy("The profiler is already running.")
+
+        seconds = min(seconds, self.max_seconds)
+        target = threading.get_ident()
+        stop = threading.Event()
+        stacks = collections.Counter()
+
+        self._thread = threading.Thread(target=self._sample, args=(target, stop, stacks),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+        self.runs += 1
+
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.get_event_loop().run_in_executor(None, self._thread.join)
+            self._thread = None
+
+        return stacks
+
+    def _sample(self, target: int, stop: threading.Event, stacks: typing.Counter[str]):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+
+            while frame is not None:
+                stack.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                frame = frame.f_back
+
+            if stack:
+                stacks[";".join(reversed(stack))] += 1
+
+    @staticmethod
+    def collapse(stacks: typing.Counter[str]) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
@@ -0,0 +1,231 @@
+"""
+Query registry - Every query the cogs run, declared once and prepared on every connection.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+import time
+import typing
+import asyncpg
+from .logger import create_logger
+
+
+logger = create_logger("queries", logging.INFO)
+
+
+class Query:
+    """One registered query and how it's been performing."""
+
+    __slots__ = ("name", "sql", "calls", "errors", "total_time", "max_time")
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.0
+
+    def record(self, seconds: float):
+        self.calls += 1
+        self.total_time += seconds
+        if seconds > self.max_time:
+            self.max_time = seconds
+
+
+class QueryRegistry:
+    """Runs queries by name against the bound pool, timing every call.
+
+    `prepare` is given to the pool as its connection init, so every
+    registered statement is parsed and planned once per connection when it
+    opens rather than on the first command that happens to use it."""
+
+    def __init__(self):
+        self.pool: typing.Optional[asyncpg.pool.Pool] = None
+        self._queries: typing.Dict[str, Query] = {}
+
+    def __len__(self):
+        return len(self._queries)
+
+    def __iter__(self) -> typing.Iterator[Query]:
+        return iter(self._queries.values())
+
+    def __getitem__(self, name: str) -> Query:
+        return self._queries[name]
+
+    def register(self, name: str, sql: str) -> Query:
+        if name in self._queries:
+            raise ValueError(f"A query named {name} is already registered")
+
+        query = self._queries[name] = Query(name, sql)
+        return query
+
+    def bind(self, pool: asyncpg.pool.Pool):
+        self.pool = pool
+
+    async def prepare(self, connection: asyncpg.Connection):
+        for query in self._queries.values():
+            try:
+                # Puts the statement in the connections own statement cache, which
+                # is what fetch, execute and friends look it up from.
+                await connection._prepare(query.sql, use_cache=True)
+            except asyncpg.PostgresError as e:
+                logger.warning(f"Could not prepare {query.name}: {type(e).__name__} - {e}")
+
+    async def _run(self, method: str, name: str, *args, **kwargs):
+        query = self._queries[name]
+        start = time.perf_counter()
+
+        try:
+            return await getattr(self.pool, method)(query.sql, *args, **kwargs)
+        except Exception:
+            query.errors += 1
+            raise
+        finally:
+            query.record(time.perf_counter() - start)
+
+    async def execute(self, name: str, *args, timeout: float = None) -> str:
+        return await self._run("execute", name, *args, timeout=timeout)
+
+    async def executemany(self, name: str, args: typing.Iterable, *, timeout: float = None):
+        return await self._run("executemany", name, args, timeout=timeout)
+
+    async def fetch(self, name: str, *args, timeout: float = None) -> typing.List[asyncpg.Record]:
+        return await self._run("fetch", name, *args, timeout=timeout)
+
+    async def fetchrow(self, name: str, *args, timeout: float = None) -> typing.Optional[asyncpg.Record]:
+        return await self._run("fetchrow", name, *args, timeout=timeout)
+
+    async def fetchval(self, name: str, *args, column: int = 0, timeout: float = None):
+        return await self._run("fetchval", name, *args, column=column, timeout=timeout)
+
+
+queries = QueryRegistry()
+
+# Blacklist
+queries.register("blacklist_add", "INSERT INTO blacklist VALUES($1, $2)")
+queries.register("blacklist_all", "SELECT * FROM blacklist")
+
+# Cookies
+queries.register(
+    "cookie_add",
+    "INSERT INTO cookies VALUES($1, $2) "
+    "ON CONFLICT (user_id) "
+    "DO UPDATE SET cookies = COALESCE(cookies.cookies, 0) + EXCLUDED.cookies;"
+)
+queries.register("cookie_scores", "SELECT user_id, COALESCE(cookies, 0) AS cookies FROM cookies")
+
+# Giveaways
+queries.register("giveaway_add", "INSERT INTO giveaways VALUES($1, $2, $3, $4)")
+queries.register(
+    "giveaway_due",
+    "SELECT * FROM giveaways WHERE ends_at >= $1 AND ends_at <= $2 ORDER BY ends_at, message_id LIMIT $3"
+)
+queries.register(
+    "giveaway_due_after",
+    "SELECT * FROM giveaways WHERE (ends_at, message_id) > ($3, $4) AND ends_at <= $1 "
+    "ORDER BY ends_at, message_id LIMIT $2"
+)
+queries.register("giveaway_remove", "DELETE FROM giveaways WHERE message_id = $1")
+queries.register("giveaway_roles", "SELECT message_id, role_id FROM giveaways WHERE role_id IS NOT NULL")
+
+# Guild settings
+queries.register("guild_settings_add", "INSERT INTO guild_settings(guild_id) VALUES($1) ON CONFLICT (guild_id) DO NOTHING")
+queries.register("guild_settings_all", "SELECT * FROM guild_settings")
+queries.register(
+    "guild_settings_bootstrap",
+    "INSERT INTO guild_settings(guild_id) SELECT unnest($1::BIGINT[]) ON CONFLICT (guild_id) DO NOTHING"
+)
+queries.register("guild_settings_get", "SELECT * FROM guild_settings WHERE guild_id = $1")
+queries.register("guild_settings_remove", "DELETE FROM guild_settings WHERE guild_id = $1")
+queries.register(
+    "guild_settings_update",
+    "UPDATE guild_settings SET guild_prefix = $2, mute_role_id = $3, log_channel = $4, owoify = $5 "
+    "WHERE guild_id = $1"
+)
+
+# Mutes
+queries.register("mute_add", "INSERT INTO guild_mutes VALUES($1, $2, $3)")
+queries.register(
+    "mute_due",
+    "SELECT * FROM guild_mutes WHERE end_time >= $1 AND end_time <= $2 "
+    "ORDER BY end_time, guild_id, member_id LIMIT $3"
+)
+queries.register(
+    "mute_due_after",
+    "SELECT * FROM guild_mutes WHERE (end_time, guild_id, member_id) > ($3, $4, $5) AND end_time <= $1 "
+    "ORDER BY end_time, guild_id, member_id LIMIT $2"
+)
+queries.register("mute_get", "SELECT * FROM guild_mutes WHERE member_id = $1 AND guild_id = $2")
+queries.register("mute_list", "SELECT * FROM guild_mutes WHERE guild_id = $1")
+queries.register("mute_remove", "DELETE FROM guild_mutes WHERE guild_id = $1 AND member_id = $2")
+
+# Tags
+queries.register(
+    "tag_add",
+    "INSERT INTO tags VALUES($1, $2, $3, $4, $5, $6) "
+    "ON CONFLICT (guild, (lower(title))) DO NOTHING RETURNING id"
+)
+queries.register("tag_add_uses", "UPDATE tags SET uses = uses + $2 WHERE id = $1")
+queries.register(
+    "tag_get",
+    "SELECT id, guild, author, title, content FROM tags WHERE guild = $1 AND lower(title) = lower($2)"
+)
+queries.register("tag_list", "SELECT title FROM tags WHERE author = $1 AND guild = $2")
+queries.register("tag_remove", "DELETE FROM tags WHERE id = $1")
+queries.register("tag_titles", "SELECT title FROM tags WHERE guild = $1")
+
+# Temp bans
+queries.register(
+    "tempban_add",
+    "INSERT INTO temp_bans(guild_id, moderator_id, user_id, reason, end_time) "
+    "VALUES($1, $2, $3, $4, $5) RETURNING *;"
+)
+queries.register(
+    "tempban_due",
+    "SELECT * FROM temp_bans WHERE end_time >= $1 AND end_time <= $2 ORDER BY end_time, id LIMIT $3"
+)
+queries.register(
+    "tempban_due_after",
+    "SELECT * FROM temp_bans WHERE (end_time, id) > ($3, $4) AND end_time <= $1 ORDER BY end_time, id LIMIT $2"
+)
+queries.register("tempban_expire", "DELETE FROM temp_bans WHERE id = $1")
+queries.register("tempban_remove", "DELETE FROM temp_bans WHERE guild_id = $1 AND user_id = $2 RETURNING id")
+
+# To-dos
+queries.register("todo_add", "INSERT INTO todos VALUES(DEFAULT, $1, $2)")
+queries.register("todo_clear", "DELETE FROM todos WHERE user_id = $1")
+queries.register("todo_edit", "UPDATE todos SET task = $1 WHERE id = $2")
+queries.register("todo_list", "SELECT * FROM todos WHERE user_id = $1")
+queries.register("todo_list_alphabetical", "SELECT * FROM todos WHERE user_id = $1 ORDER BY task ASC")
+queries.register("todo_list_size", "SELECT * FROM todos WHERE user_id = $1 ORDER BY CHAR_LENGTH(task) ASC")
+queries.register("todo_remove", "DELETE FROM todos WHERE user_id = $1 AND id = $2")
+
+# Verification
+queries.register("verification_add", "INSERT INTO guild_verification(guild_id, message_id, role_id) VALUES($1, $2, $3)")
+queries.register("verification_all", "SELECT message_id, role_id FROM guild_verification")
+queries.register("verification_get", "SELECT * FROM guild_verification WHERE guild_id = $1")
+queries.register("verification_remove", "DELETE FROM guild_verification WHERE guild_id = $1")
+queries.register("verification_remove_message", "DELETE FROM guild_verification WHERE message_id = $1")
+
+# Warns
+queries.register("warn_add", "INSERT INTO warns VALUES(default, $1, $2, $3, $4, $5);")
+queries.register("warn_list", "SELECT * FROM warns WHERE offender_id = $1;")
+queries.register("warn_remove", "DELETE FROM warns WHERE id = $1;")
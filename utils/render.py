@@ -0,0 +1,405 @@
+"""
+Render engine - Runs blocking image work in a dedicated process pool.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import functools
+import hashlib
+import logging
+import multiprocessing
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from discord.ext import commands
+from .imaging import (assets, count_gif_frames, probe_size, render_encoded, render_gif_chunk, split_gif,
+                      stitch_gifs)
+from .logger import create_logger
+
+
+logger = create_logger("render-engine", logging.INFO)
+
+
+class RenderBusy(commands.CommandError):
+    pass
+
+
+class RenderTimeout(commands.CommandError):
+    pass
+
+
+class RenderFailed(commands.CommandError):
+    pass
+
+
+def _get_context():
+    # Spawn and forkserver both re-import __main__ in the workers, which for
+    # us means starting a second bot, so fork wherever the platform allows it.
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def _join_processes(processes: typing.List[multiprocessing.Process]):
+    for process in processes:
+        process.join()
+
+
+class RenderCache:
+    """Content addressed cache for render results.
+
+    Keys are a hash of the operation and its arguments, with any bytes
+    arguments hashed by content, so the same avatar rendered the same way
+    always lands on the same entry. Results live in an LRU memory tier capped
+    at `memory_size` bytes and, if `directory` is given, fall through to an
+    on-disk tier capped at `disk_size` bytes that evicts least recently used first."""
+
+    def __init__(self, *, memory_size: int = 64 * 1024 ** 2, directory: str = None,
+                 disk_size: int = 512 * 1024 ** 2, loop: asyncio.AbstractEventLoop = None):
+        self.memory_size = memory_size
+        self.directory = directory
+        self.disk_size = disk_size
+        self.loop = loop or asyncio.get_event_loop()
+
+        self._memory: typing.OrderedDict[str, bytes] = collections.OrderedDict()
+        self._memory_used = 0
+        self._disk: typing.OrderedDict[str, int] = collections.OrderedDict()
+        self._disk_used = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_disk_index()
+
+    @staticmethod
+    def make_key(func: typing.Callable, *args) -> str:
+        key = hashlib.blake2b(digest_size=20)
+        key.update(f"{func.__module__}.{func.__qualname__}".encode())
+
+        for arg in args:
+            if isinstance(arg, (bytes, bytearray)):
+                key.update(b"\x00b" + hashlib.blake2b(arg, digest_size=20).digest())
+            elif callable(arg):
+                key.update(b"\x00f" + f"{arg.__module__}.{arg.__qualname__}".encode())
+            else:
+                key.update(b"\x00r" + repr(arg).encode())
+
+        return key.hexdigest()
+
+    @property
+    def memory_used(self) -> int:
+        return self._memory_used
+
+    @property
+    def disk_used(self) -> int:
+        return self._disk_used
+
+    def __len__(self):
+        return len(self._memory)
+
+    def _load_disk_index(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_used += size
+
+        self._evict_disk()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _memory_put(self, key: str, value: bytes):
+        if len(value) > self.memory_size:
+            return
+
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= len(old)
+
+        self._memory[key] = value
+        self._memory_used += len(value)
+
+        while self._memory_used > self.memory_size:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+
+    def _evict_disk(self):
+        while self._disk_used > self.disk_size and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _disk_read(self, key: str) -> typing.Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def _disk_write(self, key: str, value: bytes):
+        tmp = self._path(f"{key}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(value)
+        os.replace(tmp, self._path(key))
+
+    async def get(self, key: str) -> typing.Optional[bytes]:
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return value
+
+        if key in self._disk:
+            value = await self.loop.run_in_executor(None, self._disk_read, key)
+            if value is not None:
+                self._disk.move_to_end(key)
+                self._memory_put(key, value)
+                self.disk_hits += 1
+                return value
+
+            self._disk_used -= self._disk.pop(key, 0)
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: bytes):
+        self._memory_put(key, value)
+
+        if self.directory is None or len(value) > self.disk_size or key in self._disk:
+            return
+
+        await self.loop.run_in_executor(None, self._disk_write, key, value)
+        # Another put of the same key may have finished while this one was writing.
+        self._disk_used += len(value) - self._disk.get(key, 0)
+        self._disk[key] = len(value)
+        self._evict_disk()
+
+    def clear(self):
+        self._memory.clear()
+        self._memory_used = 0
+
+
+class RenderEngine:
+    """Shared submission point for every image render.
+
+    Jobs run in a process pool so Wand/Polaroid/PIL work doesn't fight the
+    event loop for the GIL. At most `workers` jobs run at once and at most
+    `max_queue` more may wait; anything past that is rejected with RenderBusy.
+    The pool is replaced after `max_jobs_per_worker` jobs per worker, or
+    straight away if a job times out, since ImageMagick leaks memory.
+
+    Animated GIFs are split into chunks of about `gif_chunk_size` frames, cut
+    where a frame redraws the whole canvas, which are rendered across the
+    workers and stitched back together, and are refused
+    past `gif_max_frames` frames or `gif_max_pixels` pixels across all frames.
+
+    Still renders are re-encoded to aim for `output_target` bytes, see
+    utils.encode_output for how the format is chosen."""
+
+    def __init__(self, *, workers: int = 2, max_queue: int = 16, timeout: float = 30.0,
+                 max_jobs_per_worker: int = 50, gif_chunk_size: int = 8, gif_max_frames: int = 120,
+                 gif_max_pixels: int = 40_000_000, output_target: int = 1024 ** 2, cache: RenderCache = None,
+                 loop: asyncio.AbstractEventLoop = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_jobs = max_jobs_per_worker * workers
+        self.gif_chunk_size = gif_chunk_size
+        self.gif_max_frames = gif_max_frames
+        self.gif_max_pixels = gif_max_pixels
+        self.output_target = output_target
+        self.loop = loop or asyncio.get_event_loop()
+        self.cache = cache if cache is not None else RenderCache(loop=self.loop)
+
+        self._semaphore = asyncio.Semaphore(workers)
+        self._pool: typing.Optional[ProcessPoolExecutor] = None
+        self._pool_jobs = 0
+        self._pending = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.recycles = 0
+
+    @classmethod
+    def from_settings(cls, settings, *, loop: asyncio.AbstractEventLoop = None):
+        config = settings.get("render", {})
+        cache = RenderCache(
+            memory_size=config.get("cache_memory_mb", 64) * 1024 ** 2,
+            directory=config.get("cache_dir") or None,
+            disk_size=config.get("cache_disk_mb", 512) * 1024 ** 2,
+            loop=loop,
+        )
+        return cls(
+            workers=config.get("workers", 2),
+            max_queue=config.get("max_queue", 16),
+            timeout=config.get("timeout", 30.0),
+            max_jobs_per_worker=config.get("max_jobs_per_worker", 50),
+            gif_chunk_size=config.get("gif_chunk_size", 8),
+            gif_max_frames=config.get("gif_max_frames", 120),
+            gif_max_pixels=config.get("gif_max_pixels", 40_000_000),
+            output_target=config.get("output_target_kb", 1024) * 1024,
+            cache=cache,
+            loop=loop,
+        )
+
+    @property
+    def pending(self) -> int:
+        """The amount of jobs either running or waiting to run."""
+
+        return self._pending
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is not None and self._pool_jobs >= self.max_jobs:
+            self._retire_pool(self._pool)
+
+        if self._pool is None:
+            assets.preload()
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=_get_context())
+            self._pool_jobs = 0
+
+        return self._pool
+
+    def _retire_pool(self, pool: ProcessPoolExecutor, *, terminate: bool = False):
+        # Jobs already handed to the old pool still finish, its workers
+        # just exit once they're done instead of taking new work. A worker
+        # stuck on a job that timed out never finishes though, so in that
+        # case the workers are killed, failing whatever else they were running.
+        # That goes for a pool that was already recycled just the same.
+        processes = []
+        if terminate:
+            # There's no public way to get at the workers, and shutdown forgets them.
+            processes = list((pool._processes or {}).values())
+            for process in processes:
+                process.terminate()
+
+        pool.shutdown(wait=False)
+        if processes:
+            self.loop.run_in_executor(None, _join_processes, processes)
+
+        if pool is self._pool:
+            self._pool = None
+            self.recycles += 1
+
+    async def submit(self, func: typing.Callable, *args, **kwargs):
+        """Runs func(*args, **kwargs) in a worker process and returns the result.
+        func and its arguments must be picklable, so pass bytes rather than file objects."""
+
+        if self._pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise RenderBusy(
+                "I'm rendering a lot of images right now, try again in a few seconds.")
+
+        self._pending += 1
+        try:
+            async with self._semaphore:
+                pool = self._get_pool()
+                self._pool_jobs += 1
+
+                future = pool.submit(functools.partial(func, *args, **kwargs))
+                try:
+                    result = await asyncio.wait_for(
+                        asyncio.wrap_future(future, loop=self.loop), self.timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    logger.warning(f"{getattr(func, '__qualname__', func)} timed out after {self.timeout}s")
+                    self._retire_pool(pool, terminate=True)
+                    raise RenderTimeout(
+                        "That image took too long to process, try a smaller one.") from None
+                except BrokenProcessPool:
+                    logger.warning(f"{getattr(func, '__qualname__', func)} broke the render pool")
+                    self._retire_pool(pool, terminate=True)
+                    raise RenderFailed(
+                        "Something went wrong while processing that image, try again.") from None
+
+                self.completed += 1
+                return result
+        finally:
+            self._pending -= 1
+
+    async def cached(self, func: typing.Callable, *args) -> bytes:
+        """Same as submit, but for renders that return PNG bytes. The output is re-encoded
+        towards output_target, and results are looked up in and stored to the render
+        cache so repeated renders skip the pool entirely."""
+
+        key = self.cache.make_key(func, *args, self.output_target)
+        result = await self.cache.get(key)
+
+        if result is None:
+            result = await self.submit(render_encoded, func, self.output_target, *args)
+            await self.cache.put(key, result)
+
+        return result
+
+    async def _render_gif(self, func: typing.Callable, data: bytes, *args) -> bytes:
+        frames = count_gif_frames(data)
+        width, height = probe_size(data)
+
+        if frames > self.gif_max_frames or frames * width * height > self.gif_max_pixels:
+            raise commands.BadArgument(
+                "That gif has too many frames for me to process, try a shorter one.")
+
+        # Each worker only gets its own frames, so none of them decodes the frames before its chunk.
+        try:
+            parts = split_gif(data, self.gif_chunk_size)
+        except (IndexError, ValueError):
+            parts = [data]  # Malformed somewhere, let PIL make what it can of it in one go.
+
+        # Only hand out as many chunks as there are workers at a time, so one big
+        # gif can't fill the queue and frames aren't decoded far ahead of encoding.
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def render_chunk(part: bytes) -> bytes:
+            async with semaphore:
+                return await self.submit(render_gif_chunk, func, part, *args)
+
+        chunks = await asyncio.gather(*(render_chunk(part) for part in parts))
+
+        return await self.submit(stitch_gifs, list(chunks))
+
+    async def cached_gif(self, func: typing.Callable, data: bytes, *args) -> bytes:
+        """Like cached, but runs func over every frame of the animated GIF data.
+        func is given each frame as PNG bytes followed by args and must return PNG bytes."""
+
+        key = self.cache.make_key(stitch_gifs, func, data, *args)
+        result = await self.cache.get(key)
+
+        if result is None:
+            result = await self._render_gif(func, data, *args)
+            await self.cache.put(key, result)
+
+        return result
+
+    def close(self):
+        if self._pool is not None:
+            self._retire_pool(self._pool)
@@ -17,11 +17,14 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
+import collections
 import contextlib
+import functools
 import logging
 import os
 import re
 import time
+import typing
 import asyncpg
 import discord
 import aiohttp
@@ -31,6 +34,20 @@ from discord.ext import commands
 from datetime import datetime as dt
 from . import utils
 from .logger import create_logger
+from .aggregates import GuildAggregates
+from .chunking import ChunkScheduler
+from .commandstats import CommandMetrics, PhaseTimer
+from .database import InstrumentedPool, current_command
+from .dagpi import DagpiClient
+from .effects import EffectRouter
+from .exporter import MetricsExporter
+from .fetch import AssetFetcher
+from .guildconfig import GuildConfigStore
+from .prefixes import PrefixMatcher
+from .profiler import SamplingProfiler
+from .queries import queries
+from .render import RenderEngine
+from .timers import TimerScheduler, TimerSource, end_giveaway, end_mute, end_temp_bans
 
 
 logger = create_logger("custom-bot", logging.INFO)
@@ -49,33 +66,33 @@ else:
 async def get_prefix(bot: commands.AutoShardedBot, message: discord.Message):
     """This gets called every message to get the prefix of the given message."""
 
-    base = [f"<@{bot.user.id}> ", f"<@!{bot.user.id}> "]
-
-    if message.guild is None:
-        base.append("tb!")
-        return base
-
-    try:
-        prefix = bot.config[message.guild.id]["guild_prefix"]
-    except KeyError:
-        prefix = "tb!"
-
-    base.append(prefix)
-
-    if await bot.is_owner(message.author):
-        if message.content.startswith(("jsk", "dev")):
-            base.append("")
-
-    return base
+    return bot.prefixes.prefixes(message)
 
 
 class CustomContext(commands.Context):
+    timer: typing.Optional[PhaseTimer] = None
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.timeit = TimeIt(self)
         self.bot: MyBot = self.bot
 
+    @property
+    def args(self) -> list:
+        return self._args
+
+    @args.setter
+    def args(self, value: list):
+        # discord.py resets the arguments right before converting them, which is
+        # the only point between the checks and the converters that we can see.
+        self._args = value
+        if self.timer is not None and self.timer.phase == "checks":
+            self.timer.advance("converters")
+
+    @functools.cached_property
+    def timeit(self):
+        return TimeIt(self)
+
     @staticmethod
     def _owoify_message(content: str, embed: discord.Embed = None):
         ret = {"content": utils.owoify_text(content)}
@@ -91,6 +108,14 @@ class CustomContext(commands.Context):
         yield embed
 
     async def send(self, content: str = None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await self._send(content, **kwargs)
+        finally:
+            if self.timer is not None:
+                self.timer.add("send", time.perf_counter() - start)
+
+    async def _send(self, content: str = None, **kwargs):
         new_message = kwargs.pop("new_message", None)
         kwargs["embed"] = kwargs.pop("embed", None)
 
@@ -99,7 +124,7 @@ class CustomContext(commands.Context):
             content = owoified["content"]
 
             if kwargs["embed"]:
-                kwargs["embed"] = owofied["embed"]
+                kwargs["embed"] = owoified["embed"]
 
         if not new_message:
             message = self.bot.ctx_cache.get(self.message.id, None)
@@ -151,6 +176,9 @@ class TimeIt(ContextDecorator):
 
 
 class MyBot(commands.AutoShardedBot):
+    # How long a message waits for do_prep before it's dropped.
+    PREP_TIMEOUT = 30.0
+
     def __init__(self, *args, **kwargs):
         super().__init__(get_prefix, *args, **kwargs)
 
@@ -178,6 +206,13 @@ class MyBot(commands.AutoShardedBot):
         self.support_url = "https://discord.gg/tKZbxAF"
         self.invite_url = "https://kal-byte.co.uk/invite/706530005169209386/1580592374"
         self.cmd_usage = 0
+        self.messages_seen = 0
+        self.contexts_created = 0
+        self.command_stats = CommandMetrics()
+        self.gateway_events = collections.Counter()
+        self.aggregates = GuildAggregates()
+        self._command_total = None
+        self.profiler = SamplingProfiler.from_settings(self.settings)
         self.announcement = {
             "title": None,
             "message": None
@@ -188,20 +223,35 @@ class MyBot(commands.AutoShardedBot):
         self.giveaway_roles = {}
         self.blacklist = {}
         self.ctx_cache = {}
-        self.config = {}
+        self.prefixes = PrefixMatcher(self)
+        self._mention_regex = None
+        self.prepped = asyncio.Event()
+        self.prep_time = None
 
         # Stuff that requires the bots loop
         self.loop = asyncio.get_event_loop()
-        self.pool = self.loop.run_until_complete(
+        pool = self.loop.run_until_complete(
             asyncpg.create_pool(
-                **self.settings["database"]["main"] if os.name != "nt" else self.settings["database"]["beta"])
+                **self.settings["database"]["main"] if os.name != "nt" else self.settings["database"]["beta"],
+                init=queries.prepare)
         )
+        self.pool = InstrumentedPool.from_settings(pool, self.settings)
+        self.queries = queries
+        self.queries.bind(self.pool)
+        self.config = GuildConfigStore.from_settings(self.queries, self.settings, loop=self.loop)
+        self.config.subscribe("guild_prefix", lambda guild_id, old, new: self.prefixes.invalidate(guild_id))
         self.session = aiohttp.ClientSession(loop=self.loop)
+        self.fetcher = AssetFetcher.from_settings(self.session, self.settings, loop=self.loop)
+        self.render = RenderEngine.from_settings(self.settings, loop=self.loop)
 
         # Checks to disable functionality for certain things.
         self.add_check(self.command_check)
         self.add_check(self.blacklist_check)
 
+        # Marks where each command's phases start and end, see CustomContext.timer.
+        self.before_invoke(self.before_command)
+        self.after_invoke(self.after_command)
+
         # Webhooks
         self.error_webhook = discord.Webhook.from_url(
             self.settings["misc"]["error_webhook"],
@@ -214,10 +264,24 @@ class MyBot(commands.AutoShardedBot):
 
         # Some tasks that prep the bot to be used fully.
         self.loop.create_task(self.do_prep())
-        self.loop.create_task(self.chunk_all_guilds())
+        self.chunker = ChunkScheduler.from_settings(self, self.settings)
+        self.loop.create_task(self.chunker.start())
+
+        self.timers = TimerScheduler.from_settings(self, self.settings)
+        self.timers.register("mute", TimerSource("mute", ("guild_id", "member_id"), "end_time", end_mute))
+        self.timers.register("giveaway", TimerSource("giveaway", ("message_id",), "ends_at", end_giveaway,
+                                                     timestamp=True))
+        self.timers.register("tempban", TimerSource("tempban", ("id",), "end_time", end_temp_bans,
+                                                    remove="tempban_expire", timestamp=True, group_by="guild_id"))
+        self.timers.start()
+
+        self.metrics = MetricsExporter.from_settings(self, self.settings)
+        self.loop.create_task(self.metrics.start())
 
         # API Wrappers
         self.zane = aiozaneapi.Client(self.settings["keys"]["zane_api"])
+        self.dagpi = DagpiClient.from_settings(self.settings, loop=self.loop)
+        self.effects = EffectRouter.from_settings(self.settings)
 
 
     @property
@@ -234,47 +298,51 @@ class MyBot(commands.AutoShardedBot):
         return discord.Colour.from_rgb(*new_colour)
 
     async def close(self):
+        # Cogs that buffer writes flush them here, cog_unload only runs once the pool is closed.
+        for cog in tuple(self.cogs.values()):
+            close = getattr(cog, "close", None)
+            if close is not None:
+                try:
+                    await close()
+                except Exception as e:
+                    logger.error(f"Failed to close {cog.qualified_name}: {type(e).__name__} - {e}")
+
         await self.session.close()
+        await self.config.close()
         await self.pool.close()
         await self.zane.close()
+        await self.dagpi.close()
+        self.render.close()
+        self.chunker.close()
+        self.timers.close()
+        await self.metrics.close()
         await super().close()
 
-    async def chunk_all_guilds(self):
-        await self.wait_until_ready()
+    async def wait_until_prepped(self):
+        """Waits until do_prep has filled the config, blacklist and verification caches."""
 
-        for guild in self.guilds:
-            if guild.unavailable:
-                continue
-
-            await guild.chunk()
+        await self.prepped.wait()
 
     async def do_prep(self):
         await self.wait_until_ready()
+        start = time.perf_counter()
 
-        # Credits to pikaninja for the refactor here down to just 1 query.
-        for guild in self.guilds:
-            sql = (
-                "INSERT INTO guild_settings VALUES($1, DEFAULT, $2, $3, $4) "
-                "ON CONFLICT (guild_id) DO NOTHING;"
-            )
-            values = (guild.id, None, None, False)
-            await self.pool.execute(sql, *values)
+        # Every guild in one statement rather than one round trip each.
+        await self.queries.execute("guild_settings_bootstrap", [guild.id for guild in self.guilds])
 
-        verification_config = await self.pool.fetch("SELECT message_id, role_id FROM guild_verification")
-        guild_configs = await self.pool.fetch("SELECT * FROM guild_settings")
-        blacklist = await self.pool.fetch("SELECT * FROM blacklist")
-        giveaways = await self.pool.fetch("SELECT * FROM giveaways")
+        verification_config, guild_configs, blacklist, giveaway_roles = await asyncio.gather(
+            self.queries.fetch("verification_all"),
+            self.queries.fetch("guild_settings_all"),
+            self.queries.fetch("blacklist_all"),
+            self.queries.fetch("giveaway_roles"),
+        )
 
         for entry in verification_config:
             self.verification_config[entry["message_id"]] = entry["role_id"]
 
         logger.info("Finished caching the verification config")
 
-        for entry in guild_configs:
-            settings = dict(entry)
-            settings.pop("guild_id")
-
-            self.config[entry["guild_id"]] = settings
+        self.config.load(guild_configs)
 
         logger.info("Finished caching guild configs")
 
@@ -283,24 +351,14 @@ class MyBot(commands.AutoShardedBot):
 
         logger.info("Finished caching blacklists")
 
-        for entry in giveaways:
-            if entry["role_id"]:
-                self.giveaway_roles[entry["message_id"]] = entry["role_id"]
-
-            await utils.set_giveaway(self, entry["ends_at"], entry["channel_id"], entry["message_id"])
-
-        logger.info("Finished caching and setting giveaways")
+        for entry in giveaway_roles:
+            self.giveaway_roles[entry["message_id"]] = entry["role_id"]
 
-        mutes = await self.pool.fetch("SELECT * FROM guild_mutes")
-        for mute in mutes:
-            now = time.time()
-            seconds_left = mute["end_time"] - now
-            await utils.set_mute(bot=self,
-                                 guild_id=mute["guild_id"],
-                                 user_id=mute["member_id"],
-                                 _time=seconds_left)
+        logger.info("Finished caching giveaway roles")
 
-        logger.info("Finished setting mutes.")
+        self.prep_time = time.perf_counter() - start
+        self.prepped.set()
+        logger.info(f"Caches ready in {self.prep_time * 1000:,.0f}ms")
 
         updates_channel = self.get_channel(711586681580552232)
         last_update = await updates_channel.fetch_message(updates_channel.last_message_id)
@@ -334,8 +392,82 @@ class MyBot(commands.AutoShardedBot):
         return embed
 
     async def get_context(self, message: discord.Message, *, cls=CustomContext):
+        self.contexts_created += 1
         return await super().get_context(message, cls=cls)
 
+    async def invoke(self, ctx: CustomContext):
+        token = current_command.set(ctx.command.qualified_name if ctx.command else None)
+        if ctx.command is not None:
+            ctx.timer = PhaseTimer()
+
+        try:
+            await super().invoke(ctx)
+        finally:
+            current_command.reset(token)
+
+            if getattr(ctx, "timer", None) is not None:
+                self.command_stats.record(ctx.command.qualified_name, ctx.timer, failed=ctx.command_failed)
+                ctx.timer = None
+
+    def dispatch(self, event_name: str, *args, **kwargs):
+        # Every event comes through here, keeping the totals up to date as they
+        # happen means nothing has to walk the guilds to answer them.
+        if event_name == "socket_response":
+            payload = args[0]
+            self.gateway_events[payload.get("t") or f"OP_{payload.get('op')}"] += 1
+            self.aggregates.handle_payload(payload)
+        elif event_name in ("guild_join", "guild_available"):
+            self.aggregates.add(args[0])
+        elif event_name == "guild_remove":
+            self.aggregates.remove(args[0].id)
+        elif event_name == "ready":
+            self.aggregates.load(self.guilds)
+
+        super().dispatch(event_name, *args, **kwargs)
+
+    @property
+    def guild_total(self) -> int:
+        return len(self.aggregates)
+
+    @property
+    def member_total(self) -> int:
+        return self.aggregates.members
+
+    @property
+    def command_total(self) -> int:
+        """Every command including subcommands, counted once per change to the commands."""
+
+        if self._command_total is None:
+            self._command_total = sum(1 for _ in self.walk_commands())
+        return self._command_total
+
+    def add_command(self, command: commands.Command):
+        super().add_command(command)
+        self._command_total = None
+
+    def remove_command(self, name: str) -> typing.Optional[commands.Command]:
+        command = super().remove_command(name)
+        self._command_total = None
+        return command
+
+    async def before_command(self, ctx: CustomContext):
+        if getattr(ctx, "timer", None) is not None:
+            ctx.timer.advance("body")
+
+    async def after_command(self, ctx: CustomContext):
+        # Anything after this belongs to the checks of a subcommand, if there is one.
+        if getattr(ctx, "timer", None) is not None:
+            ctx.timer.advance("checks")
+
+    @property
+    def mention_regex(self) -> typing.Pattern:
+        """Matches a message that's only a mention of the bot, compiled once we know our ID."""
+
+        if self._mention_regex is None:
+            self._mention_regex = re.compile(f"<@!?{self.user.id}>")
+
+        return self._mention_regex
+
     async def on_ready(self):
         logger.info(f"Logged in as -> {self.user.name}")
         logger.info(f"Client ID -> {self.user.id}")
@@ -345,38 +477,49 @@ class MyBot(commands.AutoShardedBot):
         if not self.is_ready():
             return
 
-        BOT_MENTION_REGEX = f"<@(!)?{self.user.id}>"
+        self.messages_seen += 1
+
+        # Everything below here should be as cheap as possible, most messages are just chatter.
+        if message.author.bot or message.webhook_id is not None:
+            return
 
-        if re.fullmatch(BOT_MENTION_REGEX, message.content):
+        # Prefixes and most commands need the guild config, hold on to the message until it's loaded.
+        if not self.prepped.is_set():
+            try:
+                await asyncio.wait_for(self.wait_until_prepped(), timeout=self.PREP_TIMEOUT)
+            except asyncio.TimeoutError:
+                return
+
+        if self.mention_regex.fullmatch(message.content):
             ctx = await self.get_context(message)
             cmd = self.get_command("prefix")
 
             await cmd(ctx)
 
+        if self.prefixes.match(message) is None:
+            return
+
         await self.process_commands(message)
 
     async def on_guild_join(self, guild: discord.Guild):
-        await guild.chunk()
-
-        sql = "INSERT INTO guild_settings(guild_id, guild_prefix, owoify) VALUES($1, DEFAULT, DEFAULT)"
-        await self.pool.execute(sql, guild.id)
+        await self.config.add(guild.id)
+        self.prefixes.invalidate(guild.id)
 
-        self.config[guild.id] = {
-            "guild_prefix": "tb!",
-            "mute_role_id": None,
-            "log_channel": None,
-            "owoify": False,
-        }
+        # The members are needed to tell whether this is a bot farm, but the log
+        # isn't worth holding up for long. The chunk carries on either way.
+        try:
+            await asyncio.wait_for(self.chunker.ensure(guild), timeout=10.0)
+        except Exception as e:
+            logger.warning(f"Couldn't chunk {guild.id} after joining it: {type(e).__name__} - {e}")
 
         message = [
             f"I was just added to {guild.name} with {guild.member_count} members.",
-            f"Now in {len(self.guilds)} guilds.",
+            f"Now in {self.guild_total} guilds.",
         ]
 
-        human_count = sum(not m.bot for m in guild.members)
-        bot_count = sum(m.bot for m in guild.members)
+        human_count, bot_count = self.aggregates.humans_and_bots(guild)
 
-        if bot_count > human_count:
+        if bot_count is not None and bot_count > human_count:
             message.append("Do note this could potentially be a bot farm.")
             message.append(f"Humans: {human_count} | Bots {bot_count}.")
 
@@ -386,19 +529,15 @@ class MyBot(commands.AutoShardedBot):
                                       username="Added to guild.")
 
     async def on_guild_remove(self, guild: discord.Guild):
-        await self.pool.execute(
-            "DELETE FROM guild_settings WHERE guild_id = $1", guild.id
-        )
+        await self.config.remove(guild.id)
 
-        await self.pool.execute(
-            "DELETE FROM guild_verification WHERE guild_id = $1", guild.id
-        )
+        await self.queries.execute("verification_remove", guild.id)
 
-        del self.config[guild.id]
+        self.prefixes.invalidate(guild.id)
 
         message = [
             f"I was just removed from {guild.name} with {guild.member_count} members.",
-            f"Now in {len(self.guilds)} guilds.",
+            f"Now in {self.guild_total} guilds.",
         ]
 
         logger.info("\n".join(message))
@@ -0,0 +1,355 @@
+"""
+Timer scheduler - One dispatcher for every timed action stored in the database.
+Copyright (C) 2021 kal-byte
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as
+published by the Free Software Foundation, either version 3 of the
+License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import collections
+import datetime
+import heapq
+import itertools
+import logging
+import random
+import time
+import typing
+import discord
+from .logger import create_logger
+
+
+logger = create_logger("timers", logging.INFO)
+
+
+class TimerSource:
+    """A table of timers. Every row is one timer, due at `due_column` and
+    identified by `key_columns`. Once it's due `handler(bot, row)` is called
+    and the row is deleted. `timestamp` is set if the due column is a
+    TIMESTAMP (in UTC) rather than epoch seconds.
+
+    The rows are read and deleted through the registered `<name>_due`,
+    `<name>_due_after` and `remove` queries. They're paged by keyset rather
+    than offset, since rows deleted while loading would shift an offset.
+
+    If `group_by` is given, rows that are due together and share that column
+    are handed over as a list instead, `handler(bot, rows)`."""
+
+    def __init__(self, name: str, key_columns: typing.Tuple[str, ...], due_column: str,
+                 handler: typing.Callable[..., typing.Awaitable], *, remove: str = None,
+                 timestamp: bool = False, group_by: str = None):
+        self.key_columns = key_columns
+        self.due_column = due_column
+        self.handler = handler
+        self.timestamp = timestamp
+        self.group_by = group_by
+
+        self.due_query = f"{name}_due"
+        self.due_after_query = f"{name}_due_after"
+        self.remove_query = remove or f"{name}_remove"
+
+    def key(self, row) -> tuple:
+        return tuple(row[column] for column in self.key_columns)
+
+    def due(self, row) -> float:
+        value = row[self.due_column]
+        if self.timestamp:
+            return value.replace(tzinfo=datetime.timezone.utc).timestamp()
+        return float(value)
+
+    def to_db(self, epoch: float):
+        if self.timestamp:
+            return datetime.datetime.utcfromtimestamp(epoch)
+        return int(epoch)
+
+
+class TimerScheduler:
+    """Runs every timer from one heap and one task.
+
+    Only timers due within `horizon` seconds are read from the database, a
+    page at a time and never more than `max_loaded` at once, the rest stay in
+    their tables until they get close. A row is only deleted after its handler
+    has ran, so anything cut short by a restart runs again when it's loaded.
+    Handlers that raise are retried `max_attempts` times, `retry_after`
+    seconds apart.
+
+    At most `concurrency` handlers run at once and grouped rows are handed
+    over `batch_size` at a time, so catching up on a backlog after downtime
+    doesn't fire everything at once."""
+
+    def __init__(self, bot, *, horizon: float = 3600.0, page_size: int = 500, max_loaded: int = 10_000,
+                 concurrency: int = 8, batch_size: int = 50, retry_after: float = 60.0, max_attempts: int = 5):
+        self.bot = bot
+        self.horizon = horizon
+        self.page_size = page_size
+        self.max_loaded = max_loaded
+        self.batch_size = batch_size
+        self.retry_after = retry_after
+        self.max_attempts = max_attempts
+
+        self._sources: typing.Dict[str, TimerSource] = {}
+        self._heap: typing.List[tuple] = []
+        self._scheduled: typing.Dict[typing.Tuple[str, tuple], int] = {}
+        self._loaded_until: typing.Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: typing.Optional[asyncio.Task] = None
+
+        self.loaded = collections.Counter()
+        self.fired = collections.Counter()
+        self.failed = collections.Counter()
+
+    @classmethod
+    def from_settings(cls, bot, settings):
+        config = settings.get("timers", {})
+        return cls(
+            bot,
+            horizon=config.get("horizon", 3600.0),
+            page_size=config.get("page_size", 500),
+            max_loaded=config.get("max_loaded", 10_000),
+            concurrency=config.get("concurrency", 8),
+            batch_size=config.get("batch_size", 50),
+        )
+
+    def __len__(self):
+        # Cancelled and rescheduled entries stay in the heap until they come up, only count the live ones.
+        return len(self._scheduled)
+
+    @property
+    def kinds(self) -> typing.List[str]:
+        return list(self._sources)
+
+    def register(self, kind: str, source: TimerSource):
+        self._sources[kind] = source
+
+    def start(self):
+        if self._task is None:
+            self._task = self.bot.loop.create_task(self._dispatch())
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def _push(self, kind: str, key: tuple, due: float, row, attempt: int = 1):
+        sequence = next(self._sequence)
+        self._scheduled[(kind, key)] = sequence
+        heapq.heappush(self._heap, (due, sequence, kind, key, row, attempt))
+
+        if self._heap[0][1] == sequence:
+            self._wakeup.set()
+
+    def schedule(self, kind: str, row: typing.Mapping):
+        """Tells the scheduler about a row that was just inserted into the kinds table.
+        Rows past what's already been loaded are left for the next page."""
+
+        source = self._sources[kind]
+        due = source.due(row)
+
+        if due <= self._loaded_until.get(kind, 0.0):
+            self._push(kind, source.key(row), due, row)
+
+    def cancel(self, kind: str, key: tuple):
+        """Forgets a loaded timer. Its row has to be deleted by the caller."""
+
+        self._scheduled.pop((kind, key), None)
+
+        if len(self._heap) > 2 * len(self._scheduled) + self.page_size:
+            self._compact()
+
+    def _compact(self):
+        """Drops the heap entries of cancelled and rescheduled timers."""
+
+        self._heap = [entry for entry in self._heap if self._scheduled.get((entry[2], entry[3])) == entry[1]]
+        heapq.heapify(self._heap)
+
+    async def _load(self, kind: str):
+        source = self._sources[kind]
+        lower = self._loaded_until.get(kind, 0.0)
+        upper = time.time() + self.horizon
+        last_due = lower
+        last_row = None
+
+        while True:
+            room = self.max_loaded - len(self)
+            if room <= 0:
+                # Full, pick up from the last row we got to once there's space.
+                self._loaded_until[kind] = last_due
+                return
+
+            limit = min(self.page_size, room)
+            if last_row is None:
+                rows = await self.bot.queries.fetch(source.due_query, source.to_db(lower), source.to_db(upper), limit)
+            else:
+                rows = await self.bot.queries.fetch(source.due_after_query, source.to_db(upper), limit,
+                                                    last_row[source.due_column], *source.key(last_row))
+
+            for row in rows:
+                key = source.key(row)
+                last_due = source.due(row)
+                last_row = row
+
+                if (kind, key) not in self._scheduled:
+                    self._push(kind, key, last_due, row)
+                    self.loaded[kind] += 1
+
+            if len(rows) < limit:
+                self._loaded_until[kind] = upper
+                return
+
+    def _needs_load(self, kind: str, now: float) -> bool:
+        return len(self) < self.max_loaded and now + self.horizon / 2 >= self._loaded_until.get(kind, 0.0)
+
+    async def _dispatch(self):
+        await self.bot.wait_until_prepped()
+
+        while True:
+            now = time.time()
+
+            for kind in self._sources:
+                if self._needs_load(kind, now):
+                    try:
+                        await self._load(kind)
+                    except Exception as e:
+                        logger.error(f"Failed to load {kind} timers: {type(e).__name__} - {e}")
+
+            now = time.time()
+            batches = collections.defaultdict(list)
+            while self._heap and self._heap[0][0] <= now:
+                due, sequence, kind, key, row, attempt = heapq.heappop(self._heap)
+
+                if self._scheduled.get((kind, key)) != sequence:  # Cancelled or rescheduled.
+                    continue
+
+                group_by = self._sources[kind].group_by
+                group = (kind, sequence) if group_by is None else (kind, row[group_by])
+                batches[group].append((key, row, attempt, sequence))
+
+            for (kind, _), batch in batches.items():
+                for index in range(0, len(batch), self.batch_size):
+                    self.bot.loop.create_task(self._fire(kind, batch[index:index + self.batch_size]))
+
+            wake_at = [self._heap[0][0]] if self._heap else []
+            if len(self) < self.max_loaded:
+                wake_at.extend(self._loaded_until.get(kind, 0.0) - self.horizon / 2 for kind in self._sources)
+
+            # At least a second between passes so a failing load can't spin, timers are to the second anyway.
+            timeout = max(min(wake_at, default=now + self.horizon) - time.time(), 1.0)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _current(self, kind: str, entry: tuple) -> bool:
+        key, _, _, sequence = entry
+        return self._scheduled.get((kind, key)) == sequence
+
+    async def _fire(self, kind: str, batch: typing.List[tuple]):
+        source = self._sources[kind]
+
+        try:
+            async with self._semaphore:
+                if source.group_by is None:
+                    await source.handler(self.bot, batch[0][1])
+                else:
+                    await source.handler(self.bot, [row for _, row, _, _ in batch])
+        except Exception as e:
+            self.failed[kind] += len(batch)
+            given_up = []
+
+            for entry in filter(lambda entry: self._current(kind, entry), batch):
+                key, row, attempt, _ = entry
+                if attempt < self.max_attempts:
+                    self._push(kind, key, time.time() + self.retry_after, row, attempt + 1)
+                else:
+                    given_up.append(entry)
+
+            keys = ", ".join(str(key) for key, *_ in batch)
+            logger.warning(f"{kind} timer(s) {keys} failed, {len(given_up)} given up: {type(e).__name__} - {e}")
+            batch = given_up
+
+        # Only forget rows that haven't been rescheduled while the handler ran.
+        batch = [entry for entry in batch if self._current(kind, entry)]
+        if not batch:
+            return
+
+        try:
+            await self.bot.queries.executemany(source.remove_query, [key for key, *_ in batch])
+        except Exception as e:
+            logger.error(f"Failed to delete {len(batch)} {kind} timer(s): {type(e).__name__} - {e}")
+        else:
+            self.fired[kind] += len(batch)
+        finally:
+            for entry in batch:
+                if self._current(kind, entry):
+                    del self._scheduled[(kind, entry[0])]
+
+
+async def end_mute(bot, row):
+    guild = bot.get_guild(row["guild_id"])
+    if guild is None:
+        return
+
+    role = guild.get_role(bot.config[guild.id]["mute_role_id"])
+    if role is None:
+        return
+
+    member = guild.get_member(row["member_id"])
+    try:
+        if member is None:
+            member = await guild.fetch_member(row["member_id"])
+
+        await member.remove_roles(role, reason="Mute time is over.")
+    except (discord.NotFound, discord.Forbidden):
+        pass
+
+
+async def end_giveaway(bot, row):
+    bot.giveaway_roles.pop(row["message_id"], None)
+
+    channel = bot.get_channel(row["channel_id"])
+    if channel is None:
+        return
+
+    # Drawn here rather than in a listener so a failure is retried instead of losing the giveaway.
+    try:
+        message = await channel.fetch_message(row["message_id"])
+    except (discord.NotFound, discord.Forbidden):
+        return
+
+    users = []
+    if message.reactions:
+        users = [user async for user in message.reactions[0].users().filter(lambda u: not u.bot)]
+
+    embed = bot.embed()
+    if not users:
+        embed.description = f"No one entered into [this]({message.jump_url}) giveaway :("
+        return await channel.send(embed=embed)
+
+    winner = random.choice(users)
+    embed.description = f"The winner of [this]({message.jump_url}) giveaway is: {winner.mention}"
+    await channel.send(f"Congratulations to {winner.mention}", embed=embed)
+
+
+async def end_temp_bans(bot, rows):
+    guild = bot.get_guild(rows[0]["guild_id"])
+    if guild is None:
+        return
+
+    for row in rows:
+        try:
+            await guild.unban(discord.Object(id=row["user_id"]), reason="Temporary ban is over.")
+        except (discord.NotFound, discord.Forbidden):
+            pass
@@ -16,7 +16,6 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-import asyncio
 import datetime
 import random
 import re
@@ -26,9 +25,7 @@ import Levenshtein
 import aiohttp
 import dateparser
 import humanize
-import asyncpg
 import discord
-import pytz
 import toml
 import twemoji_parser
 import unicodedata
@@ -79,6 +76,9 @@ class Settings:
     def __getitem__(self, key: str) -> typing.Union[dict, str]:
         return self._settings[key]
 
+    def get(self, key: str, default=None) -> typing.Union[dict, str, None]:
+        return self._settings.get(key, default)
+
 
 CHARACTER_VALUES = {
     200: "🫂",
@@ -303,42 +303,6 @@ class NotTagOwner(commands.CheckFailure):
     pass
 
 
-async def set_giveaway(bot, end_time, channel_id, message_id):
-    async def giveaway_task(bot, end_time, channel_id, message_id):
-        now = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
-        seconds_until = (end_time - now).total_seconds()
-        await asyncio.sleep(seconds_until)
-
-        try:
-            await bot.pool.execute("DELETE FROM giveaways WHERE message_id = $1",
-                                   message_id)
-            channel = await bot.fetch_channel(channel_id)
-            message = discord.PartialMessage(channel=channel, id=message_id)
-            bot.dispatch("giveaway_end", message)
-        except asyncpg.PostgresError:
-            pass
-
-    bot.loop.create_task(giveaway_task(bot, end_time, channel_id, message_id))
-
-
-async def set_mute(bot, guild_id, user_id, _time):
-    async def mute_task(bot, guild_id, user_id, _time):
-        await asyncio.sleep(_time)
-
-        try:
-            await bot.pool.execute("DELETE FROM guild_mutes WHERE member_id = $1 AND guild_id = $2",
-                                   user_id, guild_id)
-            guild = await bot.fetch_guild(guild_id)
-            member = await guild.fetch_member(user_id)
-            mute_role = guild.get_role(bot.config[guild_id]["mute_role_id"])
-
-            await member.remove_roles(mute_role, reason="Mute time is over.")
-        except asyncpg.PostgresError:
-            pass
-
-    bot.loop.create_task(mute_task(bot, guild_id, user_id, _time))
-
-
 def log(*args):
     print(f"{time.strftime('%I:%M:%S')} | {' '.join(map(str, args))}")
 